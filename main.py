@@ -1,10 +1,13 @@
 import os
 import sys
+import asyncio
+import threading
 import time
-import yaml
 import dotenv
 import keyboard
 
+from concurrent.futures import ThreadPoolExecutor
+
 from rich import print
 
 dotenv.load_dotenv(
@@ -14,137 +17,573 @@ dotenv.load_dotenv(
 
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 
-from managers import *
+from managers import ConfigWatcher, ConversationPipeline, Settings, SpeculativeResponder, StartupProfile, TTSCache, create_provider, read_config, tracing
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.yaml')
 
 class AIChatApp:
-    def __init__(self):
-        """Initialize the AI Chat Application."""
+    def __init__(self, config=None):
+        """Initialize the AI Chat Application, from config.yaml unless a config is given."""
         print("[yellow]Initializing AI Chat App...[/yellow]")
-        self.config = load_config()
-        self.audio_manager = PygameAudioManager()
-        self.google_tts_manager = GoogleTTSManager(language=self.config['tts']['language'])
-        self.speech_to_text = SpeechToTextManager(self.config['stt']['model'], self.config['stt']['language'])
+        # Slow, independent managers load concurrently; whoever needs one first waits for it
+        self.startup = StartupProfile()
+        with self.startup.measure('config'):
+            self.config = config or load_config()
+            # Compiled and validated once; the turn loop reads these instead of walking the dict
+            self.settings = Settings(self.config)
+
+        # Per-turn spans go to a rotating JSONL file and Prometheus metrics; off, tracing calls do nothing
+        tracing_config = self.config.get('tracing', {})
+        if tracing_config.get('enabled', False):
+            tracing.configure(
+                jsonl_path=tracing_config.get('jsonl_path'),
+                max_bytes=tracing_config.get('max_bytes', 10 * 1024 * 1024),
+                backup_count=tracing_config.get('backup_count', 5),
+                prometheus_path=tracing_config.get('prometheus_path'),
+                metrics_port=tracing_config.get('metrics_port'),
+                metrics_host=tracing_config.get('metrics_host', '127.0.0.1')
+            )
+
+        with self.startup.measure('audio'):
+            self.progressive_tts = self.config['tts'].get('progressive', False)
+            self.audio_manager = create_provider(self.config, 'audio')
+            # The jingle plays while everything else is still loading
+            self.start_jingle_path = os.path.join(os.path.dirname(__file__), 'audio', 'start.mp3')
+            self.audio_manager.load_audio(self.start_jingle_path)
+            self.start_jingle = self.audio_manager.play_audio(self.start_jingle_path)
+
+        # Filler clips cover the wait when a reply is slow to start
+        self.filler = None
+        if self.settings.fillers.enabled:
+            with self.startup.measure('fillers'):
+                filler_directory = os.path.join(os.path.dirname(__file__), self.settings.fillers.directory)
+                if not hasattr(self.audio_manager, 'load_sound_bank'):
+                    print("[yellow]The audio provider has no sound bank, fillers are disabled.[/yellow]")
+                elif not os.path.isdir(filler_directory):
+                    print(f"[yellow]Filler directory {filler_directory} not found, fillers are disabled.[/yellow]")
+                else:
+                    from managers import LatencyFiller
+                    self.audio_manager.load_sound_bank(filler_directory, self.settings.fillers.max_bytes)
+                    self.filler = LatencyFiller.from_config(self.config, self.audio_manager)
+
+        with self.startup.measure('tts_cache'):
+            cache_config = self.config['tts'].get('cache', {})
+            self.tts_cache = TTSCache(max_bytes=cache_config.get('max_bytes', 50 * 1024 * 1024)) if cache_config.get('enabled', False) else None
+
+        # Providers are picked by name in config.yaml and imported in the background on first use
+        self.startup.start('speech_to_text', create_provider, self.config, 'stt')
+        # Set when a config edit replaced the speech-to-text model; the old one is shut down once it's idle
+        self._speech_to_text = None
+        self.retired_speech_to_text = []
+        self.startup.start('tts', create_provider, self.config, 'tts', cache=self.tts_cache)
+        self.startup.start('fallback_tts', create_provider, self.config, 'tts_fallback', cache=self.tts_cache)
+        self.startup.start('ai', create_provider, self.config, 'llm')
+        # Races the TTS providers under a deadline; built on first use, once both have loaded
+        self.tts_dispatch_enabled = self.config['tts'].get('dispatch', {}).get('enabled', False)
+        self._tts_dispatcher = None
+        self.tts_dispatcher_lock = threading.Lock()
+
         self.obs_enabled = self.config['obs']['enabled']
         if self.obs_enabled:
-            # Determine password only once, not via lambda
-            obs_password = os.getenv("OBS_WEBSOCKET_PASSWORD") if os.getenv("USE_OBS_WEBSOCKET_PASSWORD", "0") == "1" else None
-            self.obs_websockets_manager = OBSWebsocketsManager(
-                host=os.getenv("OBS_WEBSOCKET_URL"),
-                port=int(os.getenv("OBS_WEBSOCKET_PORT", 4455)),
-                password=obs_password
-            )
+            with self.startup.measure('obs'):
+                # Only imported when OBS is enabled
+                from managers import OBSCommandDispatcher
+                # Connects (and reconnects) in the background, so a slow or restarted OBS never blocks us
+                self.obs_dispatcher = OBSCommandDispatcher(
+                    connect=lambda: create_provider(self.config, 'scene')
+                )
         else:
             print("[yellow]OBS WebSocket is disabled in the self.configuration.[/yellow]")
-        self.polly_tts_manager = PollyTTSManager(
-            aws_access_key_id=os.getenv("AMAZON_POLLY_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AMAZON_POLLY_SECRET_ACCESS_KEY"),
-            region_name=self.config['tts']['region'],
-            engine=self.config['tts']['engine']
-        )
-        self.gemini_ai_manager = GeminiAIManager(
-            api_key=os.getenv("GEMINI_API_KEY"),
-            model=self.config['ai']['model'],
-            system_instruction=self.config['ai']['system_instruction']
-        )
 
-        print("[green]AI Chat App initialized successfully.[/green]")
+        # Lip-sync animates the head from the audio itself, replacing the OBS Move plugin
+        self.lip_sync = None
+        lip_sync_config = self.config['obs'].get('lip_sync', {})
+        if self.obs_enabled and lip_sync_config.get('enabled', False):
+            from managers import LipSyncDriver
+            self.lip_sync = LipSyncDriver(
+                self.obs_dispatcher,
+                scene_name=lip_sync_config['scene_name'],
+                source_name=lip_sync_config['source_name'],
+                fps=lip_sync_config.get('fps', 20),
+                mode=lip_sync_config.get('mode', 'rms'),
+                full_scale=lip_sync_config.get('full_scale', 0.25),
+                scale=lip_sync_config.get('scale', 0.1),
+                bounce=lip_sync_config.get('bounce', 10.0)
+            )
+
+        # Barge-in lets the record key (or, optionally, the user's voice) cut the current reply short
+        self.record_key = self.settings.barge_in.key
+        self.current_playback = None
+        self.responding = False
+        self.barged_in = False
+        self.pipeline = None
+        if self.settings.barge_in.enabled:
+            keyboard.on_press_key(self.record_key, lambda event: self.barge_in())
+
+        # Speculation starts the reply from the stable partial transcript while the user finishes talking
+        self.speculator = None
+        speculation_config = self.config['stt'].get('speculation', {})
+        if speculation_config.get('enabled', False):
+            self.speculator = SpeculativeResponder(
+                generate=lambda text: self.ai_manager.generate_response_stream(
+                    text,
+                    min_chunk_length=self.settings.ai.min_chunk_length,
+                    commit=False
+                ),
+                stable_window=speculation_config.get('stable_window', 0.3),
+                min_words=speculation_config.get('min_words', 2),
+                get_context=lambda: self.ai_manager.generation
+            )
+
+        # Edits to config.yaml are applied while running, rebuilding only what they touch
+        self.config_watcher = None
+        reload_config = self.config.get('config_reload', {})
+        if config is None and reload_config.get('enabled', False):
+            self.config_watcher = ConfigWatcher(CONFIG_PATH, self.settings, self.apply_settings, reload_config.get('interval', 1.0))
+            self.config_watcher.start()
+
+        self.startup.close()
+        print("[green]AI Chat App initialized, remaining components are loading in the background.[/green]")
+
+    @property
+    def speech_to_text(self):
+        return self._speech_to_text or self.startup.get('speech_to_text')
+
+    @property
+    def tts_manager(self):
+        return self.startup.get('tts')
+
+    @property
+    def fallback_tts_manager(self):
+        return self.startup.get('fallback_tts')
+
+    @property
+    def ai_manager(self):
+        return self.startup.get('ai')
+
+    @property
+    def tts_dispatcher(self):
+        if not self.tts_dispatch_enabled:
+            return None
+        with self.tts_dispatcher_lock:
+            if self._tts_dispatcher is None:
+                from managers import TTSDispatcher
+                providers = [(self.config['providers']['tts'], self.tts_manager)]
+                if self.fallback_tts_manager is not None:
+                    providers.append((self.config['providers']['tts_fallback'], self.fallback_tts_manager))
+                self._tts_dispatcher = TTSDispatcher.from_config(self.config, providers)
+        return self._tts_dispatcher
+
+    def apply_settings(self, old, new, changed):
+        """Apply an edit to config.yaml in place, rebuilding only the components whose settings changed."""
+        def touches(*prefixes):
+            return [path for path in changed if any(path == prefix or path.startswith(prefix + '.') for prefix in prefixes)]
+
+        # Read on every turn, so swapping self.settings is all it takes
+        live = touches('ai.stream', 'ai.min_chunk_length', 'tts.voice', 'stt.continuous', 'obs.image', 'obs.head', 'obs.filter',
+                       'barge_in.fade_ms', 'barge_in.on_speech')
+        rebuilt_stt = touches('stt.model', 'stt.language', 'stt.realtime_model', 'stt.post_speech_silence_duration')
+        in_place = touches('ai.system_instruction', 'tts.engine', 'fillers.delay', 'fillers.fade_ms')
+        restart = [path for path in changed if path not in live + rebuilt_stt + in_place]
+
+        # The slow, fallible rebuild goes first: if it fails, nothing has been applied yet
+        if rebuilt_stt:
+            print(f"[yellow]Loading the {new.stt.model} speech-to-text model...[/yellow]")
+            speech_to_text = create_provider(new.raw, 'stt')
+            try:
+                previous = self.speech_to_text
+            except Exception:
+                # The model that failed to load is the one being replaced
+                previous = None
+            self._speech_to_text = speech_to_text
+            if previous:
+                # It may still be listening; listen_once shuts it down before the next recording
+                self.retired_speech_to_text.append(previous)
+
+        if 'ai.system_instruction' in in_place:
+            if hasattr(self.ai_manager, 'set_system_instruction'):
+                self.ai_manager.set_system_instruction(new.ai.system_instruction)
+            else:
+                restart.append('ai.system_instruction')
+        if 'tts.engine' in in_place:
+            for manager in (self.tts_manager, self.fallback_tts_manager):
+                if hasattr(manager, 'engine'):
+                    manager.engine = new.tts.engine
+        if self.filler:
+            self.filler.delay = new.fillers.delay
+            self.filler.fade_ms = new.fillers.fade_ms
+
+        self.settings = new
+        applied = [path for path in changed if path not in restart]
+        if applied:
+            print(f"[green]Applied config.yaml changes: {', '.join(applied)}[/green]")
+        if restart:
+            print(f"[yellow]These config.yaml changes take effect after a restart: {', '.join(restart)}[/yellow]")
+
+    def shutdown_retired_speech_to_text(self):
+        """Shut down speech-to-text models replaced by a config edit."""
+        while self.retired_speech_to_text:
+            self.retired_speech_to_text.pop().shutdown()
+
+    def wait_for_start_jingle(self):
+        """Let the start jingle finish so the microphone doesn't pick it up, then free it."""
+        if self.start_jingle is None:
+            return
+        self.start_jingle.wait()
+        self.audio_manager.unload_audio(self.start_jingle_path, remove=False)
+        self.start_jingle = None
+
+    def barge_in(self):
+        """Cut the reply that is currently playing short so the user can talk."""
+        responding = self.pipeline.current_turn is not None if self.pipeline else self.responding
+        if not responding or self.barged_in:
+            return
+
+        print("[yellow]Barge-in: cutting the response short...[/yellow]")
+        self.barged_in = True
+        if self.filler:
+            self.filler.cut()
+        if self.pipeline:
+            self.pipeline.interrupt(self.settings.barge_in.fade_ms)
+            return
+        playback = self.current_playback
+        if playback:
+            playback.fade(self.settings.barge_in.fade_ms)
+
+    def start_playback_tracking(self, playback):
+        """Remember the reply's playback so barge-in can stop it."""
+        self.current_playback = playback
+        if self.filler:
+            # The reply takes over from the filler
+            self.filler.cut()
+        tracing.mark('playback.start')
+        if self.lip_sync:
+            self.lip_sync.start(playback)
+        if self.barged_in:
+            playback.stop()
+        elif self.pipeline and self.settings.barge_in.enabled and self.settings.barge_in.on_speech:
+            self.speech_to_text.listen_for_speech(self.barge_in)
+
+    def follow_playback(self, playback):
+        """Move barge-in and lip-sync on to a reply's new Playback, after its queue ran dry waiting on the next chunk."""
+        self.current_playback = playback
+        if self.lip_sync:
+            self.lip_sync.start(playback)
+        if self.barged_in:
+            playback.stop()
+
+    def synthesize_speech(self, text):
+        """Convert text to in-memory MP3 audio, falling back to the fallback TTS provider."""
+        if self.tts_dispatcher:
+            return self.tts_dispatcher.text_to_speech(text, None, True, self.settings.tts.voice, 'mp3')
+        try:
+            return self.tts_manager.text_to_speech(text, None, True, self.settings.tts.voice, 'mp3')
+        except Exception as e:
+            if self.fallback_tts_manager is None:
+                raise
+            tracing.count('tts.fallback')
+            tracing.annotate('tts.fallback_reason', str(e))
+            print(f"[red]Error with TTS: {e}[/red]")
+            print("[yellow]Falling back to the fallback TTS provider...[/yellow]")
+            return self.fallback_tts_manager.text_to_speech(text, None)
+
+    def queue_speech(self, text, audio_id, on_queued=None):
+        """Synthesize text and queue it for playback, returning the ID to unload afterwards (if any)."""
+        # Only providers that can stream raw PCM (Polly) support progressive playback
+        if self.progressive_tts and hasattr(self.tts_manager, 'stream_pcm'):
+            queued = False
+            try:
+                for pcm in self.tts_manager.stream_pcm(text, True, self.settings.tts.voice, self.audio_manager.frequency):
+                    if self.barged_in:
+                        break
+                    # Lip-sync takes each chunk's envelope from its Sound once it starts playing
+                    playback = self.audio_manager.queue_pcm(pcm)
+                    queued = True
+                    if on_queued:
+                        # Every chunk, as a slow download can let the queue run dry and start a new Playback
+                        on_queued(playback)
+                return None
+            except Exception as e:
+                # Once part of the clip is playing, falling back would repeat it
+                if queued:
+                    raise
+                print(f"[red]Error with progressive TTS: {e}[/red]")
+
+        audio = self.synthesize_speech(text)
+        sound = self.audio_manager.load_audio(audio, audio_id)
+        if self.barged_in:
+            return audio_id
+        if self.lip_sync:
+            self.lip_sync.add_sound(sound)
+        playback = self.audio_manager.queue_audio(audio_id)
+        if on_queued:
+            on_queued(playback)
+        return audio_id
+
+    def set_talking(self, talking):
+        """Show or hide the OBS sources and filters that animate the AI while it speaks."""
+        if not self.obs_enabled:
+            return
+
+        # One snapshot, so a config reload can't mix old and new targets in a batch
+        targets = self.settings.obs
+        # Fire and forget: the dispatcher sends everything submitted here as one batch
+        with self.obs_dispatcher.hold() as obs:
+            obs.set_source_visibility(
+                scene_name=targets.image.scene_name,
+                source_name=targets.image.source_name,
+                source_visible=talking
+            )
+
+            if targets.head.enabled:
+                obs.set_source_visibility(
+                    scene_name=targets.head.scene_name,
+                    source_name=targets.head.source_name,
+                    source_visible=talking
+                )
+
+            # Lip-sync moves the head itself, so the Move filter would fight it over the same source
+            if targets.filter.enabled and not self.lip_sync:
+                obs.set_filter_visibility(
+                    source_name=targets.filter.source_name,
+                    filter_name=targets.filter.filter_name,
+                    filter_enabled=talking
+                )
+
+    def generate_reply(self, user_input):
+        """Yield the reply in chunks, picking up the speculative reply if it was started from the same words."""
+        speculation = self.speculator.claim(user_input) if self.speculator else None
+        if speculation is None:
+            yield from self.ai_manager.generate_response_stream(
+                user_input,
+                min_chunk_length=self.settings.ai.min_chunk_length
+            )
+            return
+
+        print("[dim]Using the reply that was started while you were talking.[/dim]")
+        tracing.annotate('speculative', True)
+        try:
+            yield from speculation
+        finally:
+            # Only has an effect if the reply was abandoned part way (e.g. barge-in)
+            speculation.cancel()
+        if speculation.result:
+            self.ai_manager.record_turn(user_input, *speculation.result)
+
+    def respond(self, user_input):
+        """Generate the full response, then synthesize and play it in one piece."""
+        if self.speculator:
+            response = ' '.join(self.generate_reply(user_input))
+        else:
+            response = self.ai_manager.generate_response(user_input)
+        print(f"\n[blue]AI Response: {response}[/blue]")
+        audio = self.synthesize_speech(response)
+
+        sound = self.audio_manager.load_audio(audio, 'response')
+        if self.lip_sync:
+            self.lip_sync.add_sound(sound)
+
+        print("[yellow]Playing audio response...[/yellow]")
+        self.start_playback_tracking(self.audio_manager.play_audio('response'))
+        self.set_talking(True)
+
+        self.current_playback.wait()
+
+        self.set_talking(False)
+        print("[green]AI response played back.[/green]")
+        self.audio_manager.unload_audio('response')
+
+    def respond_streaming(self, user_input):
+        """Stream the response and start speaking each chunk while later tokens are still arriving."""
+        turn_start = time.perf_counter()
+        first_audio_at = []
+        audio_ids = []
 
-        self.audio_manager.load_audio(os.path.join(os.path.dirname(__file__), 'audio', 'start.mp3'))
-        self.audio_manager.play_audio(os.path.join(os.path.dirname(__file__), 'audio', 'start.mp3'))
-        time.sleep(self.audio_manager.get_audio_length(os.path.join(os.path.dirname(__file__), 'audio', 'start.mp3')))
-        self.audio_manager.unload_audio(os.path.join(os.path.dirname(__file__), 'audio', 'start.mp3'), remove=False)
+        def on_queued(playback):
+            if not first_audio_at:
+                first_audio_at.append(time.perf_counter())
+                self.start_playback_tracking(playback)
+                self.set_talking(True)
+            elif playback is not self.current_playback:
+                self.follow_playback(playback)
+
+        def speak(chunk):
+            if self.barged_in:
+                return
+            audio_id = self.queue_speech(chunk, f'response-{len(audio_ids)}', on_queued)
+            audio_ids.append(audio_id)
+
+        # A single worker keeps the chunks synthesized and queued in reply order
+        response_parts = []
+        with ThreadPoolExecutor(max_workers=1) as tts_executor:
+            futures = []
+            for chunk in self.generate_reply(user_input):
+                if self.barged_in:
+                    # Stop reading the stream, the interrupted turn isn't added to the chat history
+                    break
+                response_parts.append(chunk)
+                futures.append(tts_executor.submit(tracing.bind(speak), chunk))
+            for future in futures:
+                future.result()
+
+        print(f"\n[blue]AI Response: {' '.join(response_parts)}[/blue]")
+        if self.barged_in:
+            self.audio_manager.stop_queue()
+        self.audio_manager.wait_for_queue()
+        turn_end = time.perf_counter()
+
+        self.set_talking(False)
+        print("[green]AI response played back.[/green]")
+        if first_audio_at:
+            print(f"[dim]Time to first audio: {first_audio_at[0] - turn_start:.2f}s, total turn: {turn_end - turn_start:.2f}s[/dim]")
+
+        for audio_id in audio_ids:
+            if audio_id:
+                self.audio_manager.unload_audio(audio_id)
+
+    def listen_once(self):
+        """Wait for the record key (unless the user just barged in) and transcribe what they say."""
+        self.shutdown_retired_speech_to_text()
+        # Only the first call can block here, while the model is still loading
+        speech_to_text = self.speech_to_text
+        self.wait_for_start_jingle()
+        if self.speculator:
+            speech_to_text.on_partial = self.speculator.on_partial
+        # A turn is traced from the moment the recording stops
+        turns = []
+        speech_to_text.on_recording_stop = lambda: turns.append(tracing.begin_turn())
+        if self.barged_in:
+            # The user already interrupted, so go straight to recording
+            self.barged_in = False
+        elif not self.settings.stt.continuous and getattr(speech_to_text, 'push_to_talk', True):
+            # Without hands-free mode, wait for the record key (chat input never needs it)
+            print(f"\n[green]Press {self.record_key.upper()} to start recording...[/green]")
+            keyboard.wait(self.record_key)  # wait for the record key press
+        print("[green]--- Ready for input ---[/green]")
+        user_input = speech_to_text.process_once()
+        # The recorder may stop on a thread of its own, so carry its turn over to this one
+        tracing.set_turn(turns[-1] if turns else None)
+        tracing.mark('stt.transcribed')
+
+        if user_input:
+            print(f"\n[blue]You said: {user_input}[/blue]\n")
+        else:
+            print("[red]No clear speech detected. Please try speaking again...[/red]")
+            tracing.end_turn(result='no_speech')
+            if self.speculator:
+                self.speculator.reset()
+        return user_input
+
+    def handle_turn(self, user_input):
+        """Answer one transcribed turn and play the reply, returning once playback has ended."""
+        self.responding = True
+        if self.filler:
+            self.filler.arm()
+        if self.settings.barge_in.enabled and self.settings.barge_in.on_speech:
+            self.speech_to_text.listen_for_speech(self.barge_in)
+        try:
+            if self.settings.ai.stream:
+                self.respond_streaming(user_input)
+            else:
+                self.respond(user_input)
+        finally:
+            if self.filler:
+                self.filler.cut()
+            tracing.mark('playback.end')
+            tracing.end_turn(interrupted=self.barged_in)
+            # Playback has actually ended here, so recording can re-arm right away
+            self.responding = False
+            self.current_playback = None
+            self.speech_to_text.stop_listening_for_speech()
+
+    async def run_pipeline(self):
+        """Run the conversation as overlapping asyncio stages instead of one serial loop."""
+        pipeline_config = self.config.get('pipeline', {})
+        self.pipeline = ConversationPipeline(
+            listen=self.listen_once,
+            generate=self.generate_reply,
+            synthesize=self.synthesize_speech,
+            audio_manager=self.audio_manager,
+            set_talking=self.set_talking,
+            on_playback_start=self.start_playback_tracking,
+            on_playback_resume=self.follow_playback,
+            on_audio_queued=self.lip_sync.add_sound if self.lip_sync else None,
+            on_turn_start=self.filler.arm if self.filler else None,
+            on_turn_end=self.filler.cut if self.filler else None,
+            queue_size=pipeline_config.get('queue_size', 2),
+            overlap_listening=pipeline_config.get('overlap_listening', False)
+        )
+        await self.pipeline.run()
 
     def begin_conversation(self):
         print("[yellow]Starting conversation with AI...[/yellow]")
         try:
+            if self.config.get('pipeline', {}).get('mode', 'serial') == 'async':
+                asyncio.run(self.run_pipeline())
+                return
+
             while True:
-                print("\n[green]Press F4 to start recording...[/green]")
-                keyboard.wait('f4')  # wait for F4 key press
-                print("[green]--- Ready for input ---[/green]")
-                user_input = self.speech_to_text.process_once()
-                
+                user_input = self.listen_once()
                 if user_input:
-                    print(f"\n[blue]You said: {user_input}[/blue]\n")
-                    response = self.gemini_ai_manager.generate_response(user_input)
-                    print(f"\n[blue]AI Response: {response}[/blue]")
-                    try:
-                        file_path = self.polly_tts_manager.text_to_speech(response, None, True, self.config['tts']['voice'], 'mp3')
-                    except Exception as e:
-                        print(f"[red]Error with Polly TTS: {e}[/red]")
-                        print("[yellow]Falling back to Google TTS...[/yellow]")
-                        file_path = self.google_tts_manager.text_to_speech(response, None)
-                    
-                    self.audio_manager.load_audio(file_path)
-
-                    print(f"[yellow]Playing audio response from: audio/{os.path.basename(file_path) if file_path else 'unknown'}[/yellow]")
-                    self.audio_manager.play_audio(file_path)
-
-                    if self.obs_enabled:
-                        self.obs_websockets_manager.set_source_visibility(
-                            scene_name=self.config['obs']['image']['scene_name'],
-                            source_name=self.config['obs']['image']['source_name'],
-                            source_visible=True
-                        )
-
-                        if self.config['obs']['head']['enabled']:
-                            self.obs_websockets_manager.set_source_visibility(
-                                scene_name=self.config['obs']['head']['scene_name'],
-                                source_name=self.config['obs']['head']['source_name'],
-                                source_visible=True
-                            )
-
-                        self.obs_websockets_manager.set_filter_visibility(
-                            source_name=self.config['obs']['filter']['source_name'],
-                            filter_name=self.config['obs']['filter']['filter_name'],
-                            filter_enabled=True
-                        )
-                    
-                    time.sleep(self.audio_manager.get_audio_length(file_path))
-
-                    if self.obs_enabled:
-                        self.obs_websockets_manager.set_source_visibility(
-                            scene_name=self.config['obs']['image']['scene_name'],
-                            source_name=self.config['obs']['image']['source_name'],
-                            source_visible=False
-                        )
-
-                        if self.config['obs']['head']['enabled']:
-                            self.obs_websockets_manager.set_source_visibility(
-                                scene_name=self.config['obs']['head']['scene_name'],
-                                source_name=self.config['obs']['head']['source_name'],
-                                source_visible=False
-                            )
-
-                        if self.config['obs']['filter']['enabled']:
-                            self.obs_websockets_manager.set_filter_visibility(
-                                source_name=self.config['obs']['filter']['source_name'],
-                                filter_name=self.config['obs']['filter']['filter_name'],
-                                filter_enabled=False
-                            )
-
-                    print("[green]AI response played back.[/green]")
-                    self.audio_manager.unload_audio(file_path)
-                else:
-                    print("[red]No clear speech detected. Please try speaking again...[/red]")
+                    self.handle_turn(user_input)
 
         except KeyboardInterrupt:
             print("\n[yellow]Shutting down...[/yellow]")
-            self.speech_to_text.shutdown()
+            self.shutdown()
         except Exception as e:
             print(f"[red]Error: {e}[/red]")
+            self.shutdown()
+
+    def shutdown(self):
+        """Release the recorder and persist anything worth keeping."""
+        if self.config_watcher:
+            self.config_watcher.stop()
+        self.startup.wait_all()
+        self.shutdown_retired_speech_to_text()
+        if self._speech_to_text or 'speech_to_text' not in self.startup.errors:
             self.speech_to_text.shutdown()
+            if hasattr(self.speech_to_text, 'chat_queue'):
+                stats = self.speech_to_text.get_stats()
+                print(f"[dim]Chat: {stats['received']} messages, {stats['queued']} queued, {stats['duplicates']} duplicates, {stats['rate_limited']} rate limited, {stats['evicted']} evicted, {stats['stale']} unanswered, {stats['batches']} replies[/dim]")
+        if 'ai' not in self.startup.errors and hasattr(self.ai_manager, 'shutdown'):
+            # Saves the compacted conversation so the next start resumes it
+            self.ai_manager.shutdown()
+            if hasattr(self.ai_manager, 'get_usage_stats'):
+                stats = self.ai_manager.get_usage_stats()
+                print(f"[dim]Gemini prompts: {stats['prompt_tokens']} tokens in {stats['requests']} requests, {stats['cached_tokens']} served from the context cache[/dim]")
+                for model, model_stats in stats.get('models', {}).items():
+                    print(f"[dim]{model}: {model_stats['requests']} requests, {model_stats['failures']} failed ({model_stats['timeouts']} timed out), breaker {model_stats['state']}[/dim]")
+        if self.obs_enabled:
+            self.obs_dispatcher.stop()
+        if self.pipeline:
+            for name, stats in self.pipeline.get_stats()['queues'].items():
+                print(f"[dim]Pipeline {name} queue: {stats['items']} items, avg wait {stats['avg_wait']:.3f}s, max wait {stats['max_wait']:.3f}s[/dim]")
+        if tracing.get_tracer():
+            for name, stats in tracing.get_tracer().get_stats().items():
+                print(f"[dim]{name}: p50 {stats['p50']:.3f}s, p95 {stats['p95']:.3f}s, p99 {stats['p99']:.3f}s ({stats['count']} samples)[/dim]")
+            tracing.get_tracer().close()
+        if self.speculator:
+            stats = self.speculator.get_stats()
+            print(f"[dim]Speculation: {stats['used']} used, {stats['discarded']} discarded ({stats['stale']} because the conversation moved on) of {stats['started']} started, {stats['head_start']:.2f}s head start in total[/dim]")
+        if self._tts_dispatcher:
+            for name, stats in self._tts_dispatcher.get_stats().items():
+                print(f"[dim]TTS {name}: {stats['successes']}/{stats['requests']} started in time, {stats['wins']} used, {stats['failures']} failed, first byte p50 {stats['p50']:.3f}s p95 {stats['p95']:.3f}s, breaker {stats['state']}[/dim]")
+        if self.filler:
+            stats = self.filler.get_stats()
+            bank_stats = self.audio_manager.sound_bank.get_stats()
+            print(f"[dim]Fillers: {stats['played']} played in {stats['turns']} turns ({stats['cut']} cut off by the reply), {bank_stats['decoded']}/{bank_stats['clips']} clips decoded in {bank_stats['bytes']} bytes, {bank_stats['evictions']} evictions[/dim]")
+        if self.tts_cache:
+            self.tts_cache.save()
+            stats = self.tts_cache.get_stats()
+            print(f"[dim]TTS cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries, {stats['bytes']} bytes[/dim]")
 
 def load_config():
     """Load configuration from YAML file."""
-    yaml_config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
-    if not os.path.exists(yaml_config_path):
-        print(f"config file not found at {yaml_config_path}. Please ensure it exists.")
+    if not os.path.exists(CONFIG_PATH):
+        print(f"config file not found at {CONFIG_PATH}. Please ensure it exists.")
         sys.exit(1)
 
-    with open(yaml_config_path, 'r') as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
-
-    return config
+    return read_config(CONFIG_PATH)
 
 if __name__ == '__main__':
     app = AIChatApp()
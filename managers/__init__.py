@@ -1,8 +1,44 @@
-from .realtime_stt_manager import SpeechToTextManager
-from .gemini_ai_manager import GeminiAIManager
-from .pygame_audio_manager import PygameAudioManager
-from .google_tts_manager import GoogleTTSManager
-from .polly_tts_manager import PollyTTSManager
-from .obs_websockets_manager import OBSWebsocketsManager
-
-__all__ = ['SpeechToTextManager', 'GeminiAIManager', 'PygameAudioManager', 'PollyTTSManager', 'GoogleTTSManager', 'OBSWebsocketsManager' ]
\ No newline at end of file
+import importlib
+
+# Exported name -> module defining it. Modules are imported on first access, so
+# e.g. RealtimeSTT (and torch) are only loaded by code that actually transcribes.
+_EXPORTS = {
+    'SpeechToTextManager': '.realtime_stt_manager',
+    'GeminiAIManager': '.gemini_ai_manager',
+    'PygameAudioManager': '.pygame_audio_manager',
+    'PollyTTSManager': '.polly_tts_manager',
+    'GoogleTTSManager': '.google_tts_manager',
+    'OBSWebsocketsManager': '.obs_websockets_manager',
+    'OBSCommandDispatcher': '.obs_command_dispatcher',
+    'TTSCache': '.tts_cache',
+    'TTSDispatcher': '.tts_dispatcher',
+    'ConversationPipeline': '.conversation_pipeline',
+    'ConversationServer': '.conversation_server',
+    'LipSyncDriver': '.lip_sync',
+    'LatencyFiller': '.latency_filler',
+    'StartupProfile': '.startup',
+    'Settings': '.settings',
+    'ConfigWatcher': '.settings',
+    'ConfigError': '.settings',
+    'read_config': '.settings',
+    'SpeculativeResponder': '.speculation',
+    'ChatInputManager': '.chat_input',
+    'ChatQueue': '.chat_input',
+    'IRCChatClient': '.chat_input',
+    'create_provider': '.registry',
+    'get_provider': '.registry',
+    'register_provider': '.registry',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,367 @@
+import heapq
+import os
+import re
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+
+from rich import print
+
+from . import tracing
+from .resilience import backoff_delay
+from .speculation import normalize_transcript
+
+REPEATED_CHARACTER_PATTERN = re.compile(r'(\w)\1+')
+PRIORITY_BADGES = ('broadcaster', 'moderator', 'vip', 'subscriber')
+
+def dedup_key(text):
+    """Reduce a chat message to what makes it different from spam copies of it.
+
+    Casing, punctuation, stretched letters ("sooooo") and repeated words are ignored,
+    so "LOL lol", "lolll!!" and "lol" are all the same message.
+    """
+    words = REPEATED_CHARACTER_PATTERN.sub(r'\1', normalize_transcript(text)).split()
+    key = []
+    for word in words:
+        if not key or key[-1] != word:
+            key.append(word)
+    return ' '.join(key)[:100]
+
+def format_chat_prompt(messages):
+    """Turn a batch of chat messages into one prompt for the AI."""
+    lines = '\n'.join(f"{message.user}: {message.text}" for message in messages)
+    return f"Messages from chat since your last reply:\n{lines}\nAnswer chat in a single reply."
+
+class ChatMessage:
+    __slots__ = ('user', 'text', 'priority', 'received_at')
+
+    def __init__(self, user, text, priority, received_at):
+        self.user = user
+        self.text = text
+        self.priority = priority
+        self.received_at = received_at
+
+class ChatQueue:
+    def __init__(self, max_queued=200, batch_size=5, user_rate=0.1, user_burst=2, dedup_window=30.0, max_length=300, keywords=(),
+                 max_users=10000, max_recent=5000):
+        """Bounded priority queue of chat messages, built to take a flood at constant cost per message.
+
+        offer() drops a message when its user is over user_rate messages per second (with
+        user_burst to spare) or a near-identical one (see dedup_key) was seen in the last
+        dedup_window seconds before, then queues it by priority: mentions of keywords, questions and
+        messages from the broadcaster, moderators, VIPs and subscribers go first. Past
+        max_queued the lowest priority message is dropped. take_batch() returns the best
+        batch_size messages and throws the rest away, so each reply answers fresh chat.
+        The per-user and recent-message tables are capped at max_users and max_recent.
+        """
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.dedup_window = dedup_window
+        self.max_length = max_length
+        self.keywords = tuple(keyword.lower() for keyword in keywords)
+        self.max_users = max_users
+        self.max_recent = max_recent
+
+        self.condition = threading.Condition()
+        self.heap = []  # (priority, sequence, message), lowest priority (and oldest) first
+        self.sequence = 0
+        self.buckets = OrderedDict()  # user -> [tokens, last refill], least recently active first
+        self.recent = OrderedDict()  # dedup key -> when a copy last got through, oldest first
+        self.closed = False
+        self.wakeups = 0
+        self.stats = {'received': 0, 'queued': 0, 'rate_limited': 0, 'duplicates': 0, 'evicted': 0, 'stale': 0, 'batches': 0}
+
+    def offer(self, user, text, tags=None, now=None):
+        """Consider one incoming chat message. Returns whether it was queued."""
+        now = time.monotonic() if now is None else now
+        text = ' '.join(text.split())[:self.max_length]
+        # The text work happens before taking the lock, so a flood doesn't hold up take_batch
+        key = dedup_key(text)
+        priority = self._priority(text, tags)
+        with self.condition:
+            self.stats['received'] += 1
+            if not key:
+                return False
+            if not self._allow(user, now):
+                self.stats['rate_limited'] += 1
+                return False
+
+            seen_at = self.recent.get(key)
+            if seen_at is not None and now - seen_at < self.dedup_window:
+                self.stats['duplicates'] += 1
+                return False
+            # The window runs from the copy that got through, so spam gets one message in per window
+            self.recent.pop(key, None)
+            self.recent[key] = now
+            self._forget(now)
+
+            self.sequence += 1
+            entry = (priority, self.sequence, ChatMessage(user, text, priority, now))
+            if len(self.heap) < self.max_queued:
+                heapq.heappush(self.heap, entry)
+            elif entry[:2] > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, entry)
+                self.stats['evicted'] += 1
+            else:
+                self.stats['evicted'] += 1
+                return False
+            self.stats['queued'] += 1
+            self.condition.notify()
+            return True
+
+    def take_batch(self, timeout=None, linger=0.0):
+        """Wait for chat, give it linger more seconds to pile up, and return the best batch in the order it was sent.
+
+        Returns an empty list if timeout expires, wake() is called or the queue is closed first.
+        """
+        with self.condition:
+            wakeups = self.wakeups
+            self.condition.wait_for(lambda: self.heap or self.closed or self.wakeups != wakeups, timeout)
+            if not self.heap or self.closed or self.wakeups != wakeups:
+                return []
+        if linger:
+            time.sleep(linger)
+        with self.condition:
+            best = heapq.nlargest(self.batch_size, self.heap)
+            self.stats['stale'] += len(self.heap) - len(best)
+            self.stats['batches'] += 1
+            self.heap = []
+        return [message for _, _, message in sorted(best, key=lambda entry: entry[1])]
+
+    def wake(self):
+        """Make a waiting take_batch return empty-handed."""
+        with self.condition:
+            self.wakeups += 1
+            self.condition.notify_all()
+
+    def close(self):
+        """Wake up take_batch for good."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def get_stats(self):
+        with self.condition:
+            stats = dict(self.stats)
+            stats.update(depth=len(self.heap), users=len(self.buckets), recent=len(self.recent))
+        return stats
+
+    def _allow(self, user, now):
+        # Token bucket per user; the least recently active users are forgotten past max_users
+        bucket = self.buckets.pop(user, None)
+        if bucket is None:
+            bucket = [float(self.user_burst), now]
+        else:
+            bucket[0] = min(float(self.user_burst), bucket[0] + (now - bucket[1]) * self.user_rate)
+            bucket[1] = now
+        self.buckets[user] = bucket
+        if len(self.buckets) > self.max_users:
+            self.buckets.popitem(last=False)
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        return True
+
+    def _forget(self, now):
+        # Oldest first, so this stops at the first key still inside the window: amortized O(1)
+        while self.recent:
+            key, seen_at = next(iter(self.recent.items()))
+            if now - seen_at < self.dedup_window and len(self.recent) <= self.max_recent:
+                break
+            self.recent.popitem(last=False)
+
+    def _priority(self, text, tags):
+        lowered = text.lower()
+        priority = 0
+        if any(keyword in lowered for keyword in self.keywords):
+            priority += 2
+        if '?' in text:
+            priority += 1
+        badges = (tags or {}).get('badges') or ''
+        if any(badge.split('/')[0] in PRIORITY_BADGES for badge in badges.split(',')):
+            priority += 1
+        return priority
+
+class IRCChatClient:
+    def __init__(self, host, port, nick, channel, on_message, password=None, tls=False, timeout=300.0):
+        """Read a channel's chat over IRC on a background thread and call on_message(user, text, tags) for each message.
+
+        Works with Twitch chat (IRCv3 tags are requested, and e.g. badges end up in tags) and
+        plain IRC servers. Reconnects with jittered backoff when the connection drops or has
+        been silent for timeout seconds.
+        """
+        self.host = host
+        self.port = port
+        self.nick = nick
+        self.channel = channel if channel.startswith('#') else f'#{channel}'
+        self.on_message = on_message
+        self.password = password
+        self.tls = tls
+        self.timeout = timeout
+        self.sock = None
+        self.stopped = threading.Event()
+        self.connected = threading.Event()
+        self.thread = None
+        self.stats = {'connects': 0, 'messages': 0, 'pings': 0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='irc-chat', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    def _run(self):
+        attempt = 0
+        while not self.stopped.is_set():
+            try:
+                self._session()
+                attempt = 0
+            except (OSError, ssl.SSLError) as e:
+                if self.stopped.is_set():
+                    break
+                print(f"[red]Chat connection to {self.host}:{self.port} lost: {e}[/red]")
+            finally:
+                self.connected.clear()
+            attempt += 1
+            self.stopped.wait(backoff_delay(attempt, base=1.0, cap=30.0))
+
+    def _session(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.tls:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        self.sock = sock
+        try:
+            self._send('CAP REQ :twitch.tv/tags')
+            if self.password:
+                self._send(f'PASS {self.password}')
+            self._send(f'NICK {self.nick}')
+            self._send(f'USER {self.nick} 0 * :{self.nick}')
+            self._send('CAP END')
+            self._send(f'JOIN {self.channel}')
+            self.stats['connects'] += 1
+            reader = sock.makefile('rb')
+            while not self.stopped.is_set():
+                # Bounded, so a malformed flood can't grow a line without limit
+                line = reader.readline(8192)
+                if not line:
+                    raise ConnectionResetError("Server closed the connection")
+                self._handle(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+        finally:
+            self.sock = None
+            sock.close()
+
+    def _send(self, line):
+        self.sock.sendall(f'{line}\r\n'.encode('utf-8'))
+
+    def _handle(self, line):
+        tags = {}
+        if line.startswith('@'):
+            raw_tags, _, line = line[1:].partition(' ')
+            for tag in raw_tags.split(';'):
+                key, _, value = tag.partition('=')
+                tags[key] = value
+        prefix = ''
+        if line.startswith(':'):
+            prefix, _, line = line[1:].partition(' ')
+        command, _, params = line.partition(' ')
+
+        if command == 'PING':
+            self.stats['pings'] += 1
+            self._send(f'PONG {params}')
+        elif command == '001':
+            self.connected.set()
+            print(f"[green]Connected to chat on {self.host}, joining {self.channel}[/green]")
+        elif command == 'PRIVMSG':
+            _, _, text = params.partition(' :')
+            user = tags.get('display-name') or prefix.partition('!')[0]
+            self.stats['messages'] += 1
+            self.on_message(user, text, tags)
+
+class ChatInputManager:
+    # listen_once needn't wait for the record key, chat doesn't talk into a microphone
+    push_to_talk = False
+
+    def __init__(self, chat_queue, client=None, linger=2.0):
+        """Speech-to-text stand-in that answers chat: process_once() returns the next batch as one prompt.
+
+        client (an IRCChatClient feeding chat_queue.offer) is started here and stopped by shutdown().
+        """
+        self.chat_queue = chat_queue
+        self.client = client
+        self.linger = linger
+        self.on_partial = None
+        self.on_recording_stop = None
+        if client:
+            client.start()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the chat input from config.yaml's chat section and CHAT_IRC_PASSWORD."""
+        chat_config = config['chat']
+        chat_queue = ChatQueue(
+            max_queued=chat_config.get('max_queued', 200),
+            batch_size=chat_config.get('batch_size', 5),
+            user_rate=chat_config.get('user_rate', 0.1),
+            user_burst=chat_config.get('user_burst', 2),
+            dedup_window=chat_config.get('dedup_window', 30.0),
+            max_length=chat_config.get('max_length', 300),
+            keywords=chat_config.get('keywords', [])
+        )
+        client = IRCChatClient(
+            chat_config['host'],
+            chat_config.get('port', 6667),
+            chat_config.get('nick', 'justinfan12345'),
+            chat_config['channel'],
+            chat_queue.offer,
+            password=os.getenv("CHAT_IRC_PASSWORD"),
+            tls=chat_config.get('tls', False)
+        )
+        return cls(chat_queue, client, linger=chat_config.get('batch_wait', 2.0))
+
+    def process_once(self):
+        """Wait for chat and return the best messages since the last reply as one prompt (None if aborted)."""
+        print("[yellow]Waiting for chat...[/yellow]")
+        messages = self.chat_queue.take_batch(linger=self.linger)
+        if not messages:
+            return None
+        # Where a voice turn would stop recording, a chat turn starts
+        callback = self.on_recording_stop
+        if callback:
+            callback()
+        tracing.annotate('chat.messages', len(messages))
+        return format_chat_prompt(messages)
+
+    def listen_for_speech(self, on_speech_start):
+        """Chat can't talk over the reply, so there is nothing to listen for."""
+
+    def stop_listening_for_speech(self):
+        pass
+
+    def abort(self):
+        """Make a waiting process_once return without a prompt."""
+        self.chat_queue.wake()
+
+    def get_stats(self):
+        stats = self.chat_queue.get_stats()
+        if self.client:
+            stats.update(self.client.get_stats())
+        return stats
+
+    def shutdown(self):
+        self.chat_queue.close()
+        if self.client:
+            self.client.stop()
@@ -0,0 +1,168 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import errors, types
+from rich import print
+
+from . import tracing
+
+class _Entry:
+    def __init__(self, name, messages, key, tokens, expires_at):
+        self.name = name
+        self.messages = messages  # the history messages the cache holds, in order
+        self.key = key  # (system instruction, summary) it was built with
+        self.tokens = tokens
+        self.expires_at = expires_at
+
+class ContextCache:
+    def __init__(self, manager, ttl=3600, min_tokens=4096, refresh_margin=300, rebuild_ratio=0.5, retry_after=600):
+        """Keep a Gemini cached content object with the system instruction and the stable start of the history.
+
+        Requests then send only the messages after the cached prefix. Caches are built in
+        the background once the prefix reaches min_tokens, rebuilt when the uncached
+        suffix grows past rebuild_ratio of the cached part (or the prefix changes, e.g.
+        after compaction) and have their TTL extended when they are about to expire. If
+        the model can't cache, requests go out uncached; after other failures caching
+        is retried after retry_after seconds.
+        """
+        self.manager = manager
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.refresh_margin = refresh_margin
+        self.rebuild_ratio = rebuild_ratio
+        self.retry_after = retry_after
+
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='context-cache')
+        self.entry = None
+        self.job = None
+        self.supported = True
+        self.retry_at = 0.0
+        self.created = 0
+        self.refreshed = 0
+        self.invalidated = 0
+        self.failures = 0
+
+    def lookup(self):
+        """Return (cache name, number of history messages it holds) if a live cache matches the history, else None."""
+        entry = self.entry
+        if entry is None:
+            return None
+        manager = self.manager
+        # Leave some slack, a cache that expires mid-request fails the request
+        if entry.expires_at - time.time() < 30:
+            return None
+        if entry.key != (manager.system_instruction, manager.summary):
+            return None
+        history = manager.chat_history
+        if len(history) < len(entry.messages) or any(current is not cached for current, cached in zip(history, entry.messages)):
+            return None
+        return entry.name, len(entry.messages)
+
+    def after_turn(self):
+        """Start building or refreshing the cache in the background when it's worth it. Called between turns."""
+        if not self.supported or time.time() < self.retry_at or (self.job and not self.job.done()):
+            return
+        manager = self.manager
+        prefix_tokens = manager.system_instruction_tokens + manager.summary_tokens + manager.context_tokens
+        if prefix_tokens < self.min_tokens:
+            return
+
+        entry = self.entry
+        if self.lookup() is not None:
+            uncached_tokens = sum(manager.token_ledger[len(entry.messages):])
+            if uncached_tokens < entry.tokens * self.rebuild_ratio:
+                if entry.expires_at - time.time() < self.refresh_margin:
+                    self.job = self.executor.submit(self._refresh, entry)
+                return
+
+        # Snapshot on the caller's thread; the history only changes between turns
+        messages = list(manager.chat_history)
+        key = (manager.system_instruction, manager.summary)
+        system_instruction = manager.build_system_instruction()
+        self.job = self.executor.submit(self._create, messages, key, system_instruction, prefix_tokens)
+
+    def invalidate(self, error=None):
+        """Stop using the current cache, e.g. after a request that used it was rejected."""
+        with self.lock:
+            entry, self.entry = self.entry, None
+        if entry is None:
+            return
+        self.invalidated += 1
+        print(f"[dim]Dropping the Gemini context cache{f': {error}' if error else ''}[/dim]")
+        self.executor.submit(self._delete, entry)
+
+    def close(self):
+        """Delete the cache so it stops costing storage, and stop the worker."""
+        with self.lock:
+            entry, self.entry = self.entry, None
+        if entry:
+            self.executor.submit(self._delete, entry)
+        self.executor.shutdown(wait=True)
+
+    def get_stats(self):
+        return {
+            'supported': self.supported,
+            'created': self.created,
+            'refreshed': self.refreshed,
+            'invalidated': self.invalidated,
+            'failures': self.failures,
+            'cached_tokens': self.entry.tokens if self.entry else 0,
+        }
+
+    def _expires_at(self, cache):
+        if cache.expire_time:
+            return cache.expire_time.timestamp()
+        return time.time() + self.ttl
+
+    def _create(self, messages, key, system_instruction, tokens):
+        try:
+            with tracing.span('llm.cache_create', messages=len(messages)):
+                cache = self.manager.client.caches.create(
+                    model=self.manager.model,
+                    config=types.CreateCachedContentConfig(
+                        contents=messages or None,
+                        system_instruction=system_instruction,
+                        ttl=f'{self.ttl}s',
+                        display_name='babagaboosh'
+                    )
+                )
+        except Exception as e:
+            self._failed(e)
+            return
+
+        if cache.usage_metadata and cache.usage_metadata.total_token_count:
+            tokens = cache.usage_metadata.total_token_count
+        with self.lock:
+            old, self.entry = self.entry, _Entry(cache.name, messages, key, tokens, self._expires_at(cache))
+        self.created += 1
+        if old:
+            self._delete(old)
+
+    def _refresh(self, entry):
+        try:
+            cache = self.manager.client.caches.update(name=entry.name, config=types.UpdateCachedContentConfig(ttl=f'{self.ttl}s'))
+        except Exception as e:
+            # Most likely gone already; the next turn builds a new one
+            self.invalidate(e)
+            return
+        entry.expires_at = self._expires_at(cache)
+        self.refreshed += 1
+
+    def _delete(self, entry):
+        try:
+            self.manager.client.caches.delete(name=entry.name)
+        except Exception:
+            # It expires on its own
+            pass
+
+    def _failed(self, error):
+        self.failures += 1
+        message = str(error).lower()
+        if isinstance(error, errors.ClientError) and ('not supported' in message or 'not found for api version' in message):
+            self.supported = False
+            print(f"[yellow]Context caching isn't available for {self.manager.model}, sending the full prompt instead.[/yellow]")
+            return
+        self.retry_at = time.time() + self.retry_after
+        print(f"[yellow]Warning: creating the Gemini context cache failed, retrying in {self.retry_after}s: {error}[/yellow]")
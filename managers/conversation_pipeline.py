@@ -0,0 +1,287 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rich import print
+
+from . import tracing
+
+class StageQueue:
+    def __init__(self, name, maxsize):
+        """Bounded queue between two pipeline stages that records how long items wait in it."""
+        self.name = name
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.items = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def put(self, item):
+        await self.queue.put((time.perf_counter(), item))
+
+    async def get(self):
+        queued_at, item = await self.queue.get()
+        wait = time.perf_counter() - queued_at
+        self.items += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return item
+
+    def drain(self):
+        """Throw away everything still waiting in the queue."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def get_stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'maxsize': self.queue.maxsize,
+            'items': self.items,
+            'avg_wait': self.total_wait / self.items if self.items else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+class ConversationPipeline:
+    def __init__(self, listen, generate, synthesize, audio_manager, set_talking=None, on_playback_start=None, on_playback_resume=None, on_audio_queued=None,
+                 on_turn_start=None, on_turn_end=None,
+                 queue_size=2, overlap_listening=False):
+        """Run listening, generation, synthesis, playback and OBS updates as overlapping asyncio stages.
+
+        listen() blocks until the user said something and returns the text (or None),
+        generate(text) yields the response in chunks, synthesize(text) returns audio bytes
+        and set_talking(bool) updates the scene. on_playback_start(playback) gets the turn's
+        Playback once its first clip is queued, and on_playback_resume(playback) the new one
+        if the queue ran dry waiting on a later clip. on_audio_queued(sound) sees every clip in
+        playback order, on_turn_start() and on_turn_end() bracket each turn. Blocking calls
+        run in executors.
+        """
+        self.listen = listen
+        self.generate = generate
+        self.synthesize = synthesize
+        self.audio_manager = audio_manager
+        self.set_talking = set_talking
+        self.on_playback_start = on_playback_start
+        self.on_playback_resume = on_playback_resume
+        self.on_audio_queued = on_audio_queued
+        self.on_turn_start = on_turn_start
+        self.on_turn_end = on_turn_end
+        self.queue_size = queue_size
+        self.overlap_listening = overlap_listening
+
+        # One worker per executor keeps each stage's work in order
+        self.llm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-llm')
+        self.tts_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-tts')
+        self.obs_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-obs')
+
+        self.loop = None
+        self.current_turn = None
+        self.interrupted = False
+        self.turn_number = 0
+        self.audio_ids = []
+        self.last_turn = {}
+
+    async def run(self):
+        """Run the conversation until cancelled."""
+        self.loop = asyncio.get_running_loop()
+        self.inputs = StageQueue('input', 1)
+        self.text_chunks = StageQueue('tts', self.queue_size)
+        self.audio_chunks = StageQueue('playback', self.queue_size)
+        self.ready_to_listen = asyncio.Event()
+        self.ready_to_listen.set()
+
+        listener = asyncio.create_task(self._listen_stage())
+        try:
+            while True:
+                user_input, trace = await self.inputs.get()
+                self.current_turn = asyncio.create_task(self._run_turn(user_input, trace))
+                try:
+                    await self.current_turn
+                except asyncio.CancelledError:
+                    if not self.interrupted:
+                        raise
+                    print("[yellow]Response interrupted.[/yellow]")
+                except Exception as e:
+                    print(f"[red]Error during turn: {e}[/red]")
+                finally:
+                    self.interrupted = False
+                    self.current_turn = None
+                    self.ready_to_listen.set()
+        finally:
+            listener.cancel()
+            for executor in (self.llm_executor, self.tts_executor, self.obs_executor):
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def interrupt(self, fade_ms=150):
+        """Cut the current turn short. Safe to call from any thread; returns whether a turn was running."""
+        if self.loop is None or self.current_turn is None:
+            return False
+        self.loop.call_soon_threadsafe(self._interrupt, fade_ms)
+        return True
+
+    def _interrupt(self, fade_ms):
+        if self.current_turn is None or self.current_turn.done():
+            return
+        self.interrupted = True
+        self.audio_manager.fade_queue(fade_ms)
+        self.current_turn.cancel()
+
+    def get_stats(self):
+        """Get per-stage queue depths and wait times, plus the timings of the last turn."""
+        return {
+            'queues': {queue.name: queue.get_stats() for queue in (self.inputs, self.text_chunks, self.audio_chunks)},
+            'last_turn': dict(self.last_turn),
+        }
+
+    async def _listen_stage(self):
+        while True:
+            if not self.overlap_listening:
+                await self.ready_to_listen.wait()
+            # Listening can block on a key press indefinitely, so it gets a daemon thread rather than an executor
+            user_input, trace = await self._run_in_daemon_thread(self._listen_traced)
+            if not user_input:
+                continue
+            self.ready_to_listen.clear()
+            # Blocks while the previous input is still waiting for its turn (backpressure)
+            await self.inputs.put((user_input, trace))
+
+    def _listen_traced(self):
+        # listen() begins the turn's trace when the recording stops; it travels with the input
+        tracing.set_turn(None)
+        user_input = self.listen()
+        return user_input, tracing.current_turn()
+
+    async def _run_turn(self, user_input, trace):
+        self.turn_number += 1
+        turn_start = time.perf_counter()
+        self.last_turn = {'turn': self.turn_number}
+        cancel = threading.Event()
+        # Began when the recording stopped, in listen(). Each task has its own context, so the stages
+        # created below trace into this turn even while the next recording begins another one.
+        tracing.set_turn(trace)
+        if self.on_turn_start:
+            self.on_turn_start()
+
+        stages = [
+            asyncio.create_task(self._llm_stage(user_input, cancel)),
+            asyncio.create_task(self._tts_stage()),
+            asyncio.create_task(self._playback_stage(turn_start)),
+        ]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            cancel.set()
+            for stage in stages:
+                stage.cancel()
+            if not self.interrupted:
+                self.audio_manager.stop_queue()
+            self.text_chunks.drain()
+            self.audio_chunks.drain()
+            raise
+        finally:
+            cancel.set()
+            if self.on_turn_end:
+                self.on_turn_end()
+            self.last_turn['total'] = time.perf_counter() - turn_start
+            tracing.end_turn(trace, interrupted=self.interrupted)
+            # Hiding the talking sources overlaps with the next recording
+            self._in_background(self.set_talking, False)
+            for audio_id in self.audio_ids:
+                self.audio_manager.unload_audio(audio_id)
+            self.audio_ids = []
+
+        if 'first_audio' in self.last_turn:
+            print(f"[dim]Time to first audio: {self.last_turn['first_audio']:.2f}s, total turn: {self.last_turn['total']:.2f}s[/dim]")
+
+    async def _llm_stage(self, user_input, cancel):
+        loop = self.loop
+
+        def produce():
+            stream = self.generate(user_input)
+            try:
+                for chunk in stream:
+                    put = asyncio.run_coroutine_threadsafe(self.text_chunks.put(chunk), loop)
+                    # Wait for room in the queue, but give up if the turn is cancelled meanwhile
+                    while True:
+                        try:
+                            put.result(timeout=0.1)
+                            break
+                        except concurrent.futures.TimeoutError:
+                            if cancel.is_set():
+                                put.cancel()
+                                return
+                    if cancel.is_set():
+                        return
+            finally:
+                stream.close()
+
+        await loop.run_in_executor(self.llm_executor, tracing.bind(produce))
+        await self.text_chunks.put(None)
+
+    async def _tts_stage(self):
+        while True:
+            chunk = await self.text_chunks.get()
+            if chunk is None:
+                await self.audio_chunks.put(None)
+                return
+            audio_id = f'pipeline-{self.turn_number}-{len(self.audio_ids)}'
+            self.audio_ids.append(audio_id)
+            # Synthesis and decoding both happen off the event loop, while earlier chunks play
+            await self.loop.run_in_executor(self.tts_executor, tracing.bind(self._synthesize_and_load), chunk, audio_id)
+            await self.audio_chunks.put(audio_id)
+
+    def _synthesize_and_load(self, text, audio_id):
+        audio = self.synthesize(text)
+        self.audio_manager.load_audio(audio, audio_id)
+
+    async def _playback_stage(self, turn_start):
+        playback = None
+        while True:
+            audio_id = await self.audio_chunks.get()
+            if audio_id is None:
+                break
+            previous = playback
+            if self.on_audio_queued:
+                self.on_audio_queued(self.audio_manager.audio_files[audio_id])
+            playback = self.audio_manager.queue_audio(audio_id)
+            if previous is None:
+                self.last_turn['first_audio'] = time.perf_counter() - turn_start
+                if self.on_playback_start:
+                    self.on_playback_start(playback)
+                self._in_background(self.set_talking, True)
+            elif playback is not previous and self.on_playback_resume:
+                self.on_playback_resume(playback)
+
+        if playback:
+            await playback
+            tracing.mark('playback.end')
+
+    def _in_background(self, func, *args):
+        """Run a blocking call on the OBS executor without waiting for it."""
+        if func is None:
+            return
+
+        def report(future):
+            if not future.cancelled() and future.exception():
+                print(f"[red]Error in background task: {future.exception()}[/red]")
+
+        self.loop.run_in_executor(self.obs_executor, tracing.bind(func), *args).add_done_callback(report)
+
+    def _run_in_daemon_thread(self, func, *args):
+        loop = self.loop
+        future = loop.create_future()
+
+        def resolve(setter, value):
+            if not future.done():
+                setter(value)
+
+        def target():
+            try:
+                result = func(*args)
+            except BaseException as e:
+                loop.call_soon_threadsafe(resolve, future.set_exception, e)
+            else:
+                loop.call_soon_threadsafe(resolve, future.set_result, result)
+
+        threading.Thread(target=target, daemon=True).start()
+        return future
@@ -0,0 +1,453 @@
+import asyncio
+import base64
+import io
+import json
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from aiohttp import WSMsgType, web
+from rich import print
+
+from .registry import create_provider
+from .tts_cache import TTSCache
+
+AUDIO_FORMATS = ('mp3', 'pcm', 'none')
+
+class Session:
+    def __init__(self, session_id, character, ai_manager, voice):
+        """One conversation: its own chat history and voice, and a lock that keeps its turns in order."""
+        self.session_id = session_id
+        self.character = character
+        self.ai_manager = ai_manager
+        self.voice = voice
+        self.lock = asyncio.Lock()
+        self.pending = 0  # turns running or waiting for the lock
+        self.turns = 0
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+
+    def get_stats(self):
+        return {
+            'character': self.character,
+            'turns': self.turns,
+            'pending': self.pending,
+            'context_tokens': self.ai_manager.get_chat_context_length(),
+            'idle': time.monotonic() - self.last_active,
+        }
+
+class Transcriber:
+    def __init__(self, model='base', language='en', compute_type='default', num_workers=2):
+        """Transcribe uploaded WAV files with one faster-whisper model shared by all sessions."""
+        # Only imported when audio input is actually used
+        from faster_whisper import WhisperModel
+        self.language = language
+        self.model = WhisperModel(model, compute_type=compute_type, num_workers=num_workers)
+
+    def transcribe(self, wav_bytes):
+        """Return the text spoken in a 16-bit PCM WAV file."""
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("Audio input must be 16-bit PCM WAV")
+            sample_rate = wav.getframerate()
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            if wav.getnchannels() > 1:
+                samples = samples.reshape(-1, wav.getnchannels()).mean(axis=1)
+        audio = samples.astype(np.float32) / 32768.0
+        if sample_rate != 16000:
+            # Whisper wants 16 kHz; linear interpolation is plenty for speech
+            positions = np.arange(int(len(audio) * 16000 / sample_rate)) * sample_rate / 16000
+            audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+        segments, _ = self.model.transcribe(audio, language=self.language)
+        return ' '.join(segment.text.strip() for segment in segments).strip()
+
+class ConversationServer:
+    def __init__(self, ai_manager, tts_manager, fallback_tts_manager=None, tts_cache=None, transcriber_factory=None, tts_dispatcher=None,
+                 characters=None, default_voice='Matthew', min_chunk_length=40, max_sessions=500, max_concurrent_turns=16,
+                 max_queued_turns=4, workers=16, idle_timeout=900.0, session_max_tokens=32000, max_input_bytes=2 * 1024 * 1024):
+        """Serve many isolated conversations over HTTP and WebSocket from one process.
+
+        Every session gets its own chat history (ai_manager.new_conversation), capped at
+        session_max_tokens, while the Gemini client, the TTS managers, the TTS cache and the
+        worker threads are shared. characters maps a name to its system_instruction and voice.
+        At most max_concurrent_turns turns run at once, each session queues at most
+        max_queued_turns, and sessions idle for idle_timeout seconds (or the least recently
+        used idle one, once max_sessions is reached) are evicted. With a tts_dispatcher, speech
+        goes through it instead of trying the fallback TTS provider after the main one fails.
+        """
+        self.ai_manager = ai_manager
+        self.tts_manager = tts_manager
+        self.fallback_tts_manager = fallback_tts_manager
+        self.tts_cache = tts_cache
+        self.tts_dispatcher = tts_dispatcher
+        self.transcriber_factory = transcriber_factory
+        self.transcriber = None
+        self.transcriber_lock = threading.Lock()
+        self.characters = characters or {}
+        self.default_voice = default_voice
+        self.min_chunk_length = min_chunk_length
+        self.max_sessions = max_sessions
+        self.max_concurrent_turns = max_concurrent_turns
+        self.max_queued_turns = max_queued_turns
+        self.idle_timeout = idle_timeout
+        self.session_max_tokens = session_max_tokens
+        self.max_input_bytes = max_input_bytes
+
+        # Each running turn holds an LLM thread while its reply streams in; TTS and Whisper calls from
+        # all sessions share the worker threads, so streaming replies can never starve synthesis
+        self.llm_executor = ThreadPoolExecutor(max_workers=max_concurrent_turns, thread_name_prefix='server-llm')
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='server')
+        self.sessions = OrderedDict()  # session id -> Session, least recently used first
+        self.turn_slots = None
+        self.evictor = None
+        self.active_turns = 0
+        self.turns = 0
+        self.failed_turns = 0
+        self.created = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the server and the shared providers from config.yaml's server, ai and tts sections."""
+        server_config = config.get('server', {})
+        workers = server_config.get('workers', 16)
+        # Sessions are short-lived and independent, so the desktop app's saved conversation isn't loaded
+        config = dict(config, ai=dict(config['ai'], compaction={}), tts=dict(config['tts'], max_workers=workers))
+
+        cache_config = config['tts'].get('cache', {})
+        tts_cache = TTSCache(max_bytes=cache_config.get('max_bytes', 50 * 1024 * 1024)) if cache_config.get('enabled', False) else None
+        stt_config = config['stt']
+        tts_manager = create_provider(config, 'tts', cache=tts_cache)
+        fallback_tts_manager = create_provider(config, 'tts_fallback', cache=tts_cache)
+        tts_dispatcher = None
+        if config['tts'].get('dispatch', {}).get('enabled', False):
+            from .tts_dispatcher import TTSDispatcher
+            providers = [(config['providers']['tts'], tts_manager)]
+            if fallback_tts_manager is not None:
+                providers.append((config['providers']['tts_fallback'], fallback_tts_manager))
+            tts_dispatcher = TTSDispatcher.from_config(config, providers)
+
+        return cls(
+            ai_manager=create_provider(config, 'llm'),
+            tts_manager=tts_manager,
+            fallback_tts_manager=fallback_tts_manager,
+            tts_cache=tts_cache,
+            tts_dispatcher=tts_dispatcher,
+            transcriber_factory=lambda: Transcriber(stt_config['model'], stt_config['language'], stt_config.get('compute_type', 'default')),
+            characters=server_config.get('characters'),
+            default_voice=config['tts']['voice'],
+            min_chunk_length=config['ai'].get('min_chunk_length', 40),
+            max_sessions=server_config.get('max_sessions', 500),
+            max_concurrent_turns=server_config.get('max_concurrent_turns', 16),
+            max_queued_turns=server_config.get('max_queued_turns', 4),
+            workers=workers,
+            idle_timeout=server_config.get('idle_timeout', 900.0),
+            session_max_tokens=server_config.get('session_max_tokens', 32000),
+            max_input_bytes=server_config.get('max_input_bytes', 2 * 1024 * 1024)
+        )
+
+    def build_app(self):
+        """Create the aiohttp application with the session routes."""
+        app = web.Application(client_max_size=self.max_input_bytes)
+        app.router.add_post('/sessions/{session_id}/turns', self._handle_turn)
+        app.router.add_get('/sessions/{session_id}/ws', self._handle_websocket)
+        app.router.add_delete('/sessions/{session_id}', self._handle_delete)
+        app.router.add_get('/stats', self._handle_stats)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    def run(self, host='127.0.0.1', port=8080):
+        """Serve until interrupted."""
+        print(f"[green]Conversation server listening on http://{host}:{port}[/green]")
+        web.run_app(self.build_app(), host=host, port=port, print=None)
+
+    def get_session(self, session_id, character=None):
+        """Get a session, creating it (for character, or the default one) if it doesn't exist yet."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+
+        if character and character not in self.characters:
+            raise web.HTTPBadRequest(reason=f"Unknown character {character}")
+        if len(self.sessions) >= self.max_sessions and not self._evict_least_recently_used():
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(reason="Too many active sessions")
+
+        character_config = self.characters.get(character, {})
+        session = Session(
+            session_id,
+            character,
+            self.ai_manager.new_conversation(
+                system_instruction=character_config.get('system_instruction'),
+                max_context_length=self.session_max_tokens
+            ),
+            character_config.get('voice', self.default_voice)
+        )
+        self.sessions[session_id] = session
+        self.created += 1
+        return session
+
+    def end_session(self, session_id):
+        """Forget a session and its history. Returns whether it existed."""
+        return self.sessions.pop(session_id, None) is not None
+
+    def evict_idle(self):
+        """Drop sessions that have been idle for longer than idle_timeout."""
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if not session.pending and now - session.last_active > self.idle_timeout:
+                del self.sessions[session_id]
+                self.evicted += 1
+
+    def get_stats(self):
+        stats = {
+            'sessions': len(self.sessions),
+            'max_sessions': self.max_sessions,
+            'active_turns': self.active_turns,
+            'max_concurrent_turns': self.max_concurrent_turns,
+            'turns': self.turns,
+            'failed_turns': self.failed_turns,
+            'created': self.created,
+            'evicted': self.evicted,
+            'rejected': self.rejected,
+        }
+        if self.tts_cache:
+            stats['tts_cache'] = self.tts_cache.get_stats()
+        if self.tts_dispatcher:
+            stats['tts'] = self.tts_dispatcher.get_stats()
+        return stats
+
+    async def run_turn(self, session, user_input, send, audio_format='mp3'):
+        """Answer one turn of a session, calling send(event) for every text chunk and audio clip.
+
+        Events are dicts: {'type': 'text', 'text': ...} and {'type': 'audio', 'format': ..., 'audio': bytes},
+        then {'type': 'done', ...}. Audio is synthesized while later text is still being generated.
+        """
+        self._admit(session)
+        session.pending += 1
+        try:
+            async with session.lock, self.turn_slots:
+                self.active_turns += 1
+                try:
+                    await self._run_turn(session, user_input, send, audio_format)
+                finally:
+                    self.active_turns -= 1
+                    session.turns += 1
+                    self.turns += 1
+        finally:
+            session.pending -= 1
+            session.last_active = time.monotonic()
+
+    async def transcribe(self, wav_bytes):
+        """Transcribe uploaded audio on the shared model, loading it on first use."""
+        if self.transcriber_factory is None:
+            raise web.HTTPBadRequest(reason="Audio input is not available")
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._transcribe, wav_bytes)
+
+    def synthesize(self, text, voice, audio_format):
+        """Synthesize one chunk, falling back to the fallback TTS provider for MP3."""
+        if self.tts_dispatcher:
+            return self.tts_dispatcher.text_to_speech(text, None, True, voice, audio_format)
+        try:
+            return self.tts_manager.text_to_speech(text, None, True, voice, audio_format)
+        except Exception as e:
+            if self.fallback_tts_manager is None or audio_format != 'mp3':
+                raise
+            print(f"[red]Error with TTS, falling back: {e}[/red]")
+            return self.fallback_tts_manager.text_to_speech(text, None)
+
+    async def _run_turn(self, session, user_input, send, audio_format):
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        chunks = asyncio.Queue()
+        cancelled = threading.Event()
+        send_lock = asyncio.Lock()
+
+        async def send_event(event):
+            async with send_lock:
+                await send(event)
+
+        def produce():
+            stream = session.ai_manager.generate_response_stream(user_input, show_token_usage=False, min_chunk_length=self.min_chunk_length)
+            try:
+                for chunk in stream:
+                    if cancelled.is_set():
+                        return
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                # Closing the stream early drops the request and keeps the turn out of the history
+                stream.close()
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+        async def send_audio(synthesis):
+            # Clips go out in reply order, each as soon as it and everything before it is ready
+            while True:
+                future = await synthesis.get()
+                if future is None:
+                    return
+                audio = await future
+                if audio:
+                    await send_event({'type': 'audio', 'format': audio_format, 'audio': audio})
+
+        synthesis = asyncio.Queue()
+        sender = asyncio.create_task(send_audio(synthesis)) if audio_format != 'none' else None
+        producer = loop.run_in_executor(self.llm_executor, produce)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                await send_event({'type': 'text', 'text': chunk})
+                if sender:
+                    synthesis.put_nowait(loop.run_in_executor(self.executor, self.synthesize, chunk, session.voice, audio_format))
+            await producer
+            if sender:
+                synthesis.put_nowait(None)
+                await sender
+        except BaseException:
+            cancelled.set()
+            if sender:
+                sender.cancel()
+            self.failed_turns += 1
+            raise
+
+        await send_event({
+            'type': 'done',
+            'turn': session.turns + 1,
+            'elapsed': time.perf_counter() - started_at,
+            'context_tokens': session.ai_manager.get_chat_context_length(),
+        })
+
+    def _admit(self, session):
+        if session.pending >= self.max_queued_turns:
+            self.rejected += 1
+            raise web.HTTPTooManyRequests(reason="Too many turns queued for this session")
+
+    def _transcribe(self, wav_bytes):
+        with self.transcriber_lock:
+            if self.transcriber is None:
+                self.transcriber = self.transcriber_factory()
+        return self.transcriber.transcribe(wav_bytes)
+
+    def _evict_least_recently_used(self):
+        # Only idle sessions can go; a session in the middle of a turn is never dropped
+        for session_id, session in self.sessions.items():
+            if not session.pending:
+                del self.sessions[session_id]
+                self.evicted += 1
+                return True
+        return False
+
+    async def _evict_idle_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            self.evict_idle()
+
+    async def _on_startup(self, app):
+        self.turn_slots = asyncio.Semaphore(self.max_concurrent_turns)
+        self.evictor = asyncio.create_task(self._evict_idle_loop())
+
+    async def _on_cleanup(self, app):
+        self.evictor.cancel()
+        for executor in (self.llm_executor, self.executor):
+            executor.shutdown(wait=False, cancel_futures=True)
+        if self.tts_cache:
+            self.tts_cache.save()
+
+    async def _read_input(self, content_type, body):
+        # JSON carries text, anything else is a WAV file to transcribe
+        try:
+            if content_type == 'application/json':
+                text = json.loads(body).get('text', '').strip()
+            else:
+                text = await self.transcribe(body)
+        except (ValueError, wave.Error, EOFError) as e:
+            raise web.HTTPBadRequest(reason=f"Invalid input: {e}")
+        if not text:
+            raise web.HTTPBadRequest(reason="No text or speech in the input")
+        return text
+
+    def _audio_format(self, request):
+        audio_format = request.query.get('audio', 'mp3')
+        if audio_format not in AUDIO_FORMATS:
+            raise web.HTTPBadRequest(reason=f"audio must be one of {', '.join(AUDIO_FORMATS)}")
+        return audio_format
+
+    async def _handle_turn(self, request):
+        """POST text ({"text": ...}) or a WAV file; the reply streams back as newline-delimited JSON events."""
+        audio_format = self._audio_format(request)
+        session = self.get_session(request.match_info['session_id'], request.query.get('character'))
+        self._admit(session)
+        user_input = await self._read_input(request.content_type, await request.read())
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+
+        async def send(event):
+            if event['type'] == 'audio':
+                event = dict(event, audio=base64.b64encode(event['audio']).decode('ascii'))
+            await response.write(json.dumps(event).encode('utf-8') + b'\n')
+
+        await send({'type': 'input', 'text': user_input})
+        try:
+            await self.run_turn(session, user_input, send, audio_format)
+        except web.HTTPException as e:
+            await send({'type': 'error', 'status': e.status, 'message': e.reason})
+        except (ConnectionResetError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            print(f"[red]Error in session {session.session_id}: {e}[/red]")
+            await send({'type': 'error', 'status': 500, 'message': str(e)})
+        await response.write_eof()
+        return response
+
+    async def _handle_websocket(self, request):
+        """Each text message ({"text": ...}) or binary message (a WAV file) is one turn. Replies come
+        back as JSON text events, with every audio clip as a binary message after its audio event."""
+        audio_format = self._audio_format(request)
+        session = self.get_session(request.match_info['session_id'], request.query.get('character'))
+        ws = web.WebSocketResponse(max_msg_size=self.max_input_bytes)
+        await ws.prepare(request)
+
+        async def send(event):
+            if event['type'] == 'audio':
+                await ws.send_str(json.dumps({'type': 'audio', 'format': event['format'], 'bytes': len(event['audio'])}))
+                await ws.send_bytes(event['audio'])
+            else:
+                await ws.send_str(json.dumps(event))
+
+        async for message in ws:
+            if message.type not in (WSMsgType.TEXT, WSMsgType.BINARY):
+                continue
+            try:
+                if message.type == WSMsgType.TEXT:
+                    user_input = await self._read_input('application/json', message.data)
+                else:
+                    user_input = await self._read_input('audio/wav', message.data)
+                await send({'type': 'input', 'text': user_input})
+                await self.run_turn(session, user_input, send, audio_format)
+            except web.HTTPException as e:
+                await send({'type': 'error', 'status': e.status, 'message': e.reason})
+            except Exception as e:
+                if ws.closed:
+                    break
+                print(f"[red]Error in session {session.session_id}: {e}[/red]")
+                await send({'type': 'error', 'status': 500, 'message': str(e)})
+        return ws
+
+    async def _handle_delete(self, request):
+        if not self.end_session(request.match_info['session_id']):
+            raise web.HTTPNotFound()
+        return web.json_response({'ended': request.match_info['session_id']})
+
+    async def _handle_stats(self, request):
+        stats = self.get_stats()
+        if request.query.get('sessions'):
+            stats['session_details'] = {session_id: session.get_stats() for session_id, session in self.sessions.items()}
+        return web.json_response(stats)
@@ -1,70 +1,185 @@
+import itertools
+import os
+
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
 from rich import print
 
+from . import tracing
+from .sentence_chunker import SentenceChunker
+
+# Shared by every manager, so no two conversations (or states of one) get the same generation
+_generations = itertools.count()
+
 class GeminiAIManager:
-    def __init__(self, model="gemini-2.0-flash-lite", system_instruction="You are a helpful AI assistant.", max_context_length=1048576, api_key=None):
-        """Initialize the Gemini AI Manager with an API key."""
+    def __init__(self, model="gemini-2.0-flash-lite", system_instruction="You are a helpful AI assistant.", max_context_length=1048576, api_key=None, base_url=None, client=None):
+        """Initialize the Gemini AI Manager with an API key.
+
+        base_url points the client at another endpoint, e.g. the fake one in tools/fake_services.py.
+        An existing client (and its connection pool) can be shared instead, see new_conversation.
+        """
 
         # Validate the API key
         self.api_key = api_key
-        if not self.api_key:
-            raise ValueError("API key must be provided for GeminiAIManager.")
-        
-        try:
-            self.client = genai.Client(
-                api_key=self.api_key,
-            )
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize Gemini AI client: {e}")
+        if client is not None:
+            self.client = client
+        else:
+            if not self.api_key:
+                raise ValueError("API key must be provided for GeminiAIManager.")
+
+            try:
+                self.client = genai.Client(
+                    api_key=self.api_key,
+                    http_options=types.HttpOptions(base_url=base_url) if base_url else None,
+                )
+            except Exception as e:
+                raise RuntimeError(f"Failed to initialize Gemini AI client: {e}")
 
         self.model = model
         self.max_context_length = max_context_length
         self.chat_history = []
         self.system_instruction = system_instruction
+        # Changes whenever a reply would be built from a different conversation (see SpeculativeResponder)
+        self.generation = next(_generations)
+        # Older turns folded away by the compactor (if any) live on in the summary
+        self.summary = ''
+        self.summary_tokens = 0
+        self.compactor = None
+        self.context_cache = None
+        # Deadlines, hedging and fallback models (see managers/resilience.py), None to call self.model directly
+        self.router = None
+        self.request_timeout = None
+        # (key, config) of the last request config, swapped as one so hedged requests can build it concurrently
+        self.generate_content_config = (None, None)
+        self.usage_totals = {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0}
+
+        # Token count of each message in chat_history (same order) and their running total
+        self.token_ledger = []
+        self.context_tokens = 0
+        self.system_instruction_tokens = self.estimate_tokens(system_instruction)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the manager from config.yaml's ai section and GEMINI_API_KEY (and GEMINI_BASE_URL, if set)."""
+        manager = cls(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            model=config['ai']['model'],
+            system_instruction=config['ai']['system_instruction'],
+            base_url=config['ai'].get('base_url') or os.getenv("GEMINI_BASE_URL")
+        )
+        compaction_config = config['ai'].get('compaction', {})
+        if compaction_config.get('enabled', False):
+            # Imported here so the manager doesn't depend on it when compaction is off
+            from .history_compactor import HistoryCompactor
+            manager.compactor = HistoryCompactor(
+                manager,
+                target_tokens=compaction_config.get('target_tokens', 8000),
+                keep_tokens=compaction_config.get('keep_tokens'),
+                model=compaction_config.get('model'),
+                max_summary_words=compaction_config.get('max_summary_words', 300),
+                state_path=compaction_config.get('state_path')
+            )
+        cache_config = config['ai'].get('context_cache', {})
+        if cache_config.get('enabled', False):
+            from .context_cache import ContextCache
+            manager.context_cache = ContextCache(
+                manager,
+                ttl=cache_config.get('ttl', 3600),
+                min_tokens=cache_config.get('min_tokens', 4096),
+                refresh_margin=cache_config.get('refresh_margin', 300)
+            )
+        resilience_config = config['ai'].get('resilience', {})
+        if resilience_config.get('enabled', False):
+            from .resilience import ModelRouter
+            manager.router = ModelRouter(
+                [manager.model] + [model for model in resilience_config.get('fallback_models', []) if model != manager.model],
+                deadline=resilience_config.get('deadline', 8.0),
+                attempt_timeout=resilience_config.get('attempt_timeout', 3.0),
+                retries=resilience_config.get('retries', 1),
+                hedge=resilience_config.get('hedge', True),
+                hedge_quantile=resilience_config.get('hedge_quantile', 0.95),
+                initial_hedge_delay=resilience_config.get('initial_hedge_delay', 2.0),
+                failure_threshold=resilience_config.get('failure_threshold', 3),
+                reset_timeout=resilience_config.get('reset_timeout', 30),
+                is_retryable=cls.is_retryable
+            )
+            # Also bounds how long an abandoned request (a hedge that lost) keeps its connection
+            manager.request_timeout = resilience_config.get('deadline', 8.0)
+        return manager
+
+    def new_conversation(self, system_instruction=None, max_context_length=None):
+        """Create a manager with its own, empty chat history that shares this one's client (and model health)."""
+        manager = GeminiAIManager(
+            model=self.model,
+            system_instruction=system_instruction or self.system_instruction,
+            max_context_length=max_context_length or self.max_context_length,
+            api_key=self.api_key,
+            client=self.client
+        )
+        manager.router = self.router
+        manager.request_timeout = self.request_timeout
+        return manager
 
     def clear_chat_history(self):
         """Clear the chat history."""
         self.chat_history = []
+        self.token_ledger = []
+        self.context_tokens = 0
+        self.set_summary('')
+        self.generation = next(_generations)
+        if self.compactor:
+            self.compactor.discard()
+
+    def set_system_instruction(self, system_instruction):
+        """Use another system instruction from the next request on, keeping the conversation so far."""
+        # The request config and context cache are keyed on the instruction, so both follow on their own
+        self.system_instruction = system_instruction
+        self.system_instruction_tokens = self.estimate_tokens(system_instruction)
+        self.generation = next(_generations)
+
+    def set_summary(self, summary):
+        """Replace the summary of earlier turns that is sent along with the system instruction."""
+        self.summary = summary
+        self.summary_tokens = self.estimate_tokens(summary) if summary else 0
+
+    def shutdown(self):
+        """Finish background work (history compaction, context caching), save its state and delete the cache."""
+        if self.compactor:
+            self.compactor.close()
+        if self.context_cache:
+            self.context_cache.close()
 
     def trim_chat_history(self):
         """Trim the chat history to fit within the maximum context length."""
         if not self.chat_history:
             return
-        
-        # Trim oldest entries until context is within limit
-        while True:
-            current_length = self.get_chat_context_length()
-            if not current_length or current_length <= self.max_context_length * 0.9:
-                break
-            self.chat_history.pop(0)
+
+        # Walk the ledger to find how many of the oldest messages to drop, then drop them in one slice
+        limit = self.max_context_length * 0.9
+        remaining = self.context_tokens
+        cut = 0
+        while cut < len(self.token_ledger) and remaining > limit:
+            remaining -= self.token_ledger[cut]
+            cut += 1
+
+        if cut:
+            del self.chat_history[:cut]
+            del self.token_ledger[:cut]
+            self.context_tokens = remaining
 
     def get_chat_history(self):
         """Get the current chat history."""
         return self.chat_history
     
     def get_chat_context_length(self):
-        """Get the current context length (in tokens) of the chat context."""
-        if not self.chat_history:
-            return 0
-            
-        try:
-            token_count_response = self.client.models.count_tokens(
-                model=self.model,
-                contents=self.chat_history
-            )
-            
-            return token_count_response.total_tokens
-            
-        except Exception as e:
-            print(f"[yellow]Warning: Could not get accurate token count, falling back to word estimate: {e}[/yellow]")
-            # Fallback to word-based estimation (roughly 1 token per 0.75 words for English)
-            word_count = 0
-            for content in self.chat_history:
-                for part in getattr(content, 'parts', []):
-                    text = getattr(part, 'text', '')
-                    word_count += len(text.split())
-            return int(word_count * 1.33)  # Convert words to approximate tokens
+        """Get the current context length (in tokens) of the chat context from the local ledger."""
+        return self.context_tokens
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Estimate the token count of text locally (roughly 1 token per 0.75 words for English)."""
+        return int(len(text.split()) * 1.33)
 
     def count_tokens_for_text(self, text):
         """Count tokens for a specific text input."""
@@ -84,12 +199,16 @@ class GeminiAIManager:
         except Exception as e:
             print(f"[yellow]Warning: count_tokens_for_text failed, falling back to word estimate: {e}[/yellow]")
             # Fallback to word-based estimation
-            word_count = len(text.split())
-            return int(word_count * 1.33)
+            return self.estimate_tokens(text)
 
-    def add_to_chat_history(self, user_input, ai_response):
+    def add_to_chat_history(self, user_input, ai_response, user_tokens=None, response_tokens=None):
         """Add a user input and AI response to the chat history."""
 
+        if user_tokens is None:
+            user_tokens = self.estimate_tokens(user_input)
+        if response_tokens is None:
+            response_tokens = self.estimate_tokens(ai_response)
+
         self.chat_history.append(
             types.Content(
                 role='user',
@@ -108,62 +227,170 @@ class GeminiAIManager:
             )
         )
 
-        context_length = self.get_chat_context_length()
-        if context_length and context_length > self.max_context_length * 0.9:
+        self.token_ledger.extend([user_tokens, response_tokens])
+        self.context_tokens += user_tokens + response_tokens
+        self.generation = next(_generations)
+
+        if self.context_tokens > self.max_context_length * 0.9:
             print("[yellow]Chat history exceeds maximum context length, trimming history...[/yellow]")
             self.trim_chat_history()
-            
 
-    def generate_response(self, user_input, show_token_usage=True):
-        """Generate a response from the AI model based on user input."""
+        if self.compactor:
+            self.compactor.after_turn()
+        if self.context_cache:
+            self.context_cache.after_turn()
 
-        if not self.chat_history:
-            print("[yellow]Chat history is empty. This is probably fine, but if you see this message again, you have a problem.[/yellow]")
+    def record_turn(self, user_input, ai_response, meta=None):
+        """Commit a finished turn, taking its token counts from the API usage metadata when available."""
+        user_tokens = None
+        response_tokens = None
 
-        try:
+        if meta:
+            response_tokens = meta.candidates_token_count
+            # The prompt count covers the system instruction, the history and the new input, so
+            # whatever the ledger doesn't already account for belongs to the new input. This also
+            # re-anchors the running total to the API's count every turn.
+            if meta.prompt_token_count:
+                user_tokens = meta.prompt_token_count - self.context_tokens - self.system_instruction_tokens - self.summary_tokens
+                if user_tokens <= 0:
+                    user_tokens = None
 
-            contents = self.chat_history + [
-                types.Content(
-                    role='user',
-                    parts=[
-                        types.Part.from_text(text=user_input)
-                    ]
-                )
-            ]
+        self.add_to_chat_history(user_input, ai_response, user_tokens, response_tokens)
+
+    def build_system_instruction(self):
+        """The system instruction parts: the instruction itself, followed by the summary of earlier turns if there is one."""
+        parts = [types.Part.from_text(text=self.system_instruction)]
+        if self.summary:
+            parts.append(types.Part.from_text(text=f"Summary of the conversation before the messages below:\n{self.summary}"))
+        return parts
+
+    def build_generate_content_config(self, cached_content=None):
+        """Get the request config, only rebuilt when the system instruction, summary or context cache changed."""
+        key = (self.system_instruction, self.summary, cached_content)
+        current_key, config = self.generate_content_config
+        if current_key != key:
+            http_options = types.HttpOptions(timeout=int(self.request_timeout * 1000)) if self.request_timeout else None
+            if cached_content:
+                # The cache already holds the system instruction; sending it again is an error
+                config = types.GenerateContentConfig(cached_content=cached_content, http_options=http_options)
+            else:
+                config = types.GenerateContentConfig(system_instruction=self.build_system_instruction(), http_options=http_options)
+            self.generate_content_config = (key, config)
+        return config
 
-            generate_content_config = types.GenerateContentConfig(
-                system_instruction=[
-                    types.Part.from_text(text=self.system_instruction)
-                ],
+    def build_request(self, user_input, use_cache=True):
+        """Get (contents, config, whether a context cache is used) for a request answering user_input."""
+        history = self.chat_history
+        cached = self.context_cache.lookup() if self.context_cache and use_cache else None
+        if cached:
+            cached_content, cached_messages = cached
+            history = history[cached_messages:]
+        else:
+            cached_content = None
+        contents = history + [
+            types.Content(
+                role='user',
+                parts=[
+                    types.Part.from_text(text=user_input)
+                ]
             )
+        ]
+        return contents, self.build_generate_content_config(cached_content), cached_content is not None
 
-            # Show token usage if requested (using response metadata)
-            # Will capture prompt and response token counts directly from the API
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=contents,
-                config=generate_content_config,
+    def get_usage_stats(self):
+        """Get the prompt tokens sent so far and how many of them were served from the context cache."""
+        stats = dict(self.usage_totals)
+        stats['uncached_tokens'] = stats['prompt_tokens'] - stats['cached_tokens']
+        if self.context_cache:
+            stats['context_cache'] = self.context_cache.get_stats()
+        if self.router:
+            stats['models'] = self.router.get_stats()
+        return stats
+
+    def _report_usage(self, meta, show_token_usage):
+        if not meta:
+            return
+        cached_tokens = meta.cached_content_token_count or 0
+        self.usage_totals['requests'] += 1
+        self.usage_totals['prompt_tokens'] += meta.prompt_token_count or 0
+        self.usage_totals['cached_tokens'] += cached_tokens
+        if show_token_usage:
+            print(
+                f"[dim]Token usage (API): Prompt={meta.prompt_token_count} (Cached={cached_tokens}), "
+                f"Response={meta.candidates_token_count}, Total={meta.total_token_count}[/dim]"
             )
-            if show_token_usage:
-                meta = getattr(response, 'usage_metadata', None)
-                if meta:
-                    print(
-                        f"[dim]Token usage (API): Prompt={meta.prompt_token_count}, "
-                        f"Response={meta.candidates_token_count}, Total={meta.total_token_count}[/dim]"
-                    )
 
-            # ... existing code above handles token usage
+    def _is_cache_error(self, error, cached):
+        # A rejected request that used the cache (e.g. it expired early) is retried without it; rate limits aren't the cache's fault
+        return cached and isinstance(error, genai_errors.ClientError) and error.code != 429
+
+    @staticmethod
+    def is_retryable(error):
+        """Whether another attempt at a failed request may succeed: not for rejected requests, except rate limits and timeouts."""
+        return not isinstance(error, genai_errors.ClientError) or error.code in (408, 429)
+
+    def _generate(self, user_input, model=None):
+        model = model or self.model
+        # The context cache belongs to self.model, fallback models get the full prompt
+        contents, config, cached = self.build_request(user_input, use_cache=model == self.model)
+        try:
+            return self.client.models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            if not self._is_cache_error(e, cached):
+                raise
+            self.context_cache.invalidate(e)
+        contents, config, _ = self.build_request(user_input, use_cache=False)
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    def _stream(self, user_input, model=None):
+        model = model or self.model
+        contents, config, cached = self.build_request(user_input, use_cache=model == self.model)
+        try:
+            stream = self.client.models.generate_content_stream(model=model, contents=contents, config=config)
+            first = next(stream, None)
+        except Exception as e:
+            if not self._is_cache_error(e, cached):
+                raise
+            self.context_cache.invalidate(e)
+            contents, config, _ = self.build_request(user_input, use_cache=False)
+            stream = self.client.models.generate_content_stream(model=model, contents=contents, config=config)
+            first = next(stream, None)
+        if first is not None:
+            yield first
+            yield from stream
+
+    def generate_response(self, user_input, show_token_usage=True, commit=True):
+        """Generate a response from the AI model based on user input.
+
+        With commit=False the turn is not added to the chat history; (response, usage metadata)
+        is returned instead so the caller can record_turn it once it knows the turn is wanted.
+        """
+
+        if self.compactor and commit:
+            # Picks up a summary that finished in the background since the last turn. Not for an
+            # uncommitted (speculative) reply, which runs on another thread while the history is in use
+            self.compactor.apply()
+        if not self.chat_history:
+            print("[yellow]Chat history is empty. This is probably fine, but if you see this message again, you have a problem.[/yellow]")
+
+        try:
+            # Show token usage if requested (using response metadata)
+            # Will capture prompt and response token counts directly from the API
+            with tracing.span('llm.generate', model=self.model):
+                if self.router:
+                    response = self.router.call(lambda model: self._generate(user_input, model))
+                else:
+                    response = self._generate(user_input)
+            meta = getattr(response, 'usage_metadata', None)
+            self._report_usage(meta, show_token_usage)
 
             ai_response = response.text
             if not ai_response:
                 raise RuntimeError("Received empty response from AI model")
-            self.add_to_chat_history(user_input, ai_response)
-            
-            # Show response token count if requested
-            if show_token_usage:
-                response_tokens = self.count_tokens_for_text(ai_response)
-                print(f"[dim]Response tokens: {response_tokens}[/dim]")
-            
+            if not commit:
+                return ai_response, meta
+            self.record_turn(user_input, ai_response, meta)
+
             return ai_response
 
         except Exception as e:
@@ -171,3 +398,59 @@ class GeminiAIManager:
                 print(f"[red]Model appears to be overloaded or rate limited: {e}[/red]")
                 return "I'm currently overloaded, please try again later."
             raise RuntimeError(f"Failed to generate response: {e}")
+
+    def generate_response_stream(self, user_input, show_token_usage=True, min_chunk_length=40, commit=True):
+        """Stream a response from the AI model, yielding sentence-aligned chunks as they arrive.
+
+        With commit=False the turn is not added to the chat history; the generator returns
+        (response, usage metadata) instead so the caller can record_turn it later.
+        """
+
+        if self.compactor and commit:
+            # Picks up a summary that finished in the background since the last turn. Not for an
+            # uncommitted (speculative) reply, which runs on another thread while the history is in use
+            self.compactor.apply()
+        if not self.chat_history:
+            print("[yellow]Chat history is empty. This is probably fine, but if you see this message again, you have a problem.[/yellow]")
+
+        chunker = SentenceChunker(min_chunk_length=min_chunk_length)
+        response_parts = []
+        meta = None
+
+        if self.router:
+            stream = self.router.stream(lambda model: self._stream(user_input, model))
+        else:
+            stream = self._stream(user_input)
+
+        try:
+            for response in stream:
+                # Usage metadata is only complete on the final chunk, so keep the latest one
+                meta = getattr(response, 'usage_metadata', None) or meta
+                text = response.text
+                if not text:
+                    continue
+                if not response_parts:
+                    tracing.mark('llm.first_token')
+                response_parts.append(text)
+                yield from chunker.feed(text)
+
+        except Exception as e:
+            if not response_parts and ("overloaded" in str(e).lower() or "rate limit" in str(e).lower()):
+                print(f"[red]Model appears to be overloaded or rate limited: {e}[/red]")
+                yield "I'm currently overloaded, please try again later."
+                return
+            raise RuntimeError(f"Failed to generate response: {e}")
+
+        tracing.mark('llm.done')
+        yield from chunker.flush()
+
+        ai_response = "".join(response_parts)
+        if not ai_response:
+            raise RuntimeError("Received empty response from AI model")
+
+        self._report_usage(meta, show_token_usage)
+
+        if not commit:
+            return ai_response, meta
+        # Only commit the turn once the whole response has been received
+        self.record_turn(user_input, ai_response, meta)
@@ -1,18 +1,110 @@
-from gtts import gTTS
-import tempfile
+import base64
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from gtts import gTTS
+from requests.adapters import HTTPAdapter
+
+from . import tracing
+from .ssml import MARKER_PATTERN
+
+GOOGLE_TTS_PATH = '/_/TranslateWebserverUi/data/batchexecute'
+# The base64 MP3 in a batchexecute response line, as gTTS itself extracts it
+AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
 
 class GoogleTTSManager:
-    def __init__(self, language='en'):
+    output_formats = ('mp3',)
+
+    def __init__(self, language='en', cache=None, max_workers=4, timeout=10.0, endpoint_url=None, tld='com'):
+        """Google Translate's TTS, with the text's ~100 character pieces fetched concurrently.
+
+        gTTS splits the text and builds the requests; they are sent in parallel over one pooled
+        session instead of one after another, and the MP3 pieces are joined back in order.
+        endpoint_url points at another server, e.g. the fake one in tools/fake_services.py.
+        """
         self.language = language
+        self.cache = cache
+        self.timeout = timeout
+        self.url = (endpoint_url or f'https://translate.google.{tld}').rstrip('/') + GOOGLE_TTS_PATH
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gtts')
+
+    @classmethod
+    def from_config(cls, config, cache=None):
+        """Build the manager from config.yaml's tts section (and GOOGLE_TTS_ENDPOINT_URL, if set)."""
+        dispatch_config = config['tts'].get('dispatch', {})
+        return cls(
+            language=config['tts']['language'],
+            cache=cache,
+            max_workers=config['tts'].get('max_workers', 4),
+            # Past the dispatcher's deadline the request is of no use anyway
+            timeout=dispatch_config.get('deadline', 4.0) if dispatch_config.get('enabled', False) else 10.0,
+            endpoint_url=config['tts'].get('google_endpoint_url') or os.getenv("GOOGLE_TTS_ENDPOINT_URL")
+        )
 
-    def text_to_speech(self, text, filename=None):
-        """Convert text to speech using Google TTS and save to a file."""
-        tts = gTTS(text=text, lang=self.language)
+    def text_to_speech(self, text, filename=None, format_text=True, voice_id=None, output_format='mp3'):
+        """Convert text to speech using Google TTS, returning the MP3 bytes or saving them to filename.
+
+        Takes the same arguments as PollyTTSManager.text_to_speech so either can be the main
+        TTS provider; gTTS has no voices or emotions, so (emotion) markers are just removed.
+        """
+        audio = b''.join(self.stream_audio(text, format_text, voice_id, output_format))
 
         if filename is None:
-            fd, filename = tempfile.mkstemp(dir=os.path.join(os.path.dirname(__file__), '..', 'audio'), prefix='google_', suffix='.mp3')
-            os.close(fd)
-        
-        tts.save(filename)
-        return filename
\ No newline at end of file
+            return audio
+
+        with open(filename, 'wb') as f:
+            f.write(audio)
+        return filename
+
+    def stream_audio(self, text, format_text=True, voice_id=None, output_format='mp3'):
+        """Yield the MP3 of each piece of text in order, each as soon as it and the ones before it have arrived.
+
+        The pieces are complete MP3 streams, so the first one can start playing while the rest download.
+        """
+        if output_format != 'mp3':
+            raise ValueError(f"Google TTS only produces mp3, not {output_format}")
+        if format_text:
+            text = MARKER_PATTERN.sub('', text)
+
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key('gtts', self.language, 'mp3', None, text)
+            audio = self.cache.get(cache_key)
+            if audio is not None:
+                yield audio
+                return
+
+        with tracing.span('tts.google', chars=len(text)):
+            bodies = gTTS(text=text, lang=self.language).get_bodies()
+            futures = [self.executor.submit(self._fetch, body) for body in bodies]
+            pieces = []
+            try:
+                for future in futures:
+                    piece = future.result()
+                    if not pieces:
+                        tracing.mark('tts.first_byte')
+                    pieces.append(piece)
+                    yield piece
+            finally:
+                # Nothing left to fetch for a caller that stopped listening
+                for future in futures:
+                    future.cancel()
+
+        if cache_key:
+            self.cache.put(cache_key, b''.join(pieces))
+
+    def _fetch(self, body):
+        response = self.session.post(self.url, data=body, headers=gTTS.GOOGLE_TTS_HEADERS, timeout=self.timeout)
+        if not response.ok:
+            raise RuntimeError(f"Google TTS request failed with HTTP {response.status_code}")
+        for line in response.text.splitlines():
+            match = AUDIO_PATTERN.search(line)
+            if match:
+                return base64.b64decode(match.group(1))
+        raise RuntimeError("Google TTS response contained no audio")
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+from rich import print
+
+from . import tracing
+
+SUMMARY_INSTRUCTION = (
+    "You keep the running memory of a conversation between a user and a character you are not playing. "
+    "Merge the new exchanges into the existing summary. Keep names, running jokes, promises, puzzles that "
+    "were solved or are still open and anything the user told the character about themselves. Drop small "
+    "talk. Write plain prose in the third person, at most {max_words} words."
+)
+
+class HistoryCompactor:
+    def __init__(self, manager, target_tokens=8000, keep_tokens=None, model=None, max_summary_words=300, state_path=None):
+        """Fold the oldest turns of a GeminiAIManager's chat history into a running summary.
+
+        Once the history passes target_tokens, the oldest turns are summarized in the
+        background until about keep_tokens (half the target by default) remain. The summary
+        replaces them between turns, so a reply never waits for it. The summary and the
+        remaining history are saved to state_path after every turn and restored on start.
+        """
+        self.manager = manager
+        self.target_tokens = target_tokens
+        self.keep_tokens = keep_tokens if keep_tokens is not None else target_tokens // 2
+        self.model = model or manager.model
+        self.max_summary_words = max_summary_words
+        self.state_path = state_path
+        # One worker keeps summaries and saves in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compaction')
+        self.job = None  # (future, the messages being folded)
+        self.compactions = 0
+        self.folded_messages = 0
+
+        if state_path:
+            self._load_state()
+
+    def after_turn(self):
+        """Apply a finished summary, start a new one if the history is over budget and save the state."""
+        self.apply()
+        manager = self.manager
+        if self.job is None and manager.context_tokens > self.target_tokens:
+            # Fold whole exchanges, oldest first, but always keep the latest one verbatim
+            remaining = manager.context_tokens
+            cut = 0
+            while cut + 2 < len(manager.chat_history) and remaining > self.keep_tokens:
+                remaining -= manager.token_ledger[cut] + manager.token_ledger[cut + 1]
+                cut += 2
+            if cut:
+                messages = manager.chat_history[:cut]
+                future = self.executor.submit(self._summarize, manager.summary, messages)
+                self.job = (future, messages)
+        if self.state_path:
+            self.executor.submit(self._save_state, self._snapshot())
+
+    def apply(self):
+        """Swap a finished summary in for the turns it covers. Called between turns only."""
+        if self.job is None or not self.job[0].done():
+            return
+        future, messages = self.job
+        self.job = None
+        try:
+            summary = future.result()
+        except Exception as e:
+            print(f"[yellow]Warning: summarizing the chat history failed, keeping it as is: {e}[/yellow]")
+            return
+
+        manager = self.manager
+        cut = len(messages)
+        # The history may have been cleared or trimmed meanwhile; then this summary is stale
+        if len(manager.chat_history) < cut or any(current is not old for current, old in zip(manager.chat_history, messages)):
+            return
+        del manager.chat_history[:cut]
+        manager.context_tokens -= sum(manager.token_ledger[:cut])
+        del manager.token_ledger[:cut]
+        manager.set_summary(summary)
+        self.compactions += 1
+        self.folded_messages += cut
+        print(f"[dim]Folded {cut} messages into the conversation summary ({manager.summary_tokens} tokens).[/dim]")
+
+    def discard(self):
+        """Forget any summary in progress, e.g. when the history is cleared."""
+        if self.job:
+            self.job[0].cancel()
+        self.job = None
+
+    def close(self):
+        """Wait for background work and save the state one last time."""
+        if self.state_path:
+            self.executor.submit(self._save_state, self._snapshot())
+        self.executor.shutdown(wait=True)
+
+    def get_stats(self):
+        return {
+            'compactions': self.compactions,
+            'folded_messages': self.folded_messages,
+            'summary_tokens': self.manager.summary_tokens,
+            'history_tokens': self.manager.context_tokens,
+        }
+
+    def _summarize(self, summary, messages):
+        lines = []
+        for message in messages:
+            speaker = 'User' if message.role == 'user' else 'Character'
+            lines.append(f"{speaker}: {''.join(part.text or '' for part in message.parts)}")
+        prompt = f"Summary so far:\n{summary or '(nothing yet)'}\n\nNew exchanges:\n" + '\n'.join(lines)
+
+        tracing.count('llm.compaction')
+        with tracing.span('llm.compaction', model=self.model, messages=len(messages)):
+            response = self.manager.client.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    system_instruction=SUMMARY_INSTRUCTION.format(max_words=self.max_summary_words)
+                ),
+            )
+        if not response.text:
+            raise RuntimeError("Received an empty summary from the AI model")
+        return response.text.strip()
+
+    def _instruction_hash(self):
+        return hashlib.sha256(self.manager.system_instruction.encode('utf-8')).hexdigest()
+
+    def _snapshot(self):
+        # Taken on the caller's thread, so the worker never reads a history that is being changed
+        manager = self.manager
+        return {
+            'system_instruction': self._instruction_hash(),
+            'summary': manager.summary,
+            'history': [
+                {'role': message.role, 'text': ''.join(part.text or '' for part in message.parts), 'tokens': tokens}
+                for message, tokens in zip(manager.chat_history, manager.token_ledger)
+            ],
+        }
+
+    def _save_state(self, state):
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_path, self.state_path)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if state.get('system_instruction') != self._instruction_hash():
+            print("[yellow]The system instruction changed, starting a new conversation instead of resuming the saved one.[/yellow]")
+            return
+
+        manager = self.manager
+        manager.set_summary(state.get('summary', ''))
+        for message in state.get('history', []):
+            manager.chat_history.append(types.Content(role=message['role'], parts=[types.Part.from_text(text=message['text'])]))
+            manager.token_ledger.append(message['tokens'])
+            manager.context_tokens += message['tokens']
+        print(f"[dim]Resumed the saved conversation: {len(manager.chat_history)} messages and a {manager.summary_tokens}-token summary.[/dim]")
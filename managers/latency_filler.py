@@ -0,0 +1,79 @@
+import threading
+
+from rich import print
+
+from . import tracing
+
+class LatencyFiller:
+    def __init__(self, audio_manager, delay=1.5, fade_ms=120):
+        """Play a filler clip ("hmmm", a gasp, ...) when a reply's audio hasn't started within delay seconds.
+
+        arm() when a turn starts waiting on the reply and cut() as soon as its audio is ready
+        (or the turn is over): the filler is never started after that, and one that is
+        playing fades out over fade_ms as the reply comes in. audio_manager needs a sound
+        bank loaded, see PygameAudioManager.load_sound_bank.
+        """
+        self.audio_manager = audio_manager
+        self.delay = delay
+        self.fade_ms = fade_ms
+        self.lock = threading.Lock()
+        self.timer = None
+        self.playback = None
+        # Bumped by every arm() and cut(), so a timer that fires late can tell it is stale
+        self.generation = 0
+        self.stats = {'turns': 0, 'played': 0, 'cut': 0}
+
+    @classmethod
+    def from_config(cls, config, audio_manager):
+        """Build the filler from config.yaml's fillers section."""
+        filler_config = config.get('fillers', {})
+        return cls(
+            audio_manager,
+            delay=filler_config.get('delay', 1.5),
+            fade_ms=filler_config.get('fade_ms', 120)
+        )
+
+    def arm(self):
+        """Start the countdown for the turn that is now waiting on its reply."""
+        with self.lock:
+            self._disarm()
+            self.stats['turns'] += 1
+            self.timer = threading.Timer(self.delay, tracing.bind(self._play), args=(self.generation,))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def cut(self):
+        """The reply is ready (or the turn is over): cancel the countdown and fade out a filler that is playing."""
+        with self.lock:
+            self._disarm()
+            playback, self.playback = self.playback, None
+        if playback and not playback.done:
+            playback.fade(self.fade_ms)
+            with self.lock:
+                self.stats['cut'] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def _disarm(self):
+        self.generation += 1
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def _play(self, generation):
+        with self.lock:
+            # Holding the lock until playback has started means cut() can't slip in between and miss it
+            if generation != self.generation:
+                return
+            self.timer = None
+            try:
+                self.playback = self.audio_manager.play_filler()
+            except Exception as e:
+                print(f"[red]Error playing filler: {e}[/red]")
+                return
+            if self.playback:
+                self.stats['played'] += 1
+        tracing.mark('filler.start')
+        tracing.count('filler.played')
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import numpy as np
+import pygame
+
+def compute_envelope(samples, sample_rate, fps, mode='rms'):
+    """Compute one amplitude value per animation frame (0.0-1.0 of full scale) in a single vectorized pass.
+
+    samples are 16-bit samples, either mono (n,) or interleaved (n, channels).
+    """
+    samples = np.asarray(samples)
+    channels = samples.shape[1] if samples.ndim == 2 else 1
+    step = max(1, int(sample_rate / fps)) * channels
+    frames = samples.size // step
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    # Interleaved samples are contiguous, so each animation frame is one row of this view
+    framed = samples.reshape(-1)[:frames * step].reshape(frames, step).astype(np.float32)
+    if mode == 'peak':
+        envelope = np.abs(framed).max(axis=1)
+    else:
+        envelope = np.sqrt(np.mean(np.square(framed), axis=1))
+    return envelope / 32768.0
+
+class LipSyncDriver:
+    def __init__(self, dispatcher, scene_name, source_name, fps=20, mode='rms', full_scale=0.25, levels=8, scale=0.1, bounce=10.0):
+        """Animate a source's scale and position from the loudness of the audio being played.
+
+        Envelopes are computed once per clip, ideally when it is queued (see add_sound);
+        during playback a single thread steps through the envelope of whichever clip is
+        playing, timed from when that clip actually started, at fps. A transform is only
+        sent when the quantized level changes, so OBS traffic stays bounded however long
+        the reply is.
+        """
+        self.dispatcher = dispatcher
+        self.scene_name = scene_name
+        self.source_name = source_name
+        self.fps = fps
+        self.mode = mode
+        self.full_scale = full_scale
+        self.levels = levels
+        self.scale = scale
+        self.bounce = bounce
+
+        self.frequency, _, self.channels = pygame.mixer.get_init()
+        self.envelopes = {}  # pygame Sound -> quantized levels, one per frame
+        self.lock = threading.Lock()
+        self.thread = None
+        self.playback = None
+        self.base_transform = None
+        self.base_transform_future = dispatcher.query(
+            lambda manager: manager.get_source_transform(scene_name, source_name)
+        )
+
+    def add_sound(self, sound):
+        """Compute the envelope of a pygame Sound about to be queued, so playback doesn't wait on it."""
+        self._levels(sound)
+
+    def start(self, playback):
+        """Animate along each clip's envelope until playback ends, then put the source back.
+
+        A reply whose queue drained while its next chunk was synthesized goes on in a new
+        Playback; starting that one hands it to the thread animating the previous one.
+        """
+        with self.lock:
+            self.playback = playback
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._animate, name='lip-sync', daemon=True)
+                self.thread.start()
+
+    def _levels(self, sound):
+        with self.lock:
+            levels = self.envelopes.get(sound)
+        if levels is None:
+            # sndarray.samples references the decoded buffer rather than copying it
+            envelope = compute_envelope(pygame.sndarray.samples(sound), self.frequency, self.fps, self.mode)
+            levels = np.minimum(np.rint(envelope / self.full_scale * self.levels), self.levels).astype(np.int8).tolist()
+            with self.lock:
+                self.envelopes[sound] = levels
+        return levels
+
+    def _animate(self):
+        frame_time = 1.0 / self.fps
+        last_level = 0
+        while True:
+            with self.lock:
+                playback = self.playback
+            base = self._get_base_transform()
+            while not playback.done:
+                level = 0
+                elapsed = 0.0
+                if base is not None and playback.clip:
+                    # Streamed clips can start late, so time each one from its own start
+                    sound, started_at = playback.clip
+                    levels = self._levels(sound)
+                    elapsed = time.perf_counter() - started_at
+                    frame = int(elapsed * self.fps)
+                    level = levels[frame] if frame < len(levels) else 0
+                if level != last_level:
+                    self._send(base, level / self.levels)
+                    last_level = level
+                playback.wait(frame_time - elapsed % frame_time)
+
+            with self.lock:
+                if self.playback is not playback:
+                    continue
+                if last_level:
+                    self._send(base, 0.0)
+                self.envelopes = {}
+                self.thread = None
+                self.playback = None
+                return
+
+    def _get_base_transform(self):
+        if self.base_transform is None:
+            try:
+                self.base_transform = self.base_transform_future.result(timeout=0)
+            except Exception:
+                # Not fetched yet (or OBS is down); try again next time
+                if self.base_transform_future.done():
+                    self.base_transform_future = self.dispatcher.query(
+                        lambda manager: manager.get_source_transform(self.scene_name, self.source_name)
+                    )
+                return None
+        return self.base_transform
+
+    def _send(self, base, amount):
+        self.dispatcher.set_source_transform(self.scene_name, self.source_name, {
+            'scaleX': base['scaleX'] * (1 + self.scale * amount),
+            'scaleY': base['scaleY'] * (1 + self.scale * amount),
+            'positionY': base['positionY'] - self.bounce * amount,
+        })
@@ -0,0 +1,274 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import websocket
+from obswebsocket import requests, exceptions
+from rich import print
+
+from . import tracing
+
+# Errors that mean the connection itself is gone, as opposed to OBS rejecting one command
+CONNECTION_ERRORS = (exceptions.ConnectionFailure, exceptions.MessageTimeout, websocket.WebSocketException, OSError)
+
+def _resolve(future, result):
+    # The caller may have cancelled it, or a coalesced command already answered it
+    if not future.done():
+        future.set_result(result)
+
+def _fail(future, error):
+    if not future.done():
+        future.set_exception(error)
+
+class OBSCommandDispatcher:
+    def __init__(self, connect, max_pending=64, initial_backoff=0.5, max_backoff=30.0):
+        """Send OBS commands from a background thread so OBS can never stall the caller.
+
+        connect() must return a connected OBSWebsocketsManager; it is called again (with
+        exponential backoff) whenever the connection is lost. Commands for the same target
+        are coalesced so only the latest one is sent, and everything pending goes out as
+        one RequestBatch.
+        """
+        self.connect = connect
+        self.max_pending = max_pending
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.manager = None
+        self.pending = OrderedDict()  # target key -> (command, [futures])
+        self.desired_state = OrderedDict()  # target key -> latest command, replayed after a reconnect
+        self.queries = deque()  # (func, future) pairs to run against the manager
+        self.held = 0
+        self.batch_turn = None  # traced turn of the latest command, which the next batch is timed in
+        self.condition = threading.Condition()
+        self.running = True
+        self.dropped = 0
+        self.connections = 0
+
+        self.thread = threading.Thread(target=self._run, name='obs-dispatcher', daemon=True)
+        self.thread.start()
+
+    def set_source_visibility(self, scene_name, source_name, source_visible=True):
+        """Show or hide a source. Returns a Future that can be ignored."""
+        return self.submit(('visibility', scene_name, source_name), source_visible)
+
+    def set_filter_visibility(self, source_name, filter_name, filter_enabled=True):
+        """Enable or disable a filter. Returns a Future that can be ignored."""
+        return self.submit(('filter', source_name, filter_name), filter_enabled)
+
+    def set_source_transform(self, scene_name, source_name, new_transform):
+        """Set a source's transform. Returns a Future that can be ignored."""
+        return self.submit(('transform', scene_name, source_name), new_transform)
+
+    def set_scene(self, new_scene):
+        """Switch the program scene. Returns a Future that can be ignored."""
+        return self.submit(('scene',), new_scene)
+
+    def query(self, func):
+        """Run func(manager) on the dispatcher thread, e.g. to read state from OBS. Returns a Future."""
+        future = Future()
+        with self.condition:
+            self.queries.append((func, future))
+            self.condition.notify()
+        return future
+
+    @contextmanager
+    def hold(self):
+        """Hold back sending until the block exits, so every command submitted inside goes in one batch."""
+        with self.condition:
+            self.held += 1
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.held -= 1
+                self.condition.notify()
+
+    def submit(self, key, value):
+        """Queue the latest value for a target, replacing anything still pending for it."""
+        future = Future()
+        with self.condition:
+            if not self.running:
+                future.set_exception(RuntimeError("OBS dispatcher has been stopped"))
+                return future
+
+            futures = [future]
+            if key in self.pending:
+                # Coalesce: whoever waited on the older command is answered by this one
+                futures = self.pending.pop(key)[1] + futures
+            elif len(self.pending) >= self.max_pending:
+                _, (_, dropped_futures) = self.pending.popitem(last=False)
+                self.dropped += 1
+                for dropped_future in dropped_futures:
+                    _fail(dropped_future, RuntimeError("OBS command dropped, queue full"))
+
+            self.pending[key] = (value, futures)
+            self.batch_turn = tracing.current_turn()
+            self.desired_state[key] = value
+            self.desired_state.move_to_end(key)
+            self.condition.notify()
+        return future
+
+    def stop(self, timeout=1.0):
+        """Give pending commands a moment to go out, then stop the thread and disconnect."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.pending and self.manager and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout)
+        if self.manager:
+            try:
+                self.manager.disconnect()
+            except Exception:
+                pass
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'connected': self.manager is not None,
+                'pending': len(self.pending),
+                'dropped': self.dropped,
+                'reconnects': max(self.connections - 1, 0),
+            }
+
+    def _run(self):
+        backoff = self.initial_backoff
+        while True:
+            if self.manager is None:
+                if not self._connect():
+                    with self.condition:
+                        self.condition.wait(backoff)
+                        if not self.running:
+                            return
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                backoff = self.initial_backoff
+
+            with self.condition:
+                while self.running and not self.queries and (not self.pending or self.held):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                queries, self.queries = self.queries, deque()
+                batch = OrderedDict()
+                if not self.held:
+                    batch, self.pending = self.pending, OrderedDict()
+                    tracing.set_turn(self.batch_turn)
+
+            try:
+                self._run_queries(queries)
+                if batch:
+                    self._send(batch)
+            except CONNECTION_ERRORS as e:
+                print(f"[red]Lost connection to OBS, reconnecting: {e}[/red]")
+                tracing.count('obs.connection_lost')
+                self._drop_connection()
+                with self.condition:
+                    self.queries.extendleft(reversed(queries))
+                    # Replay the failed commands first unless something newer replaced them meanwhile
+                    for key, (value, futures) in batch.items():
+                        futures = [future for future in futures if not future.done()]
+                        if key in self.pending:
+                            self.pending[key][1][:0] = futures
+                        else:
+                            self.pending[key] = (value, futures)
+                            self.pending.move_to_end(key, last=False)
+            except Exception as e:
+                # A bug here must not kill the thread, or every later command would wait forever
+                print(f"[red]Error sending OBS commands: {e!r}[/red]")
+                tracing.count('obs.dispatch_error')
+                error = RuntimeError(f"OBS dispatcher failed: {e!r}")
+                for _, future in queries:
+                    _fail(future, error)
+                for _, futures in batch.values():
+                    for future in futures:
+                        _fail(future, error)
+            finally:
+                with self.condition:
+                    self.condition.notify_all()
+
+    def _connect(self):
+        try:
+            with tracing.span('obs.connect'):
+                self.manager = self.connect()
+        except Exception as e:
+            print(f"[yellow]Could not connect to OBS: {e}[/yellow]")
+            return False
+
+        with self.condition:
+            if self.connections:
+                tracing.count('obs.reconnect')
+                # Put OBS back in the state we last asked for, the newest pending values win
+                replay = OrderedDict((key, (value, [])) for key, value in self.desired_state.items())
+                for key, (value, futures) in self.pending.items():
+                    replay[key] = (value, futures)
+                self.pending = replay
+            self.connections += 1
+        return True
+
+    def _drop_connection(self):
+        manager, self.manager = self.manager, None
+        try:
+            manager.disconnect()
+        except Exception:
+            pass
+
+    def _run_queries(self, queries):
+        while queries:
+            func, future = queries[0]
+            try:
+                result = func(self.manager)
+            except CONNECTION_ERRORS:
+                raise
+            except Exception as e:
+                _fail(future, e)
+            else:
+                _resolve(future, result)
+            queries.popleft()
+
+    def _send(self, batch):
+        manager = self.manager
+        keys = []
+        batch_requests = []
+        for key, (value, futures) in list(batch.items()):
+            try:
+                batch_requests.append(self._build_request(manager, key, value))
+                keys.append(key)
+            except (KeyError, ValueError) as e:
+                # e.g. the source doesn't exist in that scene, so don't replay it after reconnects either
+                with self.condition:
+                    if self.desired_state.get(key) == value:
+                        del self.desired_state[key]
+                # Answered now, so it mustn't be queued again if the send below loses the connection
+                del batch[key]
+                for future in futures:
+                    _fail(future, RuntimeError(f"Could not build OBS {key[0]} command: {e}"))
+
+        with tracing.span('obs.batch', requests=len(batch_requests)):
+            results = manager.call_batch(batch_requests)
+
+        for index, key in enumerate(keys):
+            futures = batch[key][1]
+            result = results[index] if index < len(results) else None
+            status = result.get('requestStatus', {}) if result else {}
+            for future in futures:
+                if status.get('result'):
+                    _resolve(future, result.get('responseData'))
+                else:
+                    _fail(future, RuntimeError(f"OBS rejected {key[0]} command: {status.get('comment', 'no result')}"))
+
+    def _build_request(self, manager, key, value):
+        kind = key[0]
+        if kind == 'visibility':
+            return manager.source_visibility_request(key[1], key[2], value)
+        if kind == 'filter':
+            return manager.filter_visibility_request(key[1], key[2], value)
+        if kind == 'transform':
+            return manager.source_transform_request(key[1], key[2], value)
+        if kind == 'scene':
+            return requests.SetCurrentProgramScene(sceneName=value)
+        raise ValueError(f"Unknown OBS command kind: {kind}")
@@ -1,39 +1,136 @@
-from obswebsocket import obsws, requests
+from obswebsocket import obsws, requests, events, exceptions
+import json
+import os
+import threading
+
+class BatchingObsws(obsws):
+    """obsws client that also understands RequestBatch responses, which obs-websocket-py drops."""
+
+    def _auth(self):
+        super()._auth()
+
+        # Runs before the receive thread starts, so no batch response can slip past
+        recv = self.ws.recv
+
+        def recv_with_batches():
+            message = recv()
+            if message:
+                result = json.loads(message)
+                if result.get('op') == 9:  # RequestBatchResponse
+                    request_id = result['d']['requestId']
+                    if request_id in self.events:
+                        self.answers[request_id] = result['d']
+                        self.events[request_id].set()
+                    # The receive thread skips empty messages
+                    return ''
+            return message
+
+        self.ws.recv = recv_with_batches
+
+    def call_batch(self, batch, halt_on_failure=False):
+        """Send several requests as one RequestBatch and return their results in order."""
+        message_id = f'batch-{self.id}'
+        self.id += 1
+        event = threading.Event()
+        self.events[message_id] = event
+
+        payload = {
+            "op": 8,
+            "d": {
+                "requestId": message_id,
+                "haltOnFailure": halt_on_failure,
+                "executionType": 0,  # SerialRealtime
+                "requests": [
+                    {"requestType": request.name, "requestData": request.data()}
+                    for request in batch
+                ]
+            }
+        }
+        self.ws.send(json.dumps(payload))
+        event.wait(self.timeout)
+        self.events.pop(message_id)
+        if message_id not in self.answers:
+            raise exceptions.MessageTimeout(f"No answer for request batch {message_id}")
+        return self.answers.pop(message_id)['results']
 
 class OBSWebsocketsManager:
-    def __init__(self, host, port, password):
+    def __init__(self, host, port, password, timeout=60):
         """Initialize and connect to OBS WebSocket."""
-        self.obs = obsws(host, port, password)
+        self.obs = BatchingObsws(host, port, password, timeout=timeout)
+        self.scene_item_ids = {}  # (scene_name, source_name) -> sceneItemId
+        self.obs.register(self.on_scene_items_changed, events.SceneItemCreated)
+        self.obs.register(self.on_scene_items_changed, events.SceneItemRemoved)
+        self.obs.register(self.on_scene_items_changed, events.SceneItemListReindexed)
         self.obs.connect()
 
+    @classmethod
+    def from_config(cls, config):
+        """Connect using the OBS_WEBSOCKET_* environment variables and config.yaml's obs section."""
+        password = os.getenv("OBS_WEBSOCKET_PASSWORD") if os.getenv("USE_OBS_WEBSOCKET_PASSWORD", "0") == "1" else None
+        return cls(
+            host=os.getenv("OBS_WEBSOCKET_URL"),
+            port=int(os.getenv("OBS_WEBSOCKET_PORT", 4455)),
+            password=password,
+            timeout=config['obs'].get('timeout', 5)
+        )
+
     def disconnect(self):
         """Disconnect from OBS WebSocket."""
         self.obs.disconnect()
 
+    def on_scene_items_changed(self, event):
+        """Forget cached scene item IDs for a scene whose items changed."""
+        scene_name = event.datain.get('sceneName')
+        for key in list(self.scene_item_ids):
+            if scene_name is None or key[0] == scene_name:
+                self.scene_item_ids.pop(key, None)
+
+    def get_scene_item_id(self, scene_name, source_name):
+        """Get the ID of a source in a scene, only asking OBS the first time."""
+        key = (scene_name, source_name)
+        item_id = self.scene_item_ids.get(key)
+        if item_id is None:
+            resp = self.obs.call(requests.GetSceneItemId(
+                sceneName=scene_name,
+                sourceName=source_name
+            ))
+            item_id = resp.datain['sceneItemId']
+            self.scene_item_ids[key] = item_id
+        return item_id
+
+    def call_batch(self, batch, halt_on_failure=False):
+        """Send a list of requests to OBS in a single RequestBatch round trip."""
+        if not batch:
+            return []
+        return self.obs.call_batch(batch, halt_on_failure)
+
     def set_scene(self, new_scene):
         """Set the current scene in OBS."""
         self.obs.call(requests.SetCurrentProgramScene(sceneName=new_scene))
 
-    def set_filter_visibility(self, source_name, filter_name, filter_enabled=True):
-        """Set the visibility of a filter on a source."""
-        self.obs.call(requests.SetSourceFilterEnabled(
+    def filter_visibility_request(self, source_name, filter_name, filter_enabled=True):
+        """Build the request that enables or disables a filter, for use with call_batch."""
+        return requests.SetSourceFilterEnabled(
             sourceName=source_name,
             filterName=filter_name,
             filterEnabled=filter_enabled
-        ))
+        )
 
-    def set_source_visibility(self, scene_name, source_name, source_visible=True):
-        """Set the visibility of a source in a specific scene."""
-        resp = self.obs.call(requests.GetSceneItemId(
-            sceneName=scene_name,
-            sourceName=source_name
-        ))
-        item_id = resp.datain['sceneItemId']
-        self.obs.call(requests.SetSceneItemEnabled(
+    def set_filter_visibility(self, source_name, filter_name, filter_enabled=True):
+        """Set the visibility of a filter on a source."""
+        self.obs.call(self.filter_visibility_request(source_name, filter_name, filter_enabled))
+
+    def source_visibility_request(self, scene_name, source_name, source_visible=True):
+        """Build the request that shows or hides a source, for use with call_batch."""
+        return requests.SetSceneItemEnabled(
             sceneName=scene_name,
-            sceneItemId=item_id,
+            sceneItemId=self.get_scene_item_id(scene_name, source_name),
             sceneItemEnabled=source_visible
-        ))
+        )
+
+    def set_source_visibility(self, scene_name, source_name, source_visible=True):
+        """Set the visibility of a source in a specific scene."""
+        self.obs.call(self.source_visibility_request(scene_name, source_name, source_visible))
 
     def get_text(self, source_name):
         """Get the text of a text source."""
@@ -49,14 +146,9 @@ class OBSWebsocketsManager:
 
     def get_source_transform(self, scene_name, source_name):
         """Get the transform of a source in a scene."""
-        resp = self.obs.call(requests.GetSceneItemId(
-            sceneName=scene_name,
-            sourceName=source_name
-        ))
-        item_id = resp.datain['sceneItemId']
         resp = self.obs.call(requests.GetSceneItemTransform(
             sceneName=scene_name,
-            sceneItemId=item_id
+            sceneItemId=self.get_scene_item_id(scene_name, source_name)
         ))
         t = resp.datain['sceneItemTransform']
         return {
@@ -75,18 +167,17 @@ class OBSWebsocketsManager:
             'cropBottom': t['cropBottom'],
         }
 
-    def set_source_transform(self, scene_name, source_name, new_transform):
-        """Set the transform of a source in a scene."""
-        resp = self.obs.call(requests.GetSceneItemId(
-            sceneName=scene_name,
-            sourceName=source_name
-        ))
-        item_id = resp.datain['sceneItemId']
-        self.obs.call(requests.SetSceneItemTransform(
+    def source_transform_request(self, scene_name, source_name, new_transform):
+        """Build the request that sets a source's transform, for use with call_batch."""
+        return requests.SetSceneItemTransform(
             sceneName=scene_name,
-            sceneItemId=item_id,
+            sceneItemId=self.get_scene_item_id(scene_name, source_name),
             sceneItemTransform=new_transform
-        ))
+        )
+
+    def set_source_transform(self, scene_name, source_name, new_transform):
+        """Set the transform of a source in a scene."""
+        self.obs.call(self.source_transform_request(scene_name, source_name, new_transform))
 
     def get_input_settings(self, input_name):
         """Get settings for a specific input."""
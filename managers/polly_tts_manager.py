@@ -1,121 +1,169 @@
-import boto3
 import os
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from . import tracing
+from .ssml import compile_ssml, compile_ssml_chunks
 
 class PollyTTSManager:
-    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name='us-east-1', engine='standard'):
+    output_formats = ('mp3', 'ogg_vorbis', 'pcm')
+
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name='us-east-1', engine='standard', cache=None, max_workers=4, endpoint_url=None,
+                 max_attempts=None, timeout=None):
+        """max_attempts and timeout (seconds) override botocore's retries and connect/read timeouts."""
         self.engine = engine
+        self.region_name = region_name
+        self.cache = cache
+        # boto3 clients are thread safe; the connection pool is sized so parallel chunks don't queue for a socket
+        client_config = Config(max_pool_connections=max_workers)
+        if max_attempts:
+            client_config = client_config.merge(Config(retries={'total_max_attempts': max_attempts}))
+        if timeout:
+            client_config = client_config.merge(Config(connect_timeout=timeout, read_timeout=timeout))
         self.polly = boto3.client(
             'polly',
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
-            region_name=region_name
+            region_name=region_name,
+            endpoint_url=endpoint_url,
+            config=client_config
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='polly')
+
+    @classmethod
+    def from_config(cls, config, cache=None):
+        """Build the manager from config.yaml's tts section and the AMAZON_POLLY_* variables."""
+        dispatch_config = config['tts'].get('dispatch', {})
+        dispatched = dispatch_config.get('enabled', False)
+        return cls(
+            aws_access_key_id=os.getenv("AMAZON_POLLY_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AMAZON_POLLY_SECRET_ACCESS_KEY"),
+            region_name=config['tts']['region'],
+            engine=config['tts']['engine'],
+            cache=cache,
+            max_workers=config['tts'].get('max_workers', 4),
+            endpoint_url=config['tts'].get('endpoint_url') or os.getenv("AMAZON_POLLY_ENDPOINT_URL"),
+            # The dispatcher hands a failed or stalled request to the other provider; retrying it here would only delay that
+            max_attempts=1 if dispatched else None,
+            timeout=dispatch_config.get('deadline', 4.0) if dispatched else None
         )
 
     def format_text(self, text):
-        emotions = {
-            'high': ['<prosody pitch="+30%">', '</prosody>'],
-            'higher': ['<amazon:effect vocal-tract-length="-80%">', '</amazon:effect>'],
-            'deep': ['<prosody pitch="-30%">', '</prosody>'],
-            'deeper': ['<amazon:effect vocal-tract-length="+80%">', '</amazon:effect>'],
-            'drunk': ['<prosody rate="x-slow">', '</prosody>'],
-            'asthma': ['<amazon:auto-breaths volume="x-loud" frequency="x-high" duration="x-short">', '</amazon:auto-breaths>'],
-            'soft': ['<prosody volume="x-soft">', '</prosody>'],
-            'loud': ['<prosody volume="x-loud">', '</prosody>'],
-            'whisper': ['<amazon:effect name="whispered">', '</amazon:effect>'],
-            'breath': '<amazon:breath duration="x-long" volume="x-loud"/>',
+        """Turn (emotion) markers into a single SSML document."""
+        return compile_ssml(text)
+
+    def text_to_speech(self, text, output_path=None, format_text=True, voice_id='Joanna', output_format='mp3'):
+        """Synthesize text and return the audio bytes, or write them to output_path and return the path."""
+        documents = compile_ssml_chunks(text) if format_text else [text]
+        if len(documents) == 1:
+            audio = self.synthesize(documents[0], voice_id, output_format)
+        else:
+            # Long replies are split to stay under Polly's input limit; the pieces are synthesized
+            # concurrently and MP3/PCM frames can simply be joined back together in order
+            futures = [self.executor.submit(tracing.bind(self.synthesize), document, voice_id, output_format) for document in documents]
+            pieces = [future.result() for future in futures]
+            audio = b''.join(pieces) if all(pieces) else None
+
+        if audio is None:
+            return None
+        return self.write_audio(audio, output_path)
+
+    def synthesize(self, text, voice_id='Joanna', output_format='mp3', sample_rate=None):
+        """Synthesize one SSML (or plain text) document and return the audio bytes, using the cache if there is one."""
+        cache_key = self._cache_key(text, voice_id, output_format, sample_rate)
+        if cache_key:
+            audio = self.cache.get(cache_key)
+            if audio is not None:
+                return audio
+
+        with tracing.span('tts.polly', format=output_format, chars=len(text)):
+            audio_stream = self._request(text, voice_id, output_format, sample_rate)
+            if not audio_stream:
+                return None
+            tracing.mark('tts.first_byte')
+            audio = audio_stream.read()
+        if cache_key:
+            self.cache.put(cache_key, audio)
+        return audio
+
+    def stream_pcm(self, text, format_text=True, voice_id='Joanna', sample_rate=16000, chunk_size=6400):
+        """Synthesize text as 16-bit mono PCM, yielding chunks while the download is still in progress."""
+        if sample_rate not in (8000, 16000):
+            raise ValueError(f"Polly only produces PCM at 8000 or 16000 Hz, not {sample_rate}")
+        yield from self.stream_audio(text, format_text, voice_id, 'pcm', sample_rate, chunk_size)
+
+    def stream_audio(self, text, format_text=True, voice_id='Joanna', output_format='mp3', sample_rate=None, chunk_size=6400):
+        """Synthesize text, yielding the audio in chunks while the download is still in progress."""
+        documents = compile_ssml_chunks(text) if format_text else [text]
+        # Later documents download in the background while the first one streams
+        later = [self.executor.submit(tracing.bind(self.synthesize), document, voice_id, output_format, sample_rate) for document in documents[1:]]
+        try:
+            yield from self._stream_document(documents[0], voice_id, output_format, sample_rate, chunk_size)
+            for future in later:
+                audio = future.result()
+                if audio:
+                    yield audio
+        finally:
+            for future in later:
+                future.cancel()
+
+    def _stream_document(self, text, voice_id, output_format, sample_rate, chunk_size):
+        cache_key = self._cache_key(text, voice_id, output_format, sample_rate)
+        if cache_key:
+            audio = self.cache.get(cache_key)
+            if audio is not None:
+                yield audio
+                return
+
+        audio_stream = self._request(text, voice_id, output_format, sample_rate)
+        if not audio_stream:
+            return
+
+        chunks = []
+        remainder = b''
+        for chunk in audio_stream.iter_chunks(chunk_size):
+            if not chunks:
+                tracing.mark('tts.first_byte')
+            chunks.append(chunk)
+            if output_format != 'pcm':
+                yield chunk
+                continue
+            chunk = remainder + chunk
+            # Only hand out whole 16-bit samples
+            usable = len(chunk) - (len(chunk) % 2)
+            remainder = chunk[usable:]
+            if usable:
+                yield chunk[:usable]
+
+        if cache_key:
+            self.cache.put(cache_key, b''.join(chunks))
+
+    def _cache_key(self, text, voice_id, output_format, sample_rate=None):
+        if not self.cache:
+            return None
+        if sample_rate:
+            output_format = f'{output_format}-{sample_rate}'
+        return self.cache.make_key(f'polly-{self.engine}', voice_id, output_format, self.region_name, text)
+
+    def _request(self, text, voice_id, output_format, sample_rate=None):
+        params = {
+            'Text': text,
+            'VoiceId': voice_id,
+            'OutputFormat': output_format,
+            'TextType': 'ssml' if text.strip().startswith('<speak>') else 'text',
+            'Engine': self.engine,
         }
+        if sample_rate:
+            params['SampleRate'] = str(sample_rate)
+        return self.polly.synthesize_speech(**params).get('AudioStream')
 
-        import re
-        
-        # Separate emotion markers and normal text
-        parts = []
-        last_end = 0
-        
-        # Find all emotion markers in the text
-        for match in re.finditer(r'\((\w+)\)', text):
-            # Add text before this marker
-            if match.start() > last_end:
-                parts.append({
-                    'type': 'text',
-                    'content': text[last_end:match.start()]
-                })
-            
-            # Add the marker
-            emotion = match.group(1).lower()
-            # Handle special '(normal)' to close current effects
-            if emotion == 'normal':
-                parts.append({'type': 'emotion', 'emotion': 'normal'})
-            elif emotion in emotions:
-                parts.append({
-                    'type': 'emotion',
-                    'emotion': emotion
-                })
-            
-            last_end = match.end()
-        
-        # Add any remaining text after the last marker
-        if last_end < len(text):
-            parts.append({
-                'type': 'text',
-                'content': text[last_end:]
-            })
-        
-        # Process the parts to build the final SSML
-        result = []
-        current_effect = None
-        
-        for i, part in enumerate(parts):
-            if part['type'] == 'text':
-                result.append(part['content'])
-            elif part['type'] == 'emotion':
-                emotion = part['emotion']
-                # If 'normal', close any active effect and return to normal speech
-                if emotion == 'normal':
-                    if current_effect:
-                        result.append(emotions[current_effect][1])
-                        current_effect = None
-                # Standard SSML effect
-                elif emotion in emotions:
-                    if isinstance(emotions[emotion], list):
-                        # If we have an active effect, close it
-                        if current_effect:
-                            result.append(emotions[current_effect][1])
-                        # Open the new effect
-                        result.append(emotions[emotion][0])
-                        current_effect = emotion
-                    else:
-                        # Single tag like breath
-                        result.append(emotions[emotion])
-        
-        # Close the last effect if one is open
-        if current_effect:
-            result.append(emotions[current_effect][1])
-        
-        # Join the result and wrap in SSML tags
-        return f'<speak>{"".join(result)}</speak>'
+    def write_audio(self, audio, output_path=None):
+        """Write audio bytes to output_path if one is given, otherwise hand the bytes back."""
+        if not output_path:
+            return audio
 
-    def text_to_speech(self, text, output_path=None, format_text=True, voice_id='Joanna', output_format='mp3'):
-        if format_text:
-            text = self.format_text(text)
-        response = self.polly.synthesize_speech(
-            Text=text,
-            VoiceId=voice_id,
-            OutputFormat=output_format,
-            TextType='ssml' if text.strip().startswith('<speak>') else 'text',
-            Engine=self.engine
-        )
-        audio_stream = response.get('AudioStream')
-        if audio_stream:
-            if output_path:
-                with open(output_path, 'wb') as f:
-                    f.write(audio_stream.read())
-                return output_path
-            else:
-                fd, output_path = tempfile.mkstemp(dir=os.path.join(os.path.dirname(__file__), '..', 'audio'), prefix='polly_', suffix=f'.{output_format}')
-                os.close(fd)
-
-                with open(output_path, 'wb') as f:
-                    f.write(audio_stream.read())
-            return output_path
-        return None
\ No newline at end of file
+        with open(output_path, 'wb') as f:
+            f.write(audio)
+        return output_path
@@ -1,16 +1,220 @@
 import pygame
+import asyncio
+import io
 import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from . import tracing
+
+class Playback:
+    def __init__(self, stop, fade):
+        """Handle for a sound, or a queue of sounds, playing on a mixer channel."""
+        self._stop = stop
+        self._fade = fade
+        self.finished = threading.Event()
+        self.interrupted = False
+        # (Sound, perf_counter time it started) for the clip playing now, None before the first one starts
+        self.clip = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def add_done_callback(self, callback):
+        """Call callback(playback) once playback ends, immediately if it already has."""
+        with self.lock:
+            if not self.done:
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """Block until playback ends. Returns False if the timeout expired first."""
+        return self.finished.wait(timeout)
+
+    def __await__(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(playback):
+            if not future.done():
+                future.set_result(playback)
+
+        self.add_done_callback(lambda playback: loop.call_soon_threadsafe(resolve, playback))
+        return future.__await__()
+
+    def stop(self):
+        """Cut playback off immediately."""
+        if not self.done:
+            self.interrupted = True
+            self._stop()
+
+    def fade(self, fade_ms):
+        """Fade playback out over fade_ms milliseconds."""
+        if not self.done:
+            self.interrupted = True
+            self._fade(fade_ms)
+
+    def _start_clip(self, sound):
+        self.clip = (sound, time.perf_counter())
+
+    def _finish(self):
+        with self.lock:
+            if self.done:
+                return
+            self.finished.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+class SoundBank:
+    AUDIO_EXTENSIONS = ('.wav', '.ogg', '.mp3', '.flac')
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        """Short clips kept decoded in memory, the least recently played evicted once they pass max_bytes.
+
+        An evicted clip is decoded from its file again the next time it is asked for.
+        """
+        self.max_bytes = max_bytes
+        self.paths = {}  # Every clip the bank knows, by name
+        self.sounds = OrderedDict()  # Decoded clips as name -> (Sound, bytes), least recently used first
+        self.bytes = 0
+        self.last_picked = None
+        self.lock = threading.Lock()
+        self.stats = {'loads': 0, 'evictions': 0}
+        self.frequency, size, channels = pygame.mixer.get_init()
+        self.frame_bytes = abs(size) // 8 * channels
+
+    def load_directory(self, directory):
+        """Add and decode every audio file in directory, named after the file without its extension"""
+        count = 0
+        for filename in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(filename)
+            if extension.lower() in self.AUDIO_EXTENSIONS:
+                self.add(name, os.path.join(directory, filename))
+                count += 1
+        return count
+
+    def add(self, name, path):
+        """Add a clip by file path and decode it"""
+        self.paths[name] = path
+        return self._load(name)
+
+    def get(self, name):
+        """Get a clip's Sound, decoding it again if it was evicted"""
+        with self.lock:
+            entry = self.sounds.get(name)
+            if entry:
+                self.sounds.move_to_end(name)
+                return entry[0]
+        if name not in self.paths:
+            raise FileNotFoundError(f"Clip '{name}' is not in the sound bank")
+        return self._load(name)
+
+    def pick(self):
+        """Name of a random clip, other than the last one picked when there is a choice
+
+        Evicted clips are picked as often as decoded ones; get() decodes them again.
+        """
+        with self.lock:
+            names = list(self.paths)
+            if len(names) > 1 and self.last_picked in names:
+                names.remove(self.last_picked)
+            if not names:
+                return None
+            self.last_picked = random.choice(names)
+            return self.last_picked
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'clips': len(self.paths),
+                'decoded': len(self.sounds),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'loads': self.stats['loads'],
+                'evictions': self.stats['evictions'],
+            }
+
+    def _load(self, name):
+        with tracing.span('audio.decode'):
+            sound = pygame.mixer.Sound(self.paths[name])
+        # Decoded samples at the mixer's format; cheaper than copying them out with get_raw()
+        size = round(sound.get_length() * self.frequency) * self.frame_bytes
+        with self.lock:
+            self.stats['loads'] += 1
+            if size > self.max_bytes:
+                # Still playable this once, just never kept
+                return sound
+            if name in self.sounds:
+                self.bytes -= self.sounds.pop(name)[1]
+            self.sounds[name] = (sound, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.sounds.popitem(last=False)
+                self.bytes -= evicted_size
+                self.stats['evictions'] += 1
+        return sound
 
 class PygameAudioManager:
-    def __init__(self):
-        pygame.mixer.init()
-        self.audio_files = {}  # Dictionary to store audio files by their relative path
+    def __init__(self, frequency=None, channels=None):
+        mixer_settings = {}
+        if frequency:
+            mixer_settings['frequency'] = frequency
+        if channels:
+            mixer_settings['channels'] = channels
+        pygame.mixer.init(**mixer_settings)
+        self.frequency, _, self.channels = pygame.mixer.get_init()
+        self.audio_files = {}  # Dictionary to store audio files by their relative path (or ID for buffers)
+        self.buffer_ids = set()  # IDs of sounds loaded from memory rather than from a file
         self.current_sound = None
 
-    def load_audio(self, file_path):
-        """Load a single audio file and store it in the dictionary"""
-        sound = pygame.mixer.Sound(file_path)
-        self.audio_files[file_path] = sound
+        # Reserve a channel for queued playback so one-shot sounds never steal it
+        pygame.mixer.set_reserved(1)
+        self.queue_channel = pygame.mixer.Channel(0)
+        self.playback_queue = deque()
+        self.queue_lock = threading.Lock()
+        self.queue_idle = threading.Event()
+        self.queue_idle.set()
+        self.queue_thread = None
+        self.queue_playback = None
+
+        # One-shot playbacks watched for completion by a single monitor thread
+        self.active_playbacks = []
+        self.monitor_lock = threading.Lock()
+        self.monitor_thread = None
+
+        # Filler clips play from a sound bank on a channel of their own, see load_sound_bank
+        self.sound_bank = None
+        self.filler_channel = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the manager from config.yaml's tts section."""
+        # Progressive playback feeds Polly's PCM straight into the mixer, which only works at a rate Polly can produce
+        return cls(frequency=16000 if config['tts'].get('progressive', False) else None)
+
+    def load_audio(self, source, audio_id=None):
+        """Load an audio file path, bytes or file-like buffer and store it in the dictionary"""
+        if isinstance(source, str):
+            audio_id = audio_id or source
+            with tracing.span('audio.decode'):
+                sound = pygame.mixer.Sound(source)
+        else:
+            if audio_id is None:
+                raise ValueError("audio_id is required when loading audio from memory")
+            if isinstance(source, bytes):
+                # BytesIO shares the bytes object's memory until written to, so this doesn't copy
+                source = io.BytesIO(source)
+            with tracing.span('audio.decode'):
+                sound = pygame.mixer.Sound(file=source)
+            self.buffer_ids.add(audio_id)
+        self.audio_files[audio_id] = sound
         return sound
     
     def get_audio_length(self, file_path=None):
@@ -31,16 +235,160 @@ class PygameAudioManager:
         for file_path in file_paths:
             self.load_audio(file_path)
 
-    def play_audio(self, file_path=None):
-        """Play audio by file path (ID) or play the current sound if no path specified"""
+    def play_audio(self, file_path=None, on_end=None):
+        """Play audio by file path (ID) or play the current sound if no path specified, returning a Playback"""
         if file_path:
             if file_path in self.audio_files:
                 self.current_sound = self.audio_files[file_path]
-                self.current_sound.play()
             else:
                 raise FileNotFoundError(f"Audio file '{file_path}' not loaded")
-        elif self.current_sound:
-            self.current_sound.play()
+        elif not self.current_sound:
+            return None
+
+        sound = self.current_sound
+        channel = sound.play()
+        if channel is None:
+            # Every channel is busy, so the sound was dropped
+            playback = Playback(stop=lambda: None, fade=lambda fade_ms: None)
+            playback._finish()
+        else:
+            playback = self._watch(channel, sound)
+            playback._start_clip(sound)
+        if on_end:
+            playback.add_done_callback(on_end)
+        return playback
+
+    def load_sound_bank(self, directory, max_bytes=16 * 1024 * 1024):
+        """Preload a directory of short clips (e.g. fillers) into a SoundBank kept decoded within max_bytes"""
+        sound_bank = SoundBank(max_bytes)
+        sound_bank.load_directory(directory)
+        if self.filler_channel is None:
+            # A second reserved channel, so neither a filler nor the queue ever cuts off the other
+            pygame.mixer.set_reserved(2)
+            self.filler_channel = pygame.mixer.Channel(1)
+        self.sound_bank = sound_bank
+        return sound_bank
+
+    def play_filler(self, name=None, on_end=None):
+        """Play a sound bank clip (a random one if no name is given) on the filler channel, returning a Playback"""
+        if self.sound_bank is None:
+            raise RuntimeError("No sound bank loaded, call load_sound_bank first")
+        name = name or self.sound_bank.pick()
+        if name is None:
+            return None
+        sound = self.sound_bank.get(name)
+        self.filler_channel.play(sound)
+        playback = self._watch(self.filler_channel, sound)
+        playback._start_clip(sound)
+        if on_end:
+            playback.add_done_callback(on_end)
+        return playback
+
+    def _watch(self, channel, sound):
+        """Return a Playback for sound on channel, finished by the monitor thread once the channel moves on"""
+        playback = Playback(stop=channel.stop, fade=channel.fadeout)
+        with self.monitor_lock:
+            self.active_playbacks.append((playback, channel, sound))
+            if self.monitor_thread is None:
+                self.monitor_thread = threading.Thread(target=self._monitor_playbacks, daemon=True)
+                self.monitor_thread.start()
+        return playback
+
+    def _monitor_playbacks(self):
+        """Finish each one-shot playback as soon as its channel stops playing its sound"""
+        while True:
+            with self.monitor_lock:
+                still_playing = []
+                finished = []
+                for entry in self.active_playbacks:
+                    playback, channel, sound = entry
+                    if channel.get_busy() and channel.get_sound() is sound:
+                        still_playing.append(entry)
+                    else:
+                        finished.append(playback)
+                self.active_playbacks = still_playing
+                if not still_playing:
+                    self.monitor_thread = None
+            for playback in finished:
+                playback._finish()
+            if not still_playing:
+                return
+            time.sleep(0.005)
+
+    def queue_audio(self, file_path):
+        """Queue a loaded audio file to play gaplessly after anything already queued, returning the queue's Playback"""
+        if file_path not in self.audio_files:
+            raise FileNotFoundError(f"Audio file '{file_path}' not loaded")
+
+        return self._enqueue(self.audio_files[file_path])
+
+    def queue_pcm(self, pcm):
+        """Queue raw 16-bit mono PCM at the mixer's sample rate, e.g. a chunk of a streaming download"""
+        if self.channels == 2:
+            # Duplicate each 2-byte sample into both channels
+            stereo = bytearray(len(pcm) * 2)
+            stereo[0::4] = pcm[0::2]
+            stereo[1::4] = pcm[1::2]
+            stereo[2::4] = pcm[0::2]
+            stereo[3::4] = pcm[1::2]
+            pcm = stereo
+        return self._enqueue(pygame.mixer.Sound(buffer=pcm))
+
+    def _enqueue(self, sound):
+        with self.queue_lock:
+            self.playback_queue.append(sound)
+            if self.queue_playback is None:
+                # Everything queued until the channel drains shares one Playback
+                self.queue_playback = Playback(stop=self.stop_queue, fade=self.fade_queue)
+            self.queue_idle.clear()
+            if self.queue_thread is None:
+                self.queue_thread = threading.Thread(target=self._pump_queue, daemon=True)
+                self.queue_thread.start()
+            return self.queue_playback
+
+    def stop_queue(self):
+        """Drop everything still queued and stop the queue channel"""
+        with self.queue_lock:
+            self.playback_queue.clear()
+            self.queue_channel.stop()
+
+    def fade_queue(self, fade_ms):
+        """Drop everything still queued and fade out what is playing"""
+        with self.queue_lock:
+            self.playback_queue.clear()
+            self.queue_channel.fadeout(fade_ms)
+
+    def wait_for_queue(self, timeout=None):
+        """Block until every queued sound has finished playing"""
+        return self.queue_idle.wait(timeout)
+
+    def _pump_queue(self):
+        """Keep the channel's one-slot queue topped up until everything has played"""
+        playing = None
+        while True:
+            with self.queue_lock:
+                # Note when each clip really starts, which gaps between streamed clips push back
+                sound = self.queue_channel.get_sound() if self.queue_channel.get_busy() else None
+                if sound is not playing:
+                    playing = sound
+                    if sound is not None and self.queue_playback:
+                        self.queue_playback._start_clip(sound)
+                if self.playback_queue and self.queue_channel.get_queue() is None:
+                    sound = self.playback_queue.popleft()
+                    self.current_sound = sound
+                    if self.queue_channel.get_busy():
+                        self.queue_channel.queue(sound)
+                    else:
+                        self.queue_channel.play(sound)
+                elif not self.playback_queue and not self.queue_channel.get_busy():
+                    playback, self.queue_playback = self.queue_playback, None
+                    self.queue_thread = None
+                    self.queue_idle.set()
+                    break
+            time.sleep(0.005)
+
+        if playback:
+            playback._finish()
 
     def is_playing(self):
         if self.current_sound:
@@ -52,10 +400,12 @@ class PygameAudioManager:
         return list(self.audio_files.keys())
 
     def unload_audio(self, file_path, remove=True):
-        """Remove an audio file from memory"""
+        """Remove an audio file from memory (and from disk, unless it was loaded from a buffer)"""
         if file_path in self.audio_files:
-            del self.audio_files[file_path]
-            if self.current_sound == self.audio_files.get(file_path):
+            sound = self.audio_files.pop(file_path)
+            if self.current_sound is sound:
                 self.current_sound = None
-            if remove:
+            if file_path in self.buffer_ids:
+                self.buffer_ids.discard(file_path)
+            elif remove:
                 os.remove(file_path)
\ No newline at end of file
@@ -2,22 +2,81 @@ from RealtimeSTT import AudioToTextRecorder
 from rich import print
 
 class SpeechToTextManager:
-    def __init__(self, model="base", language="en"):
+    def __init__(self, model="base", language="en", realtime=False, realtime_model="tiny", post_speech_silence_duration=1.0, compute_type="default", use_microphone=True):
+        """Set up the recorder. realtime=True also transcribes while the user is still talking and reports partials to on_partial.
+
+        With use_microphone=False the audio comes from feed_audio instead (e.g. recorded fixtures).
+        """
+        self.on_speech_start = None  # Set while something (e.g. playback) wants to know when the user starts talking
+        self.on_partial = None  # Set while something (e.g. speculative generation) wants the partial transcripts
+        self.on_recording_stop = None  # Set while something (e.g. a benchmark) wants to know when the recording ended
         self.recorder = AudioToTextRecorder(
             spinner=False,
             model=model,  # Use base model for better accuracy
             language=language,
+            compute_type=compute_type,
             silero_sensitivity=0.6,  # Higher sensitivity
             webrtc_sensitivity=2,  # Lower value = more sensitive
-            post_speech_silence_duration=1.0,  # Wait longer for complete speech
+            post_speech_silence_duration=post_speech_silence_duration,  # Wait longer for complete speech
             min_length_of_recording=1.0,  # Minimum 1 second of audio
             min_gap_between_recordings=0,
-            enable_realtime_transcription=False,  # Disable for process_once
-            use_microphone=True,
+            enable_realtime_transcription=realtime,
+            realtime_model_type=realtime_model,
+            on_realtime_transcription_update=self._handle_partial,
+            use_microphone=use_microphone,
             on_recording_start=lambda: print("[yellow]🎤 Recording started...[/yellow]"),
-            on_recording_stop=lambda: print("[yellow]⏹️ Recording stopped, processing...[/yellow]")
+            on_recording_stop=self._handle_recording_stop,
+            on_vad_start=self._handle_speech_start
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the manager from config.yaml's stt section."""
+        stt_config = config['stt']
+        return cls(
+            stt_config['model'],
+            stt_config['language'],
+            realtime=stt_config.get('speculation', {}).get('enabled', False),
+            realtime_model=stt_config.get('realtime_model', 'tiny'),
+            post_speech_silence_duration=stt_config.get('post_speech_silence_duration', 1.0)
         )
 
+    def _handle_speech_start(self):
+        callback = self.on_speech_start
+        if callback:
+            callback()
+
+    def _handle_recording_stop(self):
+        print("[yellow]⏹️ Recording stopped, processing...[/yellow]")
+        callback = self.on_recording_stop
+        if callback:
+            callback()
+
+    def _handle_partial(self, text):
+        callback = self.on_partial
+        if callback and text.strip():
+            callback(text.strip())
+
+    def feed_audio(self, chunk, sample_rate=16000):
+        """Feed 16-bit mono PCM to a recorder created with use_microphone=False."""
+        self.recorder.feed_audio(chunk, original_sample_rate=sample_rate)
+
+    def abort(self):
+        """Make a process_once that is still waiting for speech return without text."""
+        self.recorder.abort()
+
+    def listen_for_speech(self, on_speech_start):
+        """Arm voice activity detection ahead of process_once and call on_speech_start when the user talks.
+
+        Whatever the user says is recorded and returned by the next process_once call.
+        """
+        self.on_speech_start = on_speech_start
+        self.recorder.listen()
+
+    def stop_listening_for_speech(self):
+        """Stop reporting speech starts (the recorder stays armed for the next process_once)."""
+        self.on_speech_start = None
+
     def process_once(self):
         """Process a single text input and return the transcribed text."""
         print("[yellow]Listening... Speak now![/yellow]")
@@ -0,0 +1,65 @@
+import importlib
+
+# kind -> provider name -> 'module:Class'. Modules are only imported when a provider is first used,
+# so e.g. torch is never loaded by a box that doesn't transcribe. Every provider class has a
+# from_config(config, **kwargs) classmethod that builds it from config.yaml.
+PROVIDERS = {
+    'stt': {
+        'realtime_stt': '.realtime_stt_manager:SpeechToTextManager',
+        'irc_chat': '.chat_input:ChatInputManager',
+    },
+    'llm': {
+        'gemini': '.gemini_ai_manager:GeminiAIManager',
+    },
+    'tts': {
+        'polly': '.polly_tts_manager:PollyTTSManager',
+        'google': '.google_tts_manager:GoogleTTSManager',
+    },
+    'audio': {
+        'pygame': '.pygame_audio_manager:PygameAudioManager',
+    },
+    'scene': {
+        'obs': '.obs_websockets_manager:OBSWebsocketsManager',
+    },
+}
+
+# What config.yaml's providers section falls back to for kinds it doesn't mention
+DEFAULT_PROVIDERS = {
+    'stt': 'realtime_stt',
+    'llm': 'gemini',
+    'tts': 'polly',
+    'tts_fallback': 'google',
+    'audio': 'pygame',
+    'scene': 'obs',
+}
+
+def register_provider(kind, name, path):
+    """Register a provider under a name, as 'package.module:Class'."""
+    PROVIDERS.setdefault(kind, {})[name] = path
+
+def get_provider(kind, name):
+    """Import and return the class for a provider name, or for a 'package.module:Class' path."""
+    path = PROVIDERS.get(kind, {}).get(name)
+    if path is None:
+        if ':' not in name:
+            known = ', '.join(sorted(PROVIDERS.get(kind, {}))) or 'none'
+            raise ValueError(f"Unknown {kind} provider '{name}' (known: {known})")
+        path = name
+
+    module_name, _, class_name = path.partition(':')
+    module = importlib.import_module(module_name, __package__)
+    try:
+        return getattr(module, class_name)
+    except AttributeError:
+        raise ValueError(f"{module_name} has no {kind} provider class {class_name}")
+
+def get_provider_name(config, kind):
+    """Get the provider config.yaml selects for a kind (None if it is switched off)."""
+    return config.get('providers', {}).get(kind, DEFAULT_PROVIDERS.get(kind))
+
+def create_provider(config, kind, **kwargs):
+    """Build the provider config.yaml selects for a kind, or return None if it is switched off."""
+    name = get_provider_name(config, kind)
+    if not name:
+        return None
+    return get_provider(kind.removesuffix('_fallback'), name).from_config(config, **kwargs)
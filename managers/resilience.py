@@ -0,0 +1,307 @@
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from . import tracing
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        """Stop calling something that keeps failing, then let a single probe through every reset_timeout.
+
+        After failure_threshold failures in a row the breaker opens and allow() says no.
+        Once reset_timeout has passed it is half-open: one caller gets through, and its
+        success closes the breaker again while a failure reopens it for another timeout.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def allow(self):
+        """Whether a call may go ahead now. A half-open breaker allows one call at a time."""
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def available(self):
+        """Whether allow() would say yes, without claiming a half-open breaker's probe."""
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not self.probing
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                    tracing.count(f'breaker.{self.name}.open')
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def get_stats(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, 'trips': self.trips}
+
+class LatencyTracker:
+    def __init__(self, window=100, min_samples=10):
+        """Recent latencies of one operation, for picking timeouts and hedge delays."""
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def quantile(self, q, default=None):
+        """Nearest-rank quantile of the recent samples, or default until there are min_samples."""
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return default
+            values = sorted(self.samples)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+def backoff_delay(attempt, base=0.25, cap=4.0):
+    """Full-jitter exponential backoff: a random delay up to base * 2**attempt, at most cap."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class _Attempt:
+    _DONE = object()
+
+    def __init__(self, open_stream, events, index=0):
+        """Run open_stream() on a daemon thread, buffering its items; tells events about the first item or the error."""
+        self.index = index
+        self.items = queue.Queue()
+        self.cancelled = threading.Event()
+        self.started_at = time.perf_counter()
+        self.first_item_at = None
+        self.error = None
+        self.thread = threading.Thread(target=tracing.bind(self._run), args=(open_stream, events), daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __iter__(self):
+        while True:
+            item = self.items.get()
+            if item is self._DONE:
+                break
+            yield item
+        if self.error:
+            raise self.error
+
+    def _run(self, open_stream, events):
+        first = True
+        try:
+            stream = open_stream()
+            try:
+                for item in stream:
+                    if self.cancelled.is_set():
+                        return
+                    self.items.put(item)
+                    if first:
+                        first = False
+                        self.first_item_at = time.perf_counter()
+                        events.put((self, None))
+            finally:
+                # Stops reading the response, which drops the request if it was abandoned
+                close = getattr(stream, 'close', None)
+                if close:
+                    close()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.items.put(self._DONE)
+            if first:
+                # Finished without a single item: report the error (or an empty reply) as this attempt's result
+                events.put((self, self.error or RuntimeError("Received an empty response")))
+
+def race(openers, timeout, hedge_after=None, name='llm', fallback=False):
+    """Start openers[0]() and, each time hedge_after seconds pass without a first item, the next opener alongside it.
+
+    With fallback=True the next opener is also started as soon as every running attempt
+    has failed. Returns the attempt (an iterator over the items, whose index says which
+    opener it came from) that produced its first item first and cancels the others.
+    Raises the error of the last attempt to fail, or DeadlineExceeded if nothing arrived
+    within timeout. Hedges are counted as {name}.hedge.
+    """
+    events = queue.Queue()
+    started_at = time.perf_counter()
+    deadline = started_at + timeout
+    attempts = [_Attempt(openers[0], events)]
+    hedge_at = started_at + hedge_after if hedge_after is not None and len(openers) > 1 else None
+    failed = 0
+    winner = None
+
+    try:
+        while True:
+            wait_until = min(deadline, hedge_at) if hedge_at else deadline
+            try:
+                attempt, error = events.get(timeout=max(0.0, wait_until - time.perf_counter()))
+            except queue.Empty:
+                if hedge_at and time.perf_counter() >= hedge_at and time.perf_counter() < deadline:
+                    tracing.count(f'{name}.hedge')
+                    attempts.append(_Attempt(openers[len(attempts)], events, len(attempts)))
+                    hedge_at = time.perf_counter() + hedge_after if len(attempts) < len(openers) else None
+                    continue
+                raise DeadlineExceeded(f"No response within {timeout:.1f}s")
+
+            if error is None:
+                winner = attempt
+                return winner
+            failed += 1
+            if failed < len(attempts):
+                continue
+            # Hedging is for slow attempts; one that failed outright is the caller's to retry, unless falling back
+            if not fallback or len(attempts) == len(openers):
+                raise error
+            tracing.count(f'{name}.fallback')
+            attempts.append(_Attempt(openers[len(attempts)], events, len(attempts)))
+            hedge_at = time.perf_counter() + hedge_after if hedge_at and len(attempts) < len(openers) else None
+    finally:
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+
+class ModelRouter:
+    def __init__(self, models, deadline=8.0, attempt_timeout=3.0, retries=1, hedge=True, hedge_quantile=0.95, initial_hedge_delay=2.0,
+                 min_hedge_delay=0.3, failure_threshold=3, reset_timeout=30.0, is_retryable=None):
+        """Send each request to the first healthy model in models, racing a hedged copy and retrying with jitter.
+
+        The first item (first token, or the whole reply for non-streaming calls) must arrive
+        within deadline seconds of the request, across all retries and fallbacks. A hedged
+        copy is started once an attempt takes longer than the model's recent hedge_quantile
+        latency (initial_hedge_delay until enough have been seen). A model that hasn't
+        answered within attempt_timeout is given up on for the next one; the last model
+        gets whatever is left of the deadline. Errors are retried after a jittered backoff,
+        except those for which is_retryable(error) is false (e.g. an unknown model), which
+        skip to the next model. Each model has a circuit breaker and is skipped while it
+        is open.
+        """
+        self.models = list(models)
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.is_retryable = is_retryable or (lambda error: True)
+        self.breakers = {model: CircuitBreaker(model, failure_threshold, reset_timeout) for model in self.models}
+        self.latencies = {}
+        self.stats = {model: {'requests': 0, 'failures': 0, 'timeouts': 0} for model in self.models}
+
+    def hedge_delay(self, model, kind):
+        tracker = self.latencies.setdefault((model, kind), LatencyTracker())
+        return max(self.min_hedge_delay, tracker.quantile(self.hedge_quantile, self.initial_hedge_delay))
+
+    def record_latency(self, model, kind, seconds):
+        self.latencies.setdefault((model, kind), LatencyTracker()).record(seconds)
+
+    def stream(self, open_stream, kind='stream'):
+        """Yield the items of open_stream(model) from the first model and attempt that answers in time."""
+        deadline_at = time.perf_counter() + self.deadline
+        last_error = None
+        for model in self.models:
+            breaker = self.breakers[model]
+            # Check the time first, so a half-open breaker's probe isn't claimed and then not made
+            if deadline_at <= time.perf_counter():
+                break
+            if not breaker.allow():
+                continue
+            for attempt in range(self.retries + 1):
+                remaining = deadline_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                stats = self.stats[model]
+                stats['requests'] += 1
+                if model != self.models[-1]:
+                    remaining = min(remaining, self.attempt_timeout)
+                try:
+                    attempt_stream = lambda: open_stream(model)
+                    winner = race(
+                        [attempt_stream, attempt_stream] if self.hedge else [attempt_stream],
+                        remaining,
+                        self.hedge_delay(model, kind)
+                    )
+                except Exception as e:
+                    breaker.record_failure()
+                    stats['failures'] += 1
+                    last_error = e
+                    if isinstance(e, DeadlineExceeded):
+                        # Even the hedge is stuck; another model is a better bet than the same one again
+                        stats['timeouts'] += 1
+                        break
+                    if not self.is_retryable(e):
+                        break
+                    if attempt == self.retries or not breaker.allow():
+                        break
+                    tracing.count('llm.retry')
+                    time.sleep(min(backoff_delay(attempt), max(0.0, deadline_at - time.perf_counter())))
+                    continue
+
+                # The winner's own latency, so time spent waiting to hedge doesn't push the quantile up
+                self.record_latency(model, kind, time.perf_counter() - winner.started_at)
+                breaker.record_success()
+                if model != self.models[0]:
+                    tracing.annotate('llm.fallback_model', model)
+                try:
+                    yield from winner
+                except Exception:
+                    # Too late to switch models once part of the reply is out
+                    breaker.record_failure()
+                    stats['failures'] += 1
+                    raise
+                finally:
+                    # Stops the reader if the caller stopped listening, e.g. on barge-in
+                    winner.cancel()
+                return
+
+        if last_error is None:
+            raise RuntimeError("All models are overloaded (circuit breakers open)")
+        if isinstance(last_error, DeadlineExceeded):
+            raise DeadlineExceeded(f"No model answered within the {self.deadline:.1f}s deadline, the model is overloaded")
+        raise last_error
+
+    def call(self, request):
+        """Return request(model) from the first model and attempt that answers in time."""
+        for response in self.stream(lambda model: iter([request(model)]), kind='call'):
+            return response
+
+    def get_stats(self):
+        return {
+            model: {
+                **self.stats[model],
+                **self.breakers[model].get_stats(),
+                'hedge_delay': self.hedge_delay(model, 'stream'),
+            }
+            for model in self.models
+        }
@@ -0,0 +1,74 @@
+import re
+
+class SentenceChunker:
+    # A boundary is whitespace after sentence punctuation (and any closing quotes or brackets,
+    # captured so they stay with the sentence), or whitespace before an emotion tag
+    BOUNDARY_PATTERN = re.compile(r'(?<=[.!?])(["\')\]]*)\s+|\s+(?=\(\w+\))')
+    EMOTION_PATTERN = re.compile(r'\((\w+)\)')
+
+    def __init__(self, min_chunk_length=40):
+        """Split streamed text into sentence or emotion-tag aligned chunks."""
+        self.min_chunk_length = min_chunk_length
+        self.buffer = ''
+        self.pending = ''
+        self.active_emotion = None
+        self.chunks_emitted = 0
+
+    def feed(self, text):
+        """Add streamed text and return any chunks that are complete."""
+        self.buffer += text
+        chunks = []
+
+        last_end = 0
+        for match in self.BOUNDARY_PATTERN.finditer(self.buffer):
+            end = match.end(1) if match.group(1) is not None else match.start()
+            sentence = self.buffer[last_end:end]
+            last_end = match.end()
+            chunk = self._add_sentence(sentence)
+            if chunk:
+                chunks.append(chunk)
+
+        self.buffer = self.buffer[last_end:]
+        return chunks
+
+    def flush(self):
+        """Return whatever text is left once the stream has finished."""
+        chunks = []
+        remaining = (self.pending + ' ' + self.buffer).strip()
+        self.pending = ''
+        self.buffer = ''
+        if remaining:
+            chunks.append(self._emit(remaining))
+        return chunks
+
+    def _add_sentence(self, sentence):
+        """Accumulate a sentence and emit a chunk once it is long enough."""
+        sentence = sentence.strip()
+        if not sentence:
+            return None
+
+        self.pending = f'{self.pending} {sentence}'.strip()
+
+        # The first full sentence goes out as soon as possible to cut time to first audio
+        first_sentence = self.chunks_emitted == 0 and sentence[-1] in '.!?"\')]'
+        if first_sentence or len(self.pending) >= self.min_chunk_length:
+            chunk = self.pending
+            self.pending = ''
+            return self._emit(chunk)
+        return None
+
+    def _emit(self, chunk):
+        """Carry the active emotion over so each chunk can be voiced on its own."""
+        starts_with_emotion = self.EMOTION_PATTERN.match(chunk)
+        if self.active_emotion and not starts_with_emotion:
+            chunk = f'({self.active_emotion}) {chunk}'
+
+        for match in self.EMOTION_PATTERN.finditer(chunk):
+            emotion = match.group(1).lower()
+            if emotion == 'normal':
+                self.active_emotion = None
+            elif emotion != 'breath':
+                self.active_emotion = emotion
+
+        self.chunks_emitted += 1
+        return chunk
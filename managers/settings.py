@@ -0,0 +1,272 @@
+import os
+import threading
+
+import yaml
+from rich import print
+
+class ConfigError(ValueError):
+    pass
+
+REQUIRED = object()
+NUMBER = (int, float)
+
+def read_config(path):
+    """Parse a YAML config file into a nested dict."""
+    with open(path, 'r') as file:
+        config = yaml.load(file, Loader=yaml.FullLoader)
+    if not isinstance(config, dict):
+        raise ConfigError(f"{path} must contain a mapping of sections")
+    return config
+
+def diff_config(old, new, prefix=''):
+    """Dotted paths of every setting that differs between two config dicts, e.g. ['obs.image.scene_name']."""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return [] if old == new else [prefix]
+    changed = []
+    for key in sorted(set(old) | set(new), key=str):
+        path = f'{prefix}.{key}' if prefix else str(key)
+        if key not in old or key not in new:
+            changed.append(path)
+        else:
+            changed.extend(diff_config(old[key], new[key], path))
+    return changed
+
+class Section:
+    __slots__ = ()
+    # (name, type, default) per setting; the type is a Section subclass for nested sections
+    FIELDS = ()
+
+    def __init__(self, data, path):
+        """Compile one config section, raising ConfigError naming the first invalid setting."""
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ConfigError(f"{path} must be a mapping, not {data!r}")
+        for name, kind, default in self.FIELDS:
+            value = data.get(name, default)
+            if value is REQUIRED:
+                raise ConfigError(f"{path}.{name} is missing")
+            if isinstance(kind, type) and issubclass(kind, Section):
+                value = kind(value, f'{path}.{name}')
+            elif value is None:
+                # A key with nothing after it, which YAML reads as null
+                raise ConfigError(f"{path}.{name} is missing")
+            elif not isinstance(value, kind) or (isinstance(value, bool) and kind is not bool):
+                raise ConfigError(f"{path}.{name} must be {self._type_name(kind)}, not {value!r}")
+            setattr(self, name, value)
+        self.validate(path)
+
+    def validate(self, path):
+        """Check the settings against each other; raise ConfigError if they don't make sense."""
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+    @staticmethod
+    def _type_name(kind):
+        if kind is NUMBER:
+            return 'a number'
+        return {str: 'text', bool: 'true or false', int: 'a whole number'}.get(kind, kind.__name__)
+
+    def _require(self, path, name, valid, message):
+        if not valid:
+            raise ConfigError(f"{path}.{name} {message}, not {getattr(self, name)!r}")
+
+class AISettings(Section):
+    __slots__ = ('model', 'stream', 'min_chunk_length', 'system_instruction')
+    FIELDS = (
+        ('model', str, REQUIRED),
+        ('stream', bool, False),
+        ('min_chunk_length', int, 40),
+        ('system_instruction', str, REQUIRED),
+    )
+
+    def validate(self, path):
+        self._require(path, 'model', self.model.strip(), "can't be empty")
+        self._require(path, 'min_chunk_length', self.min_chunk_length >= 0, "can't be negative")
+        self._require(path, 'system_instruction', self.system_instruction.strip(), "can't be empty")
+
+class TTSSettings(Section):
+    __slots__ = ('voice', 'engine', 'language', 'progressive')
+    FIELDS = (
+        ('voice', str, REQUIRED),
+        ('engine', str, 'standard'),
+        ('language', str, 'en'),
+        ('progressive', bool, False),
+    )
+    ENGINES = ('standard', 'neural', 'long-form', 'generative')
+
+    def validate(self, path):
+        self._require(path, 'voice', self.voice.strip(), "can't be empty")
+        self._require(path, 'engine', self.engine in self.ENGINES, f"must be one of {', '.join(self.ENGINES)}")
+
+class STTSettings(Section):
+    __slots__ = ('model', 'language', 'realtime_model', 'post_speech_silence_duration', 'continuous')
+    FIELDS = (
+        ('model', str, REQUIRED),
+        ('language', str, 'en'),
+        ('realtime_model', str, 'tiny'),
+        ('post_speech_silence_duration', NUMBER, 1.0),
+        ('continuous', bool, False),
+    )
+
+    def validate(self, path):
+        self._require(path, 'model', self.model.strip(), "can't be empty")
+        self._require(path, 'post_speech_silence_duration', self.post_speech_silence_duration > 0, "must be positive")
+
+class SourceTarget(Section):
+    __slots__ = ('enabled', 'scene_name', 'source_name')
+    FIELDS = (
+        ('enabled', bool, True),
+        ('scene_name', str, ''),
+        ('source_name', str, ''),
+    )
+
+class FilterTarget(Section):
+    __slots__ = ('enabled', 'source_name', 'filter_name')
+    FIELDS = (
+        ('enabled', bool, True),
+        ('source_name', str, ''),
+        ('filter_name', str, ''),
+    )
+
+class OBSSettings(Section):
+    __slots__ = ('enabled', 'image', 'head', 'filter')
+    FIELDS = (
+        ('enabled', bool, True),
+        ('image', SourceTarget, None),
+        ('head', SourceTarget, None),
+        ('filter', FilterTarget, None),
+    )
+
+    def validate(self, path):
+        if not self.enabled:
+            return
+        # A target that is switched on must name what it switches
+        for name in ('image', 'head', 'filter'):
+            target = getattr(self, name)
+            if target.enabled:
+                for field in target.__slots__[1:]:
+                    if not getattr(target, field).strip():
+                        raise ConfigError(f"{path}.{name}.{field} can't be empty while {path}.{name} is enabled")
+
+class BargeInSettings(Section):
+    __slots__ = ('enabled', 'key', 'fade_ms', 'on_speech')
+    FIELDS = (
+        ('enabled', bool, False),
+        ('key', str, 'f4'),
+        ('fade_ms', int, 150),
+        ('on_speech', bool, False),
+    )
+
+    def validate(self, path):
+        self._require(path, 'key', self.key.strip(), "can't be empty")
+        self._require(path, 'fade_ms', self.fade_ms >= 0, "can't be negative")
+
+class FillerSettings(Section):
+    __slots__ = ('enabled', 'directory', 'delay', 'fade_ms', 'max_bytes')
+    FIELDS = (
+        ('enabled', bool, False),
+        ('directory', str, 'audio/fillers'),
+        ('delay', NUMBER, 1.5),
+        ('fade_ms', int, 120),
+        ('max_bytes', int, 16 * 1024 * 1024),
+    )
+
+    def validate(self, path):
+        self._require(path, 'delay', self.delay > 0, "must be positive")
+        self._require(path, 'fade_ms', self.fade_ms >= 0, "can't be negative")
+        self._require(path, 'max_bytes', self.max_bytes > 0, "must be positive")
+
+class Settings(Section):
+    __slots__ = ('raw', 'ai', 'tts', 'stt', 'obs', 'barge_in', 'fillers')
+    FIELDS = (
+        ('ai', AISettings, REQUIRED),
+        ('tts', TTSSettings, REQUIRED),
+        ('stt', STTSettings, REQUIRED),
+        ('obs', OBSSettings, None),
+        ('barge_in', BargeInSettings, None),
+        ('fillers', FillerSettings, None),
+    )
+
+    def __init__(self, config, path='config'):
+        """config.yaml compiled into validated, slotted sections for the settings read on every turn.
+
+        raw keeps the dict itself, which providers' from_config and the less used settings still read.
+        """
+        self.raw = config
+        super().__init__(config, path)
+
+    def validate(self, path):
+        providers = self.raw.get('providers', {})
+        if not isinstance(providers, dict):
+            raise ConfigError(f"{path}.providers must be a mapping, not {providers!r}")
+
+class ConfigWatcher:
+    def __init__(self, path, settings, on_change, interval=1.0):
+        """Check path for edits every interval seconds and hand each valid one to on_change(old, new, changed).
+
+        changed lists the dotted paths of the settings that differ (see diff_config). An edit
+        that doesn't parse or validate, or that on_change raises on, is reported and ignored,
+        and the running settings stay as they were.
+        """
+        self.path = path
+        self.settings = settings
+        self.on_change = on_change
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.version = self._stat()
+        self.stats = {'applied': 0, 'rejected': 0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    def reload(self):
+        """Read the file now and apply it if it is valid and different. Returns whether it was applied."""
+        try:
+            settings = Settings(read_config(self.path))
+        except (OSError, yaml.YAMLError, ConfigError) as e:
+            self.stats['rejected'] += 1
+            print(f"[red]Ignoring the edit to {self.path}: {e}[/red]")
+            return False
+
+        changed = diff_config(self.settings.raw, settings.raw)
+        if not changed:
+            return False
+        try:
+            self.on_change(self.settings, settings, changed)
+        except Exception as e:
+            self.stats['rejected'] += 1
+            print(f"[red]Couldn't apply the edit to {self.path}, keeping the current settings: {e}[/red]")
+            return False
+        self.settings = settings
+        self.stats['applied'] += 1
+        return True
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            version = self._stat()
+            # A missing or empty file is most likely an editor halfway through saving it
+            if version is None or version[1] == 0 or version == self.version:
+                continue
+            self.version = version
+            self.reload()
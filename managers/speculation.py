@@ -0,0 +1,166 @@
+import queue
+import re
+import threading
+import time
+
+from rich import print
+
+NON_WORD_PATTERN = re.compile(r'[^\w\s]+')
+
+def normalize_transcript(text):
+    """Reduce a transcript to lowercase words, so punctuation and casing differences still match."""
+    return ' '.join(NON_WORD_PATTERN.sub('', text.lower()).split())
+
+class Speculation:
+    _DONE = object()
+
+    def __init__(self, text, generate, context=None):
+        """Run generate(text) in the background, buffering its chunks until someone claims them.
+
+        generate(text) must return a generator that yields reply chunks and returns the
+        uncommitted turn as (response, usage metadata), like generate_response_stream(commit=False).
+        """
+        self.text = text
+        self.key = normalize_transcript(text)
+        self.context = context
+        self.started_at = time.perf_counter()
+        self.chunks = queue.Queue()
+        self.cancelled = threading.Event()
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(generate,), name='speculation', daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        """Stop generating; the response is thrown away."""
+        self.cancelled.set()
+
+    def __iter__(self):
+        """Yield the buffered chunks, then the rest as they arrive. Raises whatever generation raised."""
+        while True:
+            chunk = self.chunks.get()
+            if chunk is self._DONE:
+                break
+            yield chunk
+        if self.error:
+            raise self.error
+
+    def _run(self, generate):
+        stream = generate(self.text)
+        try:
+            while not self.cancelled.is_set():
+                try:
+                    self.chunks.put(next(stream))
+                except StopIteration as e:
+                    self.result = e.value
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            # Closing the stream stops reading the response, which drops the request
+            stream.close()
+            self.chunks.put(self._DONE)
+
+class SpeculativeResponder:
+    def __init__(self, generate, stable_window=0.3, min_words=2, get_context=None):
+        """Start generating a reply from the partial transcript once it has stopped changing.
+
+        Feed partial transcripts to on_partial() while the user talks, then hand the final
+        transcript to claim(). If the speculation was started from the same words, its
+        (possibly already finished) reply is returned, hiding the LLM latency behind the
+        end-of-speech silence. Otherwise the speculation is cancelled and None is returned.
+        get_context() identifies what the reply depends on besides the words (e.g. the chat
+        history's generation); a speculation started under a different context is never used.
+        """
+        self.generate = generate
+        self.get_context = get_context or (lambda: None)
+        self.stable_window = stable_window
+        self.min_words = min_words
+
+        self.lock = threading.Lock()
+        self.partial_key = None
+        self.timer = None
+        self.speculation = None
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+        self.stale = 0  # discarded because the context changed, not the words
+        self.head_start = 0.0  # how far ahead of the final transcript the used speculations started, in total
+
+    def on_partial(self, text):
+        """Note the latest partial transcript. Safe to call from the recorder's thread."""
+        key = normalize_transcript(text)
+        with self.lock:
+            if key == self.partial_key:
+                return
+            self.partial_key = key
+            if self.timer:
+                self.timer.cancel()
+            self.timer = None
+            if len(key.split()) < self.min_words:
+                return
+            self.timer = threading.Timer(self.stable_window, self._on_stable, args=(text, key))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def claim(self, final_text):
+        """Return the Speculation for final_text if one was started from the same words, else None."""
+        key = normalize_transcript(final_text)
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = None
+            self.partial_key = None
+            speculation, self.speculation = self.speculation, None
+
+        if speculation is None:
+            return None
+        if speculation.key != key:
+            speculation.cancel()
+            self.discarded += 1
+            print("[dim]Speculative reply discarded, the final transcript was different.[/dim]")
+            return None
+        if speculation.context != self.get_context():
+            speculation.cancel()
+            self.discarded += 1
+            self.stale += 1
+            print("[dim]Speculative reply discarded, the conversation changed after it was started.[/dim]")
+            return None
+
+        self.used += 1
+        self.head_start += time.perf_counter() - speculation.started_at
+        return speculation
+
+    def reset(self):
+        """Cancel anything in flight, e.g. when the recording was thrown away."""
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = None
+            self.partial_key = None
+            speculation, self.speculation = self.speculation, None
+        if speculation:
+            speculation.cancel()
+            self.discarded += 1
+
+    def get_stats(self):
+        return {
+            'started': self.started,
+            'used': self.used,
+            'discarded': self.discarded,
+            'stale': self.stale,
+            'head_start': self.head_start,
+        }
+
+    def _on_stable(self, text, key):
+        with self.lock:
+            if key != self.partial_key:
+                return
+            previous = self.speculation
+            if previous and previous.key == key:
+                return
+            self.speculation = Speculation(text, self.generate, self.get_context())
+            self.started += 1
+        if previous:
+            previous.cancel()
+            self.discarded += 1
@@ -0,0 +1,143 @@
+import re
+
+# Emotion marker -> (opening tag, closing tag). Single tags like breath have no closing tag.
+EMOTIONS = {
+    'high': ('<prosody pitch="+30%">', '</prosody>'),
+    'higher': ('<amazon:effect vocal-tract-length="-80%">', '</amazon:effect>'),
+    'deep': ('<prosody pitch="-30%">', '</prosody>'),
+    'deeper': ('<amazon:effect vocal-tract-length="+80%">', '</amazon:effect>'),
+    'drunk': ('<prosody rate="x-slow">', '</prosody>'),
+    'asthma': ('<amazon:auto-breaths volume="x-loud" frequency="x-high" duration="x-short">', '</amazon:auto-breaths>'),
+    'soft': ('<prosody volume="x-soft">', '</prosody>'),
+    'loud': ('<prosody volume="x-loud">', '</prosody>'),
+    'whisper': ('<amazon:effect name="whispered">', '</amazon:effect>'),
+    'breath': ('<amazon:breath duration="x-long" volume="x-loud"/>', None),
+}
+
+MARKER_PATTERN = re.compile(r'\((\w+)\)')
+# A sentence with its closing punctuation and trailing whitespace, or whatever is left at the end
+SENTENCE_PATTERN = re.compile(r'.+?(?:[.!?]+(?:\s+|$)|$)', re.S)
+
+# Polly rejects SynthesizeSpeech input over 3000 billed characters. Counting the tags
+# as well keeps every document under both that and the 6000 total character limit.
+MAX_SSML_CHARS = 3000
+# Room kept free in every document for <speak></speak> and the longest closing tag
+RESERVED_CHARS = len('<speak></speak>') + max(len(close) for _, close in EMOTIONS.values() if close)
+
+def compile_ssml(text):
+    """Turn (emotion) markers into one Polly SSML document in a single pass."""
+    effect = None
+
+    def replace(match):
+        nonlocal effect
+        emotion = match.group(1).lower()
+        if emotion == 'normal':
+            if effect is None:
+                return ''
+            close_tag, effect = EMOTIONS[effect][1], None
+            return close_tag
+        tags = EMOTIONS.get(emotion)
+        if tags is None:
+            return ''
+        open_tag, close_tag = tags
+        if close_tag is None:
+            return open_tag
+        if effect is not None:
+            open_tag = EMOTIONS[effect][1] + open_tag
+        effect = emotion
+        return open_tag
+
+    body = MARKER_PATTERN.sub(replace, text)
+    if effect is not None:
+        body += EMOTIONS[effect][1]
+    return f'<speak>{body}</speak>'
+
+def compile_ssml_chunks(text, max_chars=MAX_SSML_CHARS):
+    """Turn (emotion) markers into Polly SSML documents of at most max_chars each.
+
+    Long text is split between sentences. An emotion that is active at a split is
+    closed at the end of one document and reopened at the start of the next, so
+    every document is well-formed on its own.
+    """
+    document = compile_ssml(text)
+    if len(document) <= max_chars:
+        return [document]
+
+    builder = _SSMLBuilder(max_chars)
+    last_end = 0
+    for match in MARKER_PATTERN.finditer(text):
+        if match.start() > last_end:
+            builder.add_text(text[last_end:match.start()])
+        builder.set_emotion(match.group(1).lower())
+        last_end = match.end()
+    if last_end < len(text):
+        builder.add_text(text[last_end:])
+    return builder.finish()
+
+class _SSMLBuilder:
+    def __init__(self, max_chars):
+        self.budget = max_chars - RESERVED_CHARS
+        self.documents = []
+        self.parts = []
+        self.length = 0
+        self.content_start = 0  # length of the reopened emotion tag at the start of this document
+        self.effect = None
+
+    def set_emotion(self, emotion):
+        if emotion == 'normal':
+            if self.effect:
+                self._append(EMOTIONS[self.effect][1])
+                self.effect = None
+        elif emotion in EMOTIONS:
+            open_tag, close_tag = EMOTIONS[emotion]
+            if close_tag is not None and self.effect:
+                open_tag = EMOTIONS[self.effect][1] + open_tag
+            if not self._fits(open_tag) and self.length > self.content_start:
+                self._flush()
+            self._append(open_tag)
+            if close_tag is not None:
+                self.effect = emotion
+
+    def add_text(self, text):
+        if self._fits(text):
+            self._append(text)
+            return
+
+        for sentence in SENTENCE_PATTERN.findall(text):
+            if not self._fits(sentence) and self.length > self.content_start:
+                self._flush()
+            # A single sentence longer than a whole document gets cut between words
+            while not self._fits(sentence):
+                room = self.budget - self.length
+                cut = sentence.rfind(' ', 0, room)
+                if cut <= 0:
+                    cut = room
+                self._append(sentence[:cut])
+                self._flush()
+                sentence = sentence[cut:].lstrip()
+            self._append(sentence)
+
+    def finish(self):
+        if self.effect:
+            self.parts.append(EMOTIONS[self.effect][1])
+        # Don't send a document that only reopens and closes an emotion
+        if self.length > self.content_start or not self.documents:
+            self.documents.append(f'<speak>{"".join(self.parts)}</speak>')
+        return self.documents
+
+    def _fits(self, text):
+        return self.length + len(text) <= self.budget
+
+    def _append(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+
+    def _flush(self):
+        if self.effect:
+            self.parts.append(EMOTIONS[self.effect][1])
+        self.documents.append(f'<speak>{"".join(self.parts)}</speak>')
+        self.parts = []
+        self.length = 0
+        if self.effect:
+            self._append(EMOTIONS[self.effect][0])
+        self.content_start = self.length
@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from rich import print
+
+class StartupProfile:
+    def __init__(self, max_workers=None):
+        """Initialize components concurrently and record how long each one took.
+
+        Steps that must happen before anything else run inline under measure();
+        everything else is handed to start() and only waited on by whoever calls get().
+        """
+        self.started_at = time.perf_counter()
+        self.timings = {}  # component -> seconds spent initializing it
+        self.waits = {}  # component -> seconds the caller was blocked waiting for it
+        self.errors = {}
+        self.futures = {}
+        self.finished = set()
+        self.lock = threading.Lock()
+        self.accepting = True
+        self.reported = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='startup')
+
+    @contextmanager
+    def measure(self, name):
+        """Time a step that runs on the calling thread."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.timings[name] = time.perf_counter() - start
+
+    def start(self, name, factory, *args, **kwargs):
+        """Run factory(*args, **kwargs) in the background; get(name) returns its result."""
+        future = self.executor.submit(self._build, name, factory, *args, **kwargs)
+        with self.lock:
+            self.futures[name] = future
+
+    def close(self):
+        """Mark that every component has been started; the profile is printed once they have all finished."""
+        with self.lock:
+            self.accepting = False
+        self._report_if_finished()
+
+    def get(self, name):
+        """Return a component, blocking until it has finished initializing (re-raises its error)."""
+        future = self.futures[name]
+        if not future.done():
+            start = time.perf_counter()
+            future.exception()
+            with self.lock:
+                self.waits[name] = self.waits.get(name, 0.0) + time.perf_counter() - start
+        return future.result()
+
+    def wait_all(self):
+        """Block until every background component is done, successful or not."""
+        with self.lock:
+            futures = list(self.futures.values())
+        for future in futures:
+            future.exception()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'timings': dict(self.timings),
+                'waits': dict(self.waits),
+                'errors': dict(self.errors),
+                'elapsed': time.perf_counter() - self.started_at,
+            }
+
+    def report(self):
+        """Print how long each component took, slowest first."""
+        stats = self.get_stats()
+        print("[dim]Startup profile:[/dim]")
+        for name, seconds in sorted(stats['timings'].items(), key=lambda item: item[1], reverse=True):
+            status = f" [red](failed: {stats['errors'][name]})[/red]" if name in stats['errors'] else ""
+            waited = f", waited on for {stats['waits'][name]:.2f}s" if name in stats['waits'] else ""
+            print(f"[dim]  {name:<20} {seconds:6.2f}s{waited}[/dim]{status}")
+        serial = sum(stats['timings'].values())
+        print(f"[dim]  ready after {stats['elapsed']:.2f}s ({serial:.2f}s if run one after another)[/dim]")
+
+    def _build(self, name, factory, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return factory(*args, **kwargs)
+        except Exception as e:
+            with self.lock:
+                self.errors[name] = e
+            raise
+        finally:
+            with self.lock:
+                self.timings[name] = time.perf_counter() - start
+                self.finished.add(name)
+            self._report_if_finished()
+
+    def _report_if_finished(self):
+        with self.lock:
+            report = not self.accepting and not self.reported and self.finished >= set(self.futures)
+            if report:
+                self.reported = True
+        if report:
+            self.report()
+            self.executor.shutdown(wait=False)
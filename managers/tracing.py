@@ -0,0 +1,325 @@
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# The tracer in use, None while tracing is disabled. The module-level helpers below check it
+# first, so instrumented code costs one global lookup per call when tracing is off.
+_tracer = None
+_NULL_SPAN = nullcontext()
+# The turn that spans, marks and counts go to. A context variable rather than one shared
+# "current turn", so a turn still playing keeps its own while the next one is recorded;
+# worker threads see it when handed their work through bind().
+_turn = contextvars.ContextVar('tracing_turn', default=None)
+
+def configure(**kwargs):
+    """Enable tracing with a new Tracer (see Tracer for the arguments) and return it."""
+    global _tracer
+    if _tracer:
+        _tracer.close()
+    _tracer = Tracer(**kwargs)
+    return _tracer
+
+def get_tracer():
+    """Get the active Tracer, or None if tracing is disabled."""
+    return _tracer
+
+def begin_turn(**attrs):
+    """Start a turn and make it the current one in this thread (or asyncio task)."""
+    return _tracer.begin_turn(**attrs) if _tracer else None
+
+def end_turn(turn=None, **annotations):
+    if _tracer:
+        _tracer.end_turn(turn, **annotations)
+
+def current_turn():
+    return _turn.get()
+
+def set_turn(turn):
+    """Make turn the current one in this thread (or asyncio task), e.g. one begun on another thread."""
+    _turn.set(turn)
+
+def bind(func):
+    """Wrap func to run with the caller's current turn, for handing work to another thread or an executor."""
+    if _tracer is None:
+        return func
+    turn = _turn.get()
+
+    def run(*args, **kwargs):
+        token = _turn.set(turn)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _turn.reset(token)
+    return run
+
+def span(name, **attrs):
+    """Time a block as part of the current turn: with tracing.span('tts.polly'): ..."""
+    return _tracer.span(name, **attrs) if _tracer else _NULL_SPAN
+
+def mark(name):
+    """Record when something first happened in the current turn (e.g. llm.first_token)."""
+    if _tracer:
+        _tracer.mark(name)
+
+def annotate(key, value):
+    """Attach a note (e.g. which fallback was used and why) to the current turn."""
+    if _tracer:
+        _tracer.annotate(key, value)
+
+def observe(name, seconds):
+    """Record a duration measured by the caller (e.g. on another thread) in the metrics, like a span."""
+    if _tracer:
+        _tracer.observe(name, seconds)
+
+def count(name):
+    """Count an occurrence (e.g. a retry or reconnect) in the metrics and on the current turn."""
+    if _tracer:
+        _tracer.count(name)
+
+class Turn:
+    def __init__(self, number, attrs):
+        """Everything recorded for one conversation turn, with times relative to its start."""
+        self.number = number
+        self.started_at = time.perf_counter()
+        self.started_wall = time.time()
+        self.attrs = attrs
+        self.spans = []
+        self.marks = {}
+        self.annotations = {}
+        self.ended = False
+
+    def offset(self, timestamp=None):
+        return (timestamp or time.perf_counter()) - self.started_at
+
+    def to_dict(self):
+        return {
+            'turn': self.number,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_wall)) + f'.{int(self.started_wall % 1 * 1000):03d}',
+            'duration': self.offset(),
+            **self.attrs,
+            'marks': self.marks,
+            'spans': self.spans,
+            'annotations': self.annotations,
+        }
+
+class _Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.turn = _turn.get()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer._finish_span(self, time.perf_counter())
+        return False
+
+class Tracer:
+    def __init__(self, jsonl_path=None, max_bytes=10 * 1024 * 1024, backup_count=5, prometheus_path=None, metrics_port=None, metrics_host='127.0.0.1', reservoir_size=1000, on_turn=None):
+        """Collect per-turn spans, write each finished turn as a JSON line and export Prometheus metrics.
+
+        jsonl_path rotates after max_bytes. Metrics are written to prometheus_path after every
+        turn (e.g. for node_exporter's textfile collector) and/or served at /metrics on metrics_host:metrics_port.
+        Quantiles are computed over the last reservoir_size observations of each span.
+        on_turn(record) is called with the dict of every finished turn, e.g. to collect them in a benchmark.
+        """
+        self.lock = threading.Lock()
+        self.turns = 0
+        self.prometheus_path = prometheus_path
+        self.reservoir_size = reservoir_size
+        self.on_turn = on_turn
+
+        self.bucket_counts = defaultdict(lambda: [0] * len(BUCKETS))
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.recent = defaultdict(lambda: deque(maxlen=self.reservoir_size))
+        self.counters = defaultdict(int)
+
+        self.logger = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+            self.logger = logging.getLogger(f'{__name__}.turns')
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            self.handler = RotatingFileHandler(jsonl_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+            self.handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(self.handler)
+
+        self.server = None
+        if metrics_port:
+            self._serve_metrics(metrics_host, metrics_port)
+
+    def begin_turn(self, **attrs):
+        """Start a turn and make it the current one in the calling context (see set_turn and bind)."""
+        with self.lock:
+            self.turns += 1
+            turn = Turn(self.turns, attrs)
+        _turn.set(turn)
+        return turn
+
+    def end_turn(self, turn=None, **annotations):
+        """Finish a turn (the current one by default): log it and update the turn-level metrics."""
+        with self.lock:
+            turn = turn or _turn.get()
+            if turn is None or turn.ended:
+                return
+            turn.ended = True
+            turn.annotations.update(annotations)
+            self._observe('turn', turn.offset())
+            for name, offset in turn.marks.items():
+                self._observe(name, offset)
+            record = turn.to_dict()
+
+        if self.logger:
+            self.logger.info(json.dumps(record, default=str))
+        if self.prometheus_path:
+            self.write_prometheus()
+        if self.on_turn:
+            self.on_turn(record)
+
+    def span(self, name, **attrs):
+        return _Span(self, name, attrs)
+
+    def mark(self, name):
+        turn = _turn.get()
+        with self.lock:
+            if turn is not None and not turn.ended and name not in turn.marks:
+                turn.marks[name] = turn.offset()
+
+    def annotate(self, key, value):
+        turn = _turn.get()
+        with self.lock:
+            if turn is not None and not turn.ended:
+                turn.annotations[key] = value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self._observe(name, seconds)
+
+    def count(self, name):
+        turn = _turn.get()
+        with self.lock:
+            self.counters[name] += 1
+            if turn is not None and not turn.ended:
+                turn.annotations[name] = turn.annotations.get(name, 0) + 1
+
+    def get_stats(self):
+        """Get count and p50/p95/p99 (over recent observations) of every span, mark and turn."""
+        with self.lock:
+            return {
+                name: {'count': self.counts[name], **{f'p{int(q * 100)}': value for q, value in zip(QUANTILES, self._quantiles(name))}}
+                for name in sorted(self.counts)
+            }
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP babagaboosh_span_seconds Duration of spans, and time from turn start to marks.',
+            '# TYPE babagaboosh_span_seconds histogram',
+        ]
+        with self.lock:
+            names = sorted(self.counts)
+            for name in names:
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, self.bucket_counts[name]):
+                    cumulative += bucket_count
+                    lines.append(f'babagaboosh_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'babagaboosh_span_seconds_bucket{{span="{name}",le="+Inf"}} {self.counts[name]}')
+                lines.append(f'babagaboosh_span_seconds_sum{{span="{name}"}} {self.sums[name]}')
+                lines.append(f'babagaboosh_span_seconds_count{{span="{name}"}} {self.counts[name]}')
+
+            lines.append(f'# HELP babagaboosh_span_recent_seconds Quantiles over the last {self.reservoir_size} observations of each span.')
+            lines.append('# TYPE babagaboosh_span_recent_seconds summary')
+            for name in names:
+                for quantile, value in zip(QUANTILES, self._quantiles(name)):
+                    lines.append(f'babagaboosh_span_recent_seconds{{span="{name}",quantile="{quantile}"}} {value}')
+                recent = self.recent[name]
+                lines.append(f'babagaboosh_span_recent_seconds_sum{{span="{name}"}} {sum(recent)}')
+                lines.append(f'babagaboosh_span_recent_seconds_count{{span="{name}"}} {len(recent)}')
+
+            lines.append('# HELP babagaboosh_events_total Retries, fallbacks, reconnects and other counted events.')
+            lines.append('# TYPE babagaboosh_events_total counter')
+            for name in sorted(self.counters):
+                lines.append(f'babagaboosh_events_total{{event="{name}"}} {self.counters[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        """Atomically replace prometheus_path with the current metrics."""
+        directory = os.path.dirname(os.path.abspath(self.prometheus_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, self.prometheus_path)
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.logger:
+            self.logger.removeHandler(self.handler)
+            self.handler.close()
+
+    def _finish_span(self, span, end):
+        duration = end - span.start
+        with self.lock:
+            self._observe(span.name, duration)
+            turn = span.turn
+            if turn is not None and not turn.ended:
+                turn.spans.append({'name': span.name, 'start': turn.offset(span.start), 'duration': duration, **span.attrs})
+
+    def _observe(self, name, seconds):
+        # Called with the lock held
+        buckets = self.bucket_counts[name]
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                buckets[index] += 1
+                break
+        self.sums[name] += seconds
+        self.counts[name] += 1
+        self.recent[name].append(seconds)
+
+    def _quantiles(self, name):
+        # Nearest-rank quantiles; called with the lock held
+        values = sorted(self.recent[name])
+        if not values:
+            return [0.0 for _ in QUANTILES]
+        return [values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES]
+
+    def _serve_metrics(self, host, port):
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = tracer.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+class TTSCache:
+    def __init__(self, cache_dir=None, max_bytes=50 * 1024 * 1024):
+        """Initialize a content-addressed, size-bounded cache of synthesized audio."""
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(__file__), '..', 'audio', 'cache')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(engine, voice, output_format, region, text):
+        """Build the cache key for one synthesis request."""
+        payload = json.dumps([engine, voice, output_format, region, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached audio bytes for a key, or None on a miss."""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._entry_path(key), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # The file was removed behind our back, forget about it
+                self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store audio bytes under a key, evicting the least recently used entries to stay under the cap."""
+        if len(data) > self.max_bytes:
+            return
+
+        with self.lock:
+            self._atomic_write(self._entry_path(key), data)
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+
+            while self.total_bytes > self.max_bytes:
+                old_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self._entry_path(old_key))
+                except FileNotFoundError:
+                    pass
+
+            self._save_index()
+
+    def get_stats(self):
+        """Get the hit/miss counters and current size of the cache."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+            }
+
+    def save(self):
+        """Persist the index, including the latest recency order."""
+        with self.lock:
+            self._save_index()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.bin')
+
+    def _load_index(self):
+        """Load the index in a single read instead of scanning the cache directory."""
+        try:
+            with open(self.index_path, 'r') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        for key, size in entries:
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def _save_index(self):
+        data = json.dumps(list(self.entries.items())).encode('utf-8')
+        self._atomic_write(self.index_path, data)
+
+    def _atomic_write(self, path, data):
+        """Write to a temporary file and rename it so readers never see a partial file."""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
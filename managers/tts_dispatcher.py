@@ -0,0 +1,158 @@
+import threading
+import time
+
+from rich import print
+
+from . import tracing
+from .resilience import CircuitBreaker, DeadlineExceeded, LatencyTracker, race
+
+class ProviderUnavailable(RuntimeError):
+    pass
+
+class TTSDispatcher:
+    def __init__(self, providers, deadline=4.0, hedge=True, hedge_quantile=0.95, initial_hedge_delay=1.0, min_hedge_delay=0.2,
+                 failure_threshold=3, reset_timeout=30.0):
+        """Synthesize with the first healthy TTS provider, racing the next one when it is slow to start.
+
+        providers is a list of (name, manager) in order of preference. When a provider hasn't
+        delivered its first audio byte after its recent hedge_quantile latency
+        (initial_hedge_delay until enough have been seen, and never later than half the
+        deadline), the next provider is started alongside it and whichever starts first is
+        used; a provider that fails hands over at once. Audio must start arriving within
+        deadline seconds. Each provider has a circuit breaker: after failure_threshold
+        failures (or first bytes later than the deadline) in a row it is skipped, and after
+        reset_timeout seconds it gets one request to prove it is back.
+        """
+        if not providers:
+            raise ValueError("TTSDispatcher needs at least one provider.")
+        self.providers = providers
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.lock = threading.Lock()
+        self.breakers = {name: CircuitBreaker(f'tts.{name}', failure_threshold, reset_timeout) for name, _ in providers}
+        self.latencies = {name: LatencyTracker() for name, _ in providers}
+        self.stats = {
+            name: {'requests': 0, 'successes': 0, 'failures': 0, 'slow': 0, 'wins': 0}
+            for name, _ in providers
+        }
+
+    @classmethod
+    def from_config(cls, config, providers):
+        """Build the dispatcher from config.yaml's tts.dispatch section."""
+        dispatch_config = config['tts'].get('dispatch', {})
+        return cls(
+            providers,
+            deadline=dispatch_config.get('deadline', 4.0),
+            hedge=dispatch_config.get('hedge', True),
+            hedge_quantile=dispatch_config.get('hedge_quantile', 0.95),
+            initial_hedge_delay=dispatch_config.get('initial_hedge_delay', 1.0),
+            failure_threshold=dispatch_config.get('failure_threshold', 3),
+            reset_timeout=dispatch_config.get('reset_timeout', 30)
+        )
+
+    def hedge_delay(self, name):
+        delay = self.latencies[name].quantile(self.hedge_quantile, self.initial_hedge_delay)
+        return min(max(self.min_hedge_delay, delay), self.deadline / 2)
+
+    def text_to_speech(self, text, output_path=None, format_text=True, voice_id=None, output_format='mp3'):
+        """Synthesize text like a TTS manager would, returning the audio bytes or writing them to output_path."""
+        candidates = [
+            (name, manager) for name, manager in self.providers
+            if output_format in getattr(manager, 'output_formats', ('mp3',))
+        ]
+        if not candidates:
+            raise ValueError(f"No TTS provider produces {output_format}")
+        # Providers that are being skipped go last; one that is due for a probe keeps its place
+        candidates.sort(key=lambda provider: not self.breakers[provider[0]].available())
+
+        openers = [
+            lambda name=name, manager=manager: self._open(name, manager, text, format_text, voice_id, output_format)
+            for name, manager in candidates
+        ]
+        try:
+            winner = race(
+                openers,
+                self.deadline,
+                self.hedge_delay(candidates[0][0]) if self.hedge else None,
+                name='tts',
+                fallback=True
+            )
+        except DeadlineExceeded:
+            raise DeadlineExceeded(f"No TTS provider started speaking within {self.deadline:.1f}s")
+
+        name = candidates[winner.index][0]
+        with self.lock:
+            self.stats[name]['wins'] += 1
+        if winner.index:
+            tracing.annotate('tts.provider', name)
+        audio = b''.join(winner)
+
+        if output_path is None:
+            return audio
+        with open(output_path, 'wb') as f:
+            f.write(audio)
+        return output_path
+
+    def get_stats(self):
+        """Per provider: requests, successes, failures, slow first bytes, races won, breaker state and first-byte latency."""
+        stats = {}
+        for name, _ in self.providers:
+            latencies = self.latencies[name]
+            with self.lock:
+                stats[name] = dict(self.stats[name])
+            stats[name].update(self.breakers[name].get_stats())
+            stats[name]['p50'] = latencies.quantile(0.5, 0.0)
+            stats[name]['p95'] = latencies.quantile(0.95, 0.0)
+        return stats
+
+    def _open(self, name, manager, text, format_text, voice_id, output_format):
+        # Runs on the race's thread, so a breaker's half-open probe is only claimed when the provider really gets a request
+        breaker = self.breakers[name]
+        if not breaker.allow():
+            raise ProviderUnavailable(f"TTS provider {name} is failing, skipped until it recovers")
+        with self.lock:
+            self.stats[name]['requests'] += 1
+        started_at = time.perf_counter()
+
+        stream = None
+        first = True
+        try:
+            if hasattr(manager, 'stream_audio'):
+                stream = manager.stream_audio(text, format_text, voice_id, output_format)
+            else:
+                stream = iter([manager.text_to_speech(text, None, format_text, voice_id, output_format)])
+            for chunk in stream:
+                if first:
+                    first = False
+                    self._first_byte(name, time.perf_counter() - started_at)
+                yield chunk
+        except Exception as e:
+            breaker.record_failure()
+            with self.lock:
+                self.stats[name]['failures'] += 1
+            tracing.count(f'tts.{name}.failure')
+            print(f"[red]Error with TTS provider {name}: {e}[/red]")
+            raise
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+
+    def _first_byte(self, name, seconds):
+        self.latencies[name].record(seconds)
+        tracing.observe(f'tts.{name}.first_byte', seconds)
+        with self.lock:
+            if seconds > self.deadline:
+                # Too late to have been any use; for dead air a provider this slow is as bad as a broken one
+                self.stats[name]['slow'] += 1
+                slow = True
+            else:
+                self.stats[name]['successes'] += 1
+                slow = False
+        if slow:
+            self.breakers[name].record_failure()
+        else:
+            self.breakers[name].record_success()
@@ -0,0 +1,18 @@
+import argparse
+
+from main import load_config
+from managers import ConversationServer
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve many concurrent conversations over HTTP and WebSocket.")
+    parser.add_argument('--host', help="Overrides server.host in config.yaml")
+    parser.add_argument('--port', type=int, help="Overrides server.port in config.yaml")
+    args = parser.parse_args()
+
+    config = load_config()
+    server_config = config.get('server', {})
+    server = ConversationServer.from_config(config)
+    server.run(args.host or server_config.get('host', '127.0.0.1'), args.port or server_config.get('port', 8080))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import time
+from collections import Counter
+
+import pytest
+
+from managers.chat_input import ChatQueue, IRCChatClient, dedup_key
+from tools.mock_irc_server import SPAM_MESSAGES, MockIRCServer
+
+def test_dedup_key_ignores_case_stretching_and_repeats():
+    assert dedup_key("LOL lol") == dedup_key("lolll!!") == dedup_key("lol")
+    assert dedup_key("Sam, where is the lunchbox?") != dedup_key("Sam, where is the flashlight?")
+
+def test_user_rate_limit_refills_over_time():
+    queue = ChatQueue(user_rate=1.0, user_burst=2)
+    assert queue.offer('viewer', "one", now=0.0)
+    assert queue.offer('viewer', "two", now=0.0)
+    assert not queue.offer('viewer', "three", now=0.0)
+    assert queue.offer('someone_else', "four", now=0.0)
+    assert queue.offer('viewer', "five", now=1.0)
+    assert queue.get_stats()['rate_limited'] == 1
+
+def test_duplicates_are_dropped_for_the_window_after_the_copy_that_got_through():
+    queue = ChatQueue(user_burst=100, dedup_window=30.0)
+    assert queue.offer('a', "POGGIES", now=0.0)
+    assert not queue.offer('b', "poggies!!!", now=10.0)
+    assert not queue.offer('c', "Poggies", now=29.0)
+    assert queue.offer('d', "poggies", now=30.0)
+    assert queue.get_stats()['duplicates'] == 2
+
+def test_full_queue_evicts_the_lowest_priority_and_batches_in_sent_order():
+    queue = ChatQueue(max_queued=3, batch_size=2, keywords=['sam'])
+    queue.offer('a', "hello there", now=0.0)
+    queue.offer('b', "sam are you scared?", now=0.1)
+    queue.offer('c', "nice stream", now=0.2)
+    queue.offer('d', "where is the lunchbox?", now=0.3)
+    queue.offer('e', "Sam look behind you", now=0.4)
+
+    stats = queue.get_stats()
+    assert stats['depth'] == 3
+    assert stats['evicted'] == 2
+    batch = queue.take_batch(timeout=0)
+    assert [message.text for message in batch] == ["sam are you scared?", "Sam look behind you"]
+    assert queue.get_stats()['stale'] == 1
+
+def test_take_batch_returns_empty_when_woken():
+    queue = ChatQueue()
+    queue.wake()
+    assert queue.take_batch(timeout=0) == []
+
+@pytest.fixture
+def irc_server():
+    server = MockIRCServer()
+    server.start()
+    yield server
+    server.stop()
+
+def test_flood_from_mock_server_is_rate_limited_deduplicated_and_bounded(irc_server):
+    queue = ChatQueue(max_queued=20, batch_size=5, user_rate=0.1, user_burst=2, dedup_window=30.0, keywords=['sam'])
+    accepted = Counter()
+
+    def on_message(user, text, tags):
+        if queue.offer(user, text, tags):
+            accepted[dedup_key(text)] += 1
+
+    client = IRCChatClient('127.0.0.1', irc_server.port, 'justinfan1', 'flood', on_message, timeout=10.0)
+    client.start()
+    try:
+        assert irc_server.joined.wait(5)
+        sent = irc_server.flood('#flood', rate=1000, seconds=1.0, users=50, spam_ratio=0.5, seed=1)
+        deadline = time.monotonic() + 5
+        while client.get_stats()['messages'] < sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        client.stop()
+
+    stats = queue.get_stats()
+    assert stats['received'] == sent > 500
+    # 50 users with a burst of 2 can't get more than about 100 messages through in a second
+    assert stats['rate_limited'] > sent // 2
+    assert stats['duplicates'] > 0
+    assert stats['depth'] == 20
+    for spam in SPAM_MESSAGES:
+        assert accepted[dedup_key(spam)] <= 1
+
+    best = sorted((priority for priority, _, _ in queue.heap), reverse=True)[:5]
+    batch = queue.take_batch(timeout=0)
+    assert len(batch) == 5
+    assert sorted((message.priority for message in batch), reverse=True) == best
+    assert [message.received_at for message in batch] == sorted(message.received_at for message in batch)
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+from gtts import gTTS
+
+from managers.google_tts_manager import GoogleTTSManager
+from tools.fake_services import MP3_FRAME_SECONDS, SILENT_MP3_FRAME, FakeGoogleTTSServer
+
+TEXT = "Sam where did you leave the flashlight this time, because it is really very dark in this cave? No. Look under the big mushroom!"
+SECONDS_PER_CHAR = 0.06
+# Seconds the server holds each answer per byte of it, so longer pieces come back later
+DELAY_PER_BYTE = 5e-6
+
+class LongestLastServer(FakeGoogleTTSServer):
+    """Answers the longer pieces later, so the first piece of TEXT arrives after the ones behind it."""
+
+    def __init__(self):
+        super().__init__(latency=0.0, seconds_per_char=SECONDS_PER_CHAR)
+        self.answered = []
+
+    async def _handle(self, request):
+        response = await super()._handle(request)
+        await asyncio.sleep(len(response.text) * DELAY_PER_BYTE)
+        self.answered.append(len(response.text))
+        return response
+
+def expected_pieces():
+    return [SILENT_MP3_FRAME * max(1, int(len(piece) * SECONDS_PER_CHAR / MP3_FRAME_SECONDS)) for piece in gTTS(text=TEXT, lang='en')._tokenize(TEXT)]
+
+@pytest.fixture
+def google_server():
+    server = LongestLastServer()
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def manager(google_server):
+    return GoogleTTSManager(max_workers=8, timeout=5, endpoint_url=google_server.url)
+
+def test_pieces_are_yielded_in_text_order_whatever_order_they_arrive_in(google_server, manager):
+    pieces = list(manager.stream_audio(TEXT))
+
+    assert pieces == expected_pieces()
+    assert google_server.request_counts['batchexecute'] == len(pieces)
+    # The first piece is the longest, so the server answered it last
+    assert len(pieces[0]) == max(len(piece) for piece in pieces)
+    assert google_server.answered[-1] == max(google_server.answered)
+
+def test_text_to_speech_joins_the_pieces_in_order(manager):
+    assert manager.text_to_speech(TEXT) == b''.join(expected_pieces())
+
+def test_pieces_are_fetched_concurrently(google_server, manager):
+    started = time.perf_counter()
+    manager.text_to_speech(TEXT)
+    elapsed = time.perf_counter() - started
+
+    # One after another they would take the sum of the server's delays; together, about the longest one
+    delays = [length * DELAY_PER_BYTE for length in google_server.answered]
+    assert elapsed < sum(delays)
+
+def test_emotion_markers_are_not_spoken(manager):
+    assert manager.text_to_speech("(whisper) No.") == manager.text_to_speech("No.")
+
+def test_failed_piece_raises(manager, google_server):
+    google_server.error_rate = 1.0
+    with pytest.raises(RuntimeError, match="HTTP 500"):
+        manager.text_to_speech(TEXT)
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from managers.obs_websockets_manager import OBSWebsocketsManager
+from tools.mock_obs_server import MockOBSServer
+
+SCENE = 'AiMan'
+
+@pytest.fixture
+def obs_server():
+    server = MockOBSServer(scenes={SCENE: ['Image', 'Head']})
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def manager(obs_server):
+    manager = OBSWebsocketsManager('127.0.0.1', obs_server.port, None, timeout=5)
+    yield manager
+    manager.disconnect()
+
+def talking_batch(manager, talking):
+    return [
+        manager.source_visibility_request(SCENE, 'Image', talking),
+        manager.source_visibility_request(SCENE, 'Head', talking),
+        manager.filter_visibility_request('Head', 'Move', talking),
+    ]
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_talking_state_goes_out_as_one_batch(obs_server, manager):
+    results = manager.call_batch(talking_batch(manager, False))
+
+    assert [result['requestStatus']['result'] for result in results] == [True, True, True]
+    assert not obs_server.scenes[SCENE]['Image']['sceneItemEnabled']
+    assert not obs_server.scenes[SCENE]['Head']['sceneItemEnabled']
+    assert obs_server.filters[('Head', 'Move')] is False
+    assert obs_server.request_counts['SetSceneItemEnabled'] == 2
+    assert obs_server.request_counts['SetSourceFilterEnabled'] == 1
+
+def test_scene_item_ids_are_looked_up_once(obs_server, manager):
+    manager.call_batch(talking_batch(manager, True))
+    received = obs_server.messages_received
+    manager.call_batch(talking_batch(manager, False))
+
+    assert obs_server.request_counts['GetSceneItemId'] == 2
+    # The second state change is a single RequestBatch message, with no lookups before it
+    assert obs_server.messages_received == received + 1
+
+def test_scene_changes_invalidate_cached_ids(obs_server, manager):
+    manager.call_batch(talking_batch(manager, True))
+    obs_server.remove_scene_item(SCENE, 'Head')
+    new_id = obs_server.add_scene_item(SCENE, 'Head')
+
+    assert wait_for(lambda: (SCENE, 'Head') not in manager.scene_item_ids)
+    batch = talking_batch(manager, False)
+    assert batch[1].data()['sceneItemId'] == new_id
+    results = manager.call_batch(batch)
+    assert all(result['requestStatus']['result'] for result in results)
+
+def test_failed_request_in_a_batch_does_not_fail_the_others(obs_server, manager):
+    batch = talking_batch(manager, False)
+    obs_server.scenes[SCENE].pop('Image')
+    results = manager.call_batch(batch)
+
+    assert [result['requestStatus']['result'] for result in results] == [False, True, True]
+    assert not obs_server.scenes[SCENE]['Head']['sceneItemEnabled']
@@ -0,0 +1,40 @@
+import time
+
+from managers.speculation import SpeculativeResponder
+
+def reply(text):
+    yield f"You said {text}."
+    return f"You said {text}.", None
+
+def speculate(responder, text):
+    responder.on_partial(text)
+    deadline = time.monotonic() + 2
+    while not responder.speculation and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert responder.speculation
+
+def test_speculation_from_the_same_words_is_used():
+    responder = SpeculativeResponder(reply, stable_window=0.01)
+    speculate(responder, "where is the lunchbox")
+    speculation = responder.claim("Where is the lunchbox?")
+
+    assert list(speculation) == ["You said where is the lunchbox."]
+    assert responder.get_stats()['used'] == 1
+
+def test_different_words_are_discarded_but_not_stale():
+    responder = SpeculativeResponder(reply, stable_window=0.01)
+    speculate(responder, "where is the lunchbox")
+
+    assert responder.claim("where is the flashlight") is None
+    stats = responder.get_stats()
+    assert (stats['discarded'], stats['stale']) == (1, 0)
+
+def test_a_changed_conversation_makes_the_speculation_stale():
+    generation = [0]
+    responder = SpeculativeResponder(reply, stable_window=0.01, get_context=lambda: generation[0])
+    speculate(responder, "where is the lunchbox")
+    generation[0] += 1
+
+    assert responder.claim("where is the lunchbox") is None
+    stats = responder.get_stats()
+    assert (stats['discarded'], stats['stale']) == (1, 1)
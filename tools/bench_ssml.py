@@ -0,0 +1,96 @@
+"""Micro-benchmark of the SSML compiler against the original PollyTTSManager.format_text.
+
+It first checks that both produce the same SSML for every sample, then times them
+on short, medium and long replies. Run it from the repository root:
+python -m tools.bench_ssml --number 20000
+"""
+import argparse
+import timeit
+
+from managers.ssml import compile_ssml, compile_ssml_chunks
+
+SAMPLES = {
+    'short': "(high) Oh wow, that is amazing! (normal) I can't believe it.",
+    'medium': (
+        "(whisper) Listen closely. (breath) The thing under the bed is real. (deep) It knows your name, "
+        "and it has been waiting. (loud) RUN! (normal) Just kidding, it's only the cat. (asthma) Or is it? "
+        "(soft) Goodnight, chat. (unknown) Unknown markers are dropped."
+    ),
+    'long': " ".join(
+        f"(higher) Sentence number {i} is squeaky. (normal) And this one is plain. (drunk) This one is sloooow."
+        for i in range(60)
+    ),
+}
+
+def legacy_format_text(text):
+    """PollyTTSManager.format_text as it was before the SSML compiler, kept verbatim for comparison."""
+    emotions = {
+        'high': ['<prosody pitch="+30%">', '</prosody>'],
+        'higher': ['<amazon:effect vocal-tract-length="-80%">', '</amazon:effect>'],
+        'deep': ['<prosody pitch="-30%">', '</prosody>'],
+        'deeper': ['<amazon:effect vocal-tract-length="+80%">', '</amazon:effect>'],
+        'drunk': ['<prosody rate="x-slow">', '</prosody>'],
+        'asthma': ['<amazon:auto-breaths volume="x-loud" frequency="x-high" duration="x-short">', '</amazon:auto-breaths>'],
+        'soft': ['<prosody volume="x-soft">', '</prosody>'],
+        'loud': ['<prosody volume="x-loud">', '</prosody>'],
+        'whisper': ['<amazon:effect name="whispered">', '</amazon:effect>'],
+        'breath': '<amazon:breath duration="x-long" volume="x-loud"/>',
+    }
+
+    import re
+
+    parts = []
+    last_end = 0
+    for match in re.finditer(r'\((\w+)\)', text):
+        if match.start() > last_end:
+            parts.append({'type': 'text', 'content': text[last_end:match.start()]})
+        emotion = match.group(1).lower()
+        if emotion == 'normal':
+            parts.append({'type': 'emotion', 'emotion': 'normal'})
+        elif emotion in emotions:
+            parts.append({'type': 'emotion', 'emotion': emotion})
+        last_end = match.end()
+    if last_end < len(text):
+        parts.append({'type': 'text', 'content': text[last_end:]})
+
+    result = []
+    current_effect = None
+    for i, part in enumerate(parts):
+        if part['type'] == 'text':
+            result.append(part['content'])
+        elif part['type'] == 'emotion':
+            emotion = part['emotion']
+            if emotion == 'normal':
+                if current_effect:
+                    result.append(emotions[current_effect][1])
+                    current_effect = None
+            elif emotion in emotions:
+                if isinstance(emotions[emotion], list):
+                    if current_effect:
+                        result.append(emotions[current_effect][1])
+                    result.append(emotions[emotion][0])
+                    current_effect = emotion
+                else:
+                    result.append(emotions[emotion])
+    if current_effect:
+        result.append(emotions[current_effect][1])
+    return f'<speak>{"".join(result)}</speak>'
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SSML compiler against the legacy format_text.")
+    parser.add_argument('--number', type=int, default=20000, help="Calls per sample and implementation")
+    args = parser.parse_args()
+
+    for name, text in SAMPLES.items():
+        if compile_ssml(text) != legacy_format_text(text):
+            raise RuntimeError(f"SSML compiler output differs from format_text for the {name} sample")
+
+    print(f"{'sample':<8} {'chars':>6} {'legacy us':>10} {'compiled us':>12} {'speedup':>8} {'documents':>10}")
+    for name, text in SAMPLES.items():
+        legacy = timeit.timeit(lambda: legacy_format_text(text), number=args.number) / args.number * 1e6
+        compiled = timeit.timeit(lambda: compile_ssml(text), number=args.number) / args.number * 1e6
+        documents = len(compile_ssml_chunks(text))
+        print(f"{name:<8} {len(text):>6} {legacy:>10.2f} {compiled:>12.2f} {legacy / compiled:>7.2f}x {documents:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""Local stand-ins for the Gemini API, Amazon Polly and Google TTS, with configurable latency and errors.
+
+They speak just enough of the real wire protocol for the unmodified clients to
+talk to them: point GeminiAIManager at FakeGeminiServer with base_url (or
+GEMINI_BASE_URL), PollyTTSManager at FakePollyServer with endpoint_url (or
+AMAZON_POLLY_ENDPOINT_URL) and GoogleTTSManager at FakeGoogleTTSServer with
+endpoint_url (or GOOGLE_TTS_ENDPOINT_URL). Replies are canned and the audio is
+silence of a plausible length, so whole turns can run without a network. Run it
+directly to use them from the app:
+python -m tools.fake_services --gemini-port 8081 --polly-port 8082 --google-port 8083
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter
+
+from aiohttp import web
+
+DEFAULT_REPLIES = [
+    "(high) Poggies, that's a great question! (normal) I think we should look under the big glowing mushroom first. If that doesn't work, we can ask the customs trees nicely.",
+    "Oh no, it's so dark in here. (whisper) I'm a little scared. (normal) But Pajama Sam is never scared for long, so let's keep going!",
+    "(loud) Babaga-BOOSH! (normal) I found my flashlight! It was inside the lunchbox the whole time. Rigged, I tell you, totally rigged!",
+]
+
+# A silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, mono, 1152 samples (~26 ms)
+SILENT_MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0xC4]) + bytes(413)
+MP3_FRAME_SECONDS = 1152 / 44100
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+class _FakeServer:
+    # (HTTP method, path, name of the handler method) for every endpoint the fake answers
+    ROUTES = ()
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, stall_rate=0.0, stall=20.0):
+        """Serve on a background thread. port=0 picks a free port, latency delays every response
+        and error_rate is the fraction of requests answered with an error instead. A stall_rate
+        fraction of requests are held for stall extra seconds, like the real services' worst tail."""
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.request_counts = Counter()
+        self.loop = None
+        self.thread = None
+        self.runner = None
+        self.started = threading.Event()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def start(self):
+        """Start serving on a background thread and return the bound port."""
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self.port
+
+    def stop(self):
+        """Stop the server and its thread."""
+        if self.loop:
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        for method, path, handler in self.ROUTES:
+            app.router.add_route(method, path, getattr(self, handler))
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, self.host, self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+
+    async def _wait(self):
+        delay = self.latency
+        if self.stall_rate and random.random() < self.stall_rate:
+            self.request_counts['stalled'] += 1
+            delay += self.stall
+        await asyncio.sleep(delay)
+
+    def _should_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            self.request_counts['failed'] += 1
+            return True
+        return False
+
+class FakeGeminiServer(_FakeServer):
+    ROUTES = (
+        # Paths look like /v1beta/models/gemini-2.0-flash-lite:streamGenerateContent
+        ('POST', '/{version}/models/{target}', '_handle'),
+        ('POST', '/{version}/cachedContents', '_handle_create_cache'),
+        ('PATCH', '/{version}/cachedContents/{cache_id}', '_handle_update_cache'),
+        ('DELETE', '/{version}/cachedContents/{cache_id}', '_handle_delete_cache'),
+    )
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.3, chunk_delay=0.05, words_per_chunk=6, error_rate=0.0, replies=None, caching=True, stall_rate=0.0, stall=20.0):
+        """Answer generateContent, streamGenerateContent and countTokens like the Gemini API.
+
+        latency is the time to the first token, chunk_delay the gap between streamed chunks.
+        Failed requests get the 503 "model is overloaded" error. Replies cycle through replies.
+        Cached contents can be created, updated and deleted, and requests using one report
+        its tokens as cached; with caching=False creating one fails as unsupported.
+        """
+        super().__init__(host, port, latency, error_rate, stall_rate, stall)
+        self.chunk_delay = chunk_delay
+        self.words_per_chunk = words_per_chunk
+        self.replies = replies or DEFAULT_REPLIES
+        self.next_reply = 0
+        self.caching = caching
+        self.caches = {}  # name -> token count
+        self.next_cache = 1
+
+    async def _handle_create_cache(self, request):
+        self.request_counts['createCachedContent'] += 1
+        body = await request.json()
+        if not self.caching:
+            return self._error(400, 'INVALID_ARGUMENT', f"Model {body.get('model')} is not supported for createCachedContent.")
+        name = f'cachedContents/fake-{self.next_cache}'
+        self.next_cache += 1
+        tokens = self._count_tokens(body)
+        self.caches[name] = tokens
+        return web.json_response(self._cache(name, body.get('model'), tokens, float(body.get('ttl', '3600s').rstrip('s'))))
+
+    async def _handle_update_cache(self, request):
+        self.request_counts['updateCachedContent'] += 1
+        name = f"cachedContents/{request.match_info['cache_id']}"
+        if name not in self.caches:
+            return self._error(404, 'NOT_FOUND', "CachedContent not found (or permission denied)")
+        body = await request.json()
+        return web.json_response(self._cache(name, None, self.caches[name], float(body.get('ttl', '3600s').rstrip('s'))))
+
+    async def _handle_delete_cache(self, request):
+        self.request_counts['deleteCachedContent'] += 1
+        self.caches.pop(f"cachedContents/{request.match_info['cache_id']}", None)
+        return web.json_response({})
+
+    def _cache(self, name, model, tokens, ttl):
+        expire_time = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + ttl))
+        return {'name': name, 'model': model, 'expireTime': expire_time, 'usageMetadata': {'totalTokenCount': tokens}}
+
+    async def _handle(self, request):
+        model, _, method = request.match_info['target'].partition(':')
+        self.request_counts[method] += 1
+        body = await request.json()
+        prompt_tokens = self._count_tokens(body)
+        cached_tokens = 0
+        if body.get('cachedContent'):
+            if body['cachedContent'] not in self.caches:
+                return self._error(403, 'PERMISSION_DENIED', "CachedContent not found (or permission denied)")
+            cached_tokens = self.caches[body['cachedContent']]
+            prompt_tokens += cached_tokens
+
+        if method == 'countTokens':
+            return web.json_response({'totalTokens': prompt_tokens})
+        if method not in ('generateContent', 'streamGenerateContent'):
+            return self._error(404, 'NOT_FOUND', f"Method {method} is not supported by the fake server")
+
+        await self._wait()
+        if self._should_fail():
+            return self._error(503, 'UNAVAILABLE', "The model is overloaded. Please try again later.")
+
+        reply = self.replies[self.next_reply % len(self.replies)]
+        self.next_reply += 1
+        usage = {
+            'promptTokenCount': prompt_tokens,
+            'cachedContentTokenCount': cached_tokens,
+            'candidatesTokenCount': int(len(reply.split()) * 1.33),
+            'totalTokenCount': prompt_tokens + int(len(reply.split()) * 1.33),
+        }
+
+        if method == 'generateContent':
+            return web.json_response(self._candidate(reply, model, usage, 'STOP'))
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        words = reply.split(' ')
+        try:
+            await response.prepare(request)
+            for start in range(0, len(words), self.words_per_chunk):
+                last = start + self.words_per_chunk >= len(words)
+                text = ' '.join(words[start:start + self.words_per_chunk]) + ('' if last else ' ')
+                # Like the real API, usage metadata is only complete on the last chunk
+                chunk = self._candidate(text, model, usage if last else {'promptTokenCount': prompt_tokens}, 'STOP' if last else None)
+                await response.write(f'data: {json.dumps(chunk)}\r\n\r\n'.encode('utf-8'))
+                if not last:
+                    await asyncio.sleep(self.chunk_delay)
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client gave up on the request, e.g. a hedged copy that lost
+            self.request_counts['abandoned'] += 1
+        return response
+
+    def _candidate(self, text, model, usage, finish_reason):
+        candidate = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+        if finish_reason:
+            candidate['finishReason'] = finish_reason
+        return {'candidates': [candidate], 'usageMetadata': usage, 'modelVersion': model}
+
+    def _count_tokens(self, body):
+        words = 0
+        for content in body.get('contents', []) + [body.get('systemInstruction') or {}]:
+            for part in content.get('parts', []):
+                words += len(part.get('text', '').split())
+        return int(words * 1.33)
+
+    def _error(self, status, status_name, message):
+        return web.json_response({'error': {'code': status, 'message': message, 'status': status_name}}, status=status)
+
+class FakePollyServer(_FakeServer):
+    ROUTES = (('POST', '/v1/speech', '_handle'),)
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.1, seconds_per_char=0.06, chunk_delay=0.01, error_rate=0.0, stall_rate=0.0, stall=20.0):
+        """Answer SynthesizeSpeech like Amazon Polly, with silence as long as the text would take to say.
+
+        latency is the time to the first byte; the audio then arrives in a few chunks
+        chunk_delay apart. Failed requests get a 500 ServiceFailureException, which
+        botocore retries like it would against the real service.
+        """
+        super().__init__(host, port, latency, error_rate, stall_rate, stall)
+        self.seconds_per_char = seconds_per_char
+        self.chunk_delay = chunk_delay
+
+    async def _handle(self, request):
+        self.request_counts['SynthesizeSpeech'] += 1
+        body = await request.json()
+        await self._wait()
+        if self._should_fail():
+            return web.json_response(
+                {'message': 'Injected failure'},
+                status=500,
+                headers={'x-amzn-ErrorType': 'ServiceFailureException'}
+            )
+
+        characters = len(TAG_PATTERN.sub('', body['Text']))
+        seconds = characters * self.seconds_per_char
+        if body['OutputFormat'] == 'pcm':
+            sample_rate = int(body.get('SampleRate', 16000))
+            audio = bytes(int(seconds * sample_rate) * 2)
+            content_type = 'audio/pcm'
+        elif body['OutputFormat'] == 'mp3':
+            audio = SILENT_MP3_FRAME * max(1, int(seconds / MP3_FRAME_SECONDS))
+            content_type = 'audio/mpeg'
+        else:
+            return web.json_response(
+                {'message': f"OutputFormat {body['OutputFormat']} is not supported by the fake server"},
+                status=400,
+                headers={'x-amzn-ErrorType': 'ValidationException'}
+            )
+
+        response = web.StreamResponse(headers={
+            'Content-Type': content_type,
+            'x-amzn-RequestCharacters': str(characters),
+        })
+        response.content_length = len(audio)
+        chunk_size = max(1, len(audio) // 4)
+        try:
+            await response.prepare(request)
+            for start in range(0, len(audio), chunk_size):
+                await response.write(audio[start:start + chunk_size])
+                await asyncio.sleep(self.chunk_delay)
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client gave up on the request, e.g. a hedged copy that lost
+            self.request_counts['abandoned'] += 1
+        return response
+
+class FakeGoogleTTSServer(_FakeServer):
+    ROUTES = (('POST', '/_/TranslateWebserverUi/data/batchexecute', '_handle'),)
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.15, seconds_per_char=0.06, error_rate=0.0, stall_rate=0.0, stall=20.0):
+        """Answer the Google Translate batchexecute TTS calls gTTS makes, one ~100 character piece per request.
+
+        latency is the time to answer each piece. Failed requests get a 500.
+        """
+        super().__init__(host, port, latency, error_rate, stall_rate, stall)
+        self.seconds_per_char = seconds_per_char
+
+    async def _handle(self, request):
+        self.request_counts['batchexecute'] += 1
+        form = urllib.parse.parse_qs(await request.text())
+        # f.req is [[["jQ1olc", "[text, lang, speed, null]", null, "generic"]]]
+        text = json.loads(json.loads(form['f.req'][0])[0][0][1])[0]
+        await self._wait()
+        if self._should_fail():
+            return web.Response(status=500, text="Injected failure")
+
+        audio = SILENT_MP3_FRAME * max(1, int(len(text) * self.seconds_per_char / MP3_FRAME_SECONDS))
+        # Compact, like Google's own responses; clients match on '"jQ1olc","[\\"'
+        payload = json.dumps([base64.b64encode(audio).decode('ascii')], separators=(',', ':'))
+        envelope = json.dumps([['wrb.fr', 'jQ1olc', payload, None, None, None, 'generic']], separators=(',', ':'))
+        return web.Response(text=f")]}}'\n\n{len(envelope)}\n{envelope}\n", content_type='application/json')
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake Gemini, Polly and Google TTS endpoints.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--gemini-port', type=int, default=8081)
+    parser.add_argument('--polly-port', type=int, default=8082)
+    parser.add_argument('--google-port', type=int, default=8083)
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="Seconds to the first token")
+    parser.add_argument('--tts-latency', type=float, default=0.1, help="Seconds to the first audio byte")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument('--llm-stall-rate', type=float, default=0.0, help="Fraction of Gemini requests that stall")
+    parser.add_argument('--tts-stall-rate', type=float, default=0.0, help="Fraction of Polly requests that stall")
+    parser.add_argument('--stall', type=float, default=20.0, help="Seconds a stalled request is held")
+    args = parser.parse_args()
+
+    gemini = FakeGeminiServer(args.host, args.gemini_port, latency=args.llm_latency, error_rate=args.error_rate, stall_rate=args.llm_stall_rate, stall=args.stall)
+    polly = FakePollyServer(args.host, args.polly_port, latency=args.tts_latency, error_rate=args.error_rate, stall_rate=args.tts_stall_rate, stall=args.stall)
+    google = FakeGoogleTTSServer(args.host, args.google_port, latency=args.tts_latency, error_rate=args.error_rate)
+    gemini.start()
+    polly.start()
+    google.start()
+    print(f"Fake Gemini API listening on {gemini.url} (GEMINI_BASE_URL)")
+    print(f"Fake Polly listening on {polly.url} (AMAZON_POLLY_ENDPOINT_URL)")
+    print(f"Fake Google TTS listening on {google.url} (GOOGLE_TTS_ENDPOINT_URL)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        gemini.stop()
+        polly.stop()
+        google.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""Replay recorded transcripts through AIChatApp's turn loop against local fakes.
+
+Gemini, Polly, Google TTS and OBS are replaced by the stand-ins in tools/fake_services.py
+and tools/mock_obs_server.py, with configurable latency and error rates, and
+speech-to-text by ReplaySTTManager, which hands out the transcripts at a target
+number of turns per second. Everything else (chunking, SSML, TTS, decoding,
+playback on a dummy audio device, OBS batching, tracing) is the real code with
+the settings from config.yaml, so a change in any of it shows up as a change
+in throughput or latency without a network, microphone or OBS.
+
+The app answers one turn at a time, so a target rate above what it can keep up
+with shows up as schedule lag: how late each turn could start.
+
+Run it from the repository root:
+python -m tools.load_harness tools/sample_transcripts.txt --rate 0.5 --turns 20 --tts-error-rate 0.05 --output load.json
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import time
+
+from managers import tracing
+from tools.fake_services import FakeGeminiServer, FakeGoogleTTSServer, FakePollyServer
+from tools.mock_obs_server import MockOBSServer
+
+MARKS = ('stt.transcribed', 'llm.first_token', 'llm.done', 'tts.first_byte', 'playback.start', 'playback.end')
+
+def load_transcripts(path):
+    """Load one transcript per line, or the "text" of every line of a .jsonl file. Blank and # lines are skipped."""
+    transcripts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            transcripts.append(json.loads(line)['text'] if path.endswith('.jsonl') else line)
+    return transcripts
+
+class ReplaySTTManager:
+    def __init__(self, transcripts, rate=1.0, words_per_second=2.5):
+        """Hand out recorded transcripts as if they had just been said, one every 1/rate seconds.
+
+        The schedule starts at the first process_once call. If the app is still busy with an
+        earlier turn when the next one is due, it is handed out late and the delay is added to
+        lags. When partial transcripts are wanted (speculation), each transcript is "said" at
+        words_per_second, ending when it is due, with growing prefixes going to on_partial.
+        """
+        if rate <= 0:
+            raise ValueError(f"The replay rate must be positive, not {rate}")
+        self.transcripts = list(transcripts)
+        self.interval = 1.0 / rate
+        self.words_per_second = words_per_second
+        self.next_index = 0
+        self.started_at = None
+        self.lags = []
+        self.on_partial = None
+        self.on_recording_stop = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the manager from config.yaml's stt.replay section (transcripts is a list or a file)."""
+        replay = config['stt']['replay']
+        transcripts = replay['transcripts']
+        if isinstance(transcripts, str):
+            transcripts = load_transcripts(transcripts)
+        return cls(transcripts, rate=replay.get('rate', 1.0), words_per_second=replay.get('words_per_second', 2.5))
+
+    @property
+    def remaining(self):
+        return len(self.transcripts) - self.next_index
+
+    def process_once(self):
+        """Wait until the next transcript is due and return it, or None once all have been replayed."""
+        if not self.remaining:
+            return None
+        now = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = now
+        due = self.started_at + self.next_index * self.interval
+        text = self.transcripts[self.next_index]
+        self.next_index += 1
+
+        words = text.split()
+        speaking = len(words) / self.words_per_second if self.on_partial and words else 0.0
+        # The user can't start talking before we listen, so a late turn ends late too
+        end = max(due, now + speaking)
+        if speaking:
+            for count in range(1, len(words) + 1):
+                self._sleep_until(end - speaking + count * speaking / len(words))
+                self.on_partial(' '.join(words[:count]))
+        self._sleep_until(end)
+        self.lags.append(end - due)
+
+        if self.on_recording_stop:
+            self.on_recording_stop()
+        return text
+
+    def listen_for_speech(self, on_speech_start):
+        pass
+
+    def stop_listening_for_speech(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def _sleep_until(self, deadline):
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+def summarize(values):
+    """Count, mean, p50/p95/p99 (nearest rank) and max of a list of seconds."""
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    summary = {'count': len(values), 'mean': statistics.mean(values)}
+    for quantile in (0.5, 0.95, 0.99):
+        summary[f'p{int(quantile * 100)}'] = values[min(len(values) - 1, int(quantile * len(values)))]
+    summary['max'] = values[-1]
+    return summary
+
+def harness_config(config, transcripts, rate, gemini, polly, google, cache=False):
+    """Copy config, pointing every provider at the fakes and switching off what needs a person at the keyboard."""
+    config = copy.deepcopy(config)
+    config.setdefault('providers', {})
+    config['providers']['stt'] = 'tools.load_harness:ReplaySTTManager'
+    config['providers']['llm'] = 'gemini'
+    config['providers']['tts'] = 'polly'
+    config['providers']['tts_fallback'] = 'google'
+    config['stt']['replay'] = {'transcripts': transcripts, 'rate': rate}
+    config['stt']['continuous'] = True
+    config['barge_in'] = dict(config.get('barge_in', {}), enabled=False)
+    config['ai']['base_url'] = gemini.url
+    # If compaction is enabled it still runs, but the streamer's saved conversation is neither loaded nor overwritten
+    config['ai']['compaction'] = dict(config['ai'].get('compaction', {}), state_path=None)
+    config['tts']['endpoint_url'] = polly.url
+    config['tts']['google_endpoint_url'] = google.url
+    # A cache would hide the TTS cost of every repeated line
+    config['tts']['cache'] = dict(config['tts'].get('cache', {}), enabled=cache)
+    # The harness collects the traces itself
+    config['tracing'] = dict(config.get('tracing', {}), enabled=False)
+    config['pipeline'] = dict(config.get('pipeline', {}), mode='serial')
+    return config
+
+def obs_scenes(config):
+    """The scene items config.yaml refers to, so the mock OBS server knows them."""
+    obs_config = config['obs']
+    scenes = {obs_config['image']['scene_name']: [obs_config['image']['source_name']]}
+    for section in ('head', 'lip_sync'):
+        if obs_config.get(section, {}).get('enabled', False):
+            scenes.setdefault(obs_config[section]['scene_name'], []).append(obs_config[section]['source_name'])
+    return scenes
+
+def run(config, transcripts, rate, llm_latency=0.3, llm_chunk_delay=0.05, tts_latency=0.1, seconds_per_char=0.06, obs_latency=0.005,
+        llm_error_rate=0.0, tts_error_rate=0.0, obs_error_rate=0.0, llm_stall_rate=0.0, tts_stall_rate=0.0, stall=20.0, cache=False, jsonl_path=None):
+    """Replay the transcripts through AIChatApp against fresh fakes and return the report."""
+    # Imported here because main loads .env on import, which would override the fakes set below
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    from main import AIChatApp
+
+    gemini = FakeGeminiServer(latency=llm_latency, chunk_delay=llm_chunk_delay, error_rate=llm_error_rate, stall_rate=llm_stall_rate, stall=stall)
+    polly = FakePollyServer(latency=tts_latency, seconds_per_char=seconds_per_char, error_rate=tts_error_rate, stall_rate=tts_stall_rate, stall=stall)
+    google = FakeGoogleTTSServer(latency=tts_latency, seconds_per_char=seconds_per_char, error_rate=tts_error_rate)
+    obs = MockOBSServer(latency=obs_latency, scenes=obs_scenes(config), error_rate=obs_error_rate)
+    gemini.start()
+    polly.start()
+    google.start()
+    obs.start()
+
+    os.environ.update({
+        'GEMINI_API_KEY': 'fake',
+        'AMAZON_POLLY_ACCESS_KEY_ID': 'fake',
+        'AMAZON_POLLY_SECRET_ACCESS_KEY': 'fake',
+        'OBS_WEBSOCKET_URL': obs.host,
+        'OBS_WEBSOCKET_PORT': str(obs.port),
+        'USE_OBS_WEBSOCKET_PASSWORD': '0',
+    })
+
+    records = []
+    tracing.configure(jsonl_path=jsonl_path, on_turn=records.append)
+    app = AIChatApp(harness_config(config, transcripts, rate, gemini, polly, google, cache))
+    errors = []
+    try:
+        stt = app.speech_to_text
+        while stt.remaining:
+            user_input = app.listen_once()
+            try:
+                app.handle_turn(user_input)
+            except Exception as e:
+                errors.append(str(e))
+                print(f"Turn {len(records)} failed: {e}")
+        elapsed = time.perf_counter() - stt.started_at
+    finally:
+        app.shutdown()
+        for server in (gemini, polly, google, obs):
+            server.stop()
+
+    spans = {}
+    for record in records:
+        for span in record['spans']:
+            spans.setdefault(span['name'], []).append(span['duration'])
+
+    return {
+        'turns': len(records),
+        'errors': len(errors),
+        'error_messages': errors,
+        'elapsed': elapsed,
+        'target_rate': rate,
+        'achieved_rate': len(records) / elapsed if elapsed else None,
+        'lag': summarize(stt.lags),
+        'turn': summarize([record['duration'] for record in records]),
+        'marks': {name: summarize([record['marks'][name] for record in records if name in record['marks']]) for name in MARKS},
+        'spans': {name: summarize(durations) for name, durations in sorted(spans.items())},
+        'requests': {
+            'gemini': dict(gemini.request_counts),
+            'polly': dict(polly.request_counts),
+            'google': dict(google.request_counts),
+            'obs': dict(obs.request_counts),
+        },
+    }
+
+def print_report(report):
+    print(f"\n{report['turns']} turns in {report['elapsed']:.1f}s: {report['achieved_rate']:.3f} turns/s "
+          f"(target {report['target_rate']:.3f}), {report['errors']} failed")
+    print(f"\n{'':<22} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    rows = [('schedule lag', report['lag']), ('turn', report['turn'])]
+    rows += [(name, summary) for name, summary in report['marks'].items()]
+    rows += [(name, summary) for name, summary in report['spans'].items()]
+    for name, summary in rows:
+        if not summary['count']:
+            continue
+        print(f"{name:<22} {summary['count']:>6} {summary['p50']:>7.3f}s {summary['p95']:>7.3f}s {summary['p99']:>7.3f}s {summary['max']:>7.3f}s")
+    print("\nMarks are measured from the end of the user's turn, spans are durations.")
+    for service, counts in report['requests'].items():
+        print(f"{service} requests: {', '.join(f'{name} {count}' for name, count in sorted(counts.items()))}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay transcripts through the app against local fakes and report throughput and latency.")
+    parser.add_argument('transcripts', help="Text file with one transcript per line, or .jsonl with a \"text\" per line")
+    parser.add_argument('--rate', type=float, default=0.5, help="Target turns per second")
+    parser.add_argument('--turns', type=int, help="Number of turns, cycling through the transcripts (default: each once)")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="Seconds to the first token")
+    parser.add_argument('--llm-chunk-delay', type=float, default=0.05, help="Seconds between streamed chunks")
+    parser.add_argument('--tts-latency', type=float, default=0.1, help="Seconds to the first audio byte")
+    parser.add_argument('--seconds-per-char', type=float, default=0.06, help="Length of the fake speech; lower it to spend less time in playback")
+    parser.add_argument('--obs-latency', type=float, default=0.005, help="Seconds OBS takes to answer")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--tts-error-rate', type=float, default=0.0)
+    parser.add_argument('--obs-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-stall-rate', type=float, default=0.0, help="Fraction of Gemini requests that stall")
+    parser.add_argument('--tts-stall-rate', type=float, default=0.0, help="Fraction of Polly requests that stall")
+    parser.add_argument('--stall', type=float, default=20.0, help="Seconds a stalled request is held")
+    parser.add_argument('--cache', action='store_true', help="Keep the TTS cache enabled")
+    parser.add_argument('--jsonl', help="Also write every turn's trace to this JSONL file")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    from main import load_config
+    transcripts = load_transcripts(args.transcripts)
+    if not transcripts:
+        raise ValueError(f"No transcripts found in {args.transcripts}")
+    if args.turns:
+        transcripts = [transcripts[i % len(transcripts)] for i in range(args.turns)]
+
+    report = run(
+        load_config(),
+        transcripts,
+        args.rate,
+        llm_latency=args.llm_latency,
+        llm_chunk_delay=args.llm_chunk_delay,
+        tts_latency=args.tts_latency,
+        seconds_per_char=args.seconds_per_char,
+        obs_latency=args.obs_latency,
+        llm_error_rate=args.llm_error_rate,
+        tts_error_rate=args.tts_error_rate,
+        obs_error_rate=args.obs_error_rate,
+        llm_stall_rate=args.llm_stall_rate,
+        tts_stall_rate=args.tts_stall_rate,
+        stall=args.stall,
+        cache=args.cache,
+        jsonl_path=args.jsonl
+    )
+    print_report(report)
+
+    if args.output:
+        report['created'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
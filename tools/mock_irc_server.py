@@ -0,0 +1,200 @@
+"""A local stand-in for an IRC chat server such as Twitch's.
+
+It speaks enough IRC (NICK/USER/PASS, CAP, JOIN, PING/PONG) for IRCChatClient to
+connect and join, and can replay a chat flood: messages from many users at a
+fixed rate, a share of them spam copies, with Twitch-style tags. Run it directly
+and point config.yaml's chat section at it (host 127.0.0.1, tls false):
+python -m tools.mock_irc_server --port 6667 --rate 100 --spam-ratio 0.5
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+
+SAMPLE_MESSAGES = [
+    "Sam where is your flashlight?",
+    "what's in the lunchbox",
+    "go left at the trees",
+    "have you seen your 24 brothers?",
+    "is Elgrin behind the door?",
+    "try talking to the customs trees",
+    "say babaga-boosh!",
+    "are you scared of the dark right now?",
+    "rigged",
+    "the mask is under the bridge i think",
+]
+# Tacked onto the sample messages so genuine chat doesn't repeat itself like spam does
+ASIDES = ["lol", "pls", "chat", "for real", "i think", "right?", "haha", "no way", "omg", "again", "quick", "bro", "today", "now"]
+SPAM_MESSAGES = ["LOL", "lolllll", "POGGIES", "poggies!!!", "KEKW KEKW KEKW", "W", "first", "sam sam sam"]
+BADGES = ['', '', '', 'subscriber/3', 'subscriber/12', 'vip/1', 'moderator/1']
+
+class MockIRCServer:
+    def __init__(self, host='127.0.0.1', port=0, server_name='mock.irc'):
+        """Create the server. port=0 picks a free port."""
+        self.host = host
+        self.port = port
+        self.server_name = server_name
+        self.channels = {}  # channel -> set of client writers
+        self.counts = Counter()
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+        self.joined = threading.Event()
+
+    def start(self):
+        """Start serving on a background thread and return the bound port."""
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self.port
+
+    def stop(self):
+        """Stop the server, drop every client and stop the thread."""
+        if self.loop:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def say(self, channel, user, text, tags=None):
+        """Send a chat message from user to everyone in channel."""
+        line = self._privmsg(channel, user, text, tags)
+        asyncio.run_coroutine_threadsafe(self._broadcast(channel, [line]), self.loop).result()
+
+    def ping(self):
+        """PING every client; their PONGs are counted in counts['PONG']."""
+        asyncio.run_coroutine_threadsafe(self._broadcast(None, [f'PING :{self.server_name}']), self.loop).result()
+
+    def flood(self, channel, rate, seconds, users=500, spam_ratio=0.5, seed=None):
+        """Send rate messages per second for seconds from users distinct users, spam_ratio of them spam copies.
+
+        Blocks until done and returns the number of messages sent.
+        """
+        return asyncio.run_coroutine_threadsafe(self._flood(channel, rate, seconds, users, spam_ratio, seed), self.loop).result()
+
+    async def _flood(self, channel, rate, seconds, users, spam_ratio, seed):
+        generator = random.Random(seed)
+        tick = 0.01
+        sent = 0
+        started = self.loop.time()
+        while self.loop.time() - started < seconds:
+            # Catch up to the schedule in one write, so high rates don't depend on sleep precision
+            due = int((self.loop.time() - started) * rate) - sent
+            lines = []
+            for _ in range(due):
+                user = f'viewer{generator.randrange(users)}'
+                if generator.random() < spam_ratio:
+                    text = generator.choice(SPAM_MESSAGES)
+                else:
+                    text = f"{generator.choice(SAMPLE_MESSAGES)} {' '.join(generator.sample(ASIDES, 2))} {generator.randrange(100)}"
+                lines.append(self._privmsg(channel, user, text, {'display-name': user, 'badges': generator.choice(BADGES)}))
+            if lines:
+                await self._broadcast(channel, lines)
+                sent += len(lines)
+            await asyncio.sleep(tick)
+        return sent
+
+    def _privmsg(self, channel, user, text, tags):
+        prefix = ''
+        if tags:
+            prefix = '@' + ';'.join(f'{key}={value}' for key, value in tags.items()) + ' '
+        return f'{prefix}:{user}!{user}@{user}.{self.server_name} PRIVMSG {channel} :{text}'
+
+    async def _broadcast(self, channel, lines):
+        writers = self.channels.get(channel, set()) if channel else set().union(*self.channels.values())
+        data = ''.join(f'{line}\r\n' for line in lines).encode('utf-8')
+        for writer in list(writers):
+            writer.write(data)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                self._part(writer)
+        self.counts['sent'] += len(lines) * len(writers)
+
+    async def _shutdown(self):
+        for writers in self.channels.values():
+            for writer in list(writers):
+                writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle_client, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+
+    def _part(self, writer):
+        for writers in self.channels.values():
+            writers.discard(writer)
+
+    async def _handle_client(self, reader, writer):
+        self.counts['connections'] += 1
+        nick = None
+        registered = False
+
+        def send(line):
+            writer.write(f':{self.server_name} {line}\r\n'.encode('utf-8'))
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, params = line.decode('utf-8', errors='replace').rstrip('\r\n').partition(' ')
+                command = command.upper()
+                self.counts[command] += 1
+                if command == 'CAP' and params.startswith('REQ'):
+                    send(f'CAP * ACK {params[4:]}')
+                elif command == 'NICK':
+                    nick = params.lstrip(':')
+                elif command == 'USER' and nick and not registered:
+                    registered = True
+                    send(f'001 {nick} :Welcome to the mock IRC server, {nick}')
+                elif command == 'JOIN':
+                    for channel in params.split(','):
+                        self.channels.setdefault(channel, set()).add(writer)
+                        writer.write(f':{nick}!{nick}@{nick}.{self.server_name} JOIN {channel}\r\n'.encode('utf-8'))
+                    self.joined.set()
+                elif command == 'PING':
+                    send(f'PONG {self.server_name} {params}')
+                elif command == 'QUIT':
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._part(writer)
+            writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock IRC chat server, optionally flooding joined clients with chat.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--channel', default='#babagaboosh')
+    parser.add_argument('--rate', type=float, default=0.0, help="Chat messages per second once a client has joined (0 for none)")
+    parser.add_argument('--users', type=int, default=500, help="Distinct users the messages come from")
+    parser.add_argument('--spam-ratio', type=float, default=0.5, help="Fraction of messages that are spam copies")
+    parser.add_argument('--seconds', type=float, default=3600.0, help="How long to keep flooding")
+    args = parser.parse_args()
+
+    server = MockIRCServer(args.host, args.port)
+    port = server.start()
+    print(f"Mock IRC server listening on {args.host}:{port}, channel {args.channel}")
+    try:
+        if args.rate:
+            server.joined.wait()
+            print(f"Client joined, sending {args.rate:g} messages per second")
+            sent = server.flood(args.channel, args.rate, args.seconds, args.users, args.spam_ratio)
+            print(f"Sent {sent} messages")
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
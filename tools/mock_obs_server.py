@@ -0,0 +1,217 @@
+"""A local stand-in for the OBS obs-websocket v5 server.
+
+It speaks enough of the protocol (Hello/Identify, requests, request batches and
+scene item events) to exercise OBSWebsocketsManager without OBS running, and
+counts every request so round trips can be checked. Run it directly to point
+the app at it: python -m tools.mock_obs_server --port 4455
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from aiohttp import web
+
+class MockOBSServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, scenes=None, error_rate=0.0):
+        """Create the server. port=0 picks a free port, latency adds a delay to every response
+        and error_rate is the fraction of requests that fail like OBS does when it can't act on one."""
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        # scene name -> source name -> scene item state
+        self.scenes = {}
+        self.filters = {}  # (source_name, filter_name) -> enabled
+        self.inputs = {}  # input name -> settings
+        self.current_scene = None
+        self.request_counts = Counter()
+        self.messages_received = 0
+        self.next_item_id = 1
+        self.clients = set()
+        self.loop = None
+        self.thread = None
+        self.runner = None
+        self.started = threading.Event()
+
+        for scene_name, sources in (scenes or {}).items():
+            for source_name in sources:
+                self.add_scene_item(scene_name, source_name)
+
+    def add_scene_item(self, scene_name, source_name):
+        """Add a source to a scene, notifying connected clients like OBS would."""
+        item_id = self.next_item_id
+        self.next_item_id += 1
+        self.scenes.setdefault(scene_name, {})[source_name] = {
+            'sceneItemId': item_id,
+            'sceneItemEnabled': True,
+            'sceneItemTransform': {
+                'positionX': 0.0, 'positionY': 0.0, 'scaleX': 1.0, 'scaleY': 1.0, 'rotation': 0.0,
+                'sourceWidth': 100.0, 'sourceHeight': 100.0, 'width': 100.0, 'height': 100.0,
+                'cropLeft': 0, 'cropRight': 0, 'cropTop': 0, 'cropBottom': 0,
+            },
+        }
+        self.emit_event('SceneItemCreated', {'sceneName': scene_name, 'sourceName': source_name, 'sceneItemId': item_id})
+        return item_id
+
+    def remove_scene_item(self, scene_name, source_name):
+        """Remove a source from a scene, notifying connected clients like OBS would."""
+        item = self.scenes.get(scene_name, {}).pop(source_name)
+        self.emit_event('SceneItemRemoved', {'sceneName': scene_name, 'sourceName': source_name, 'sceneItemId': item['sceneItemId']})
+
+    def emit_event(self, event_type, event_data):
+        """Send an event to every connected client."""
+        if self.loop is None:
+            return
+        message = json.dumps({'op': 5, 'd': {'eventType': event_type, 'eventIntent': 1, 'eventData': event_data}})
+        for ws in list(self.clients):
+            asyncio.run_coroutine_threadsafe(ws.send_str(message), self.loop)
+
+    def start(self):
+        """Start serving on a background thread and return the bound port."""
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self.port
+
+    def stop(self):
+        """Stop the server and its thread."""
+        if self.loop:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    async def _shutdown(self):
+        # Close client connections first, like OBS does when it quits
+        for ws in list(self.clients):
+            await ws.close()
+        await self.runner.cleanup()
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_get('/', self._handle_websocket)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, self.host, self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+
+    async def _handle_websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({'op': 0, 'd': {'obsWebSocketVersion': '5.0.0-mock', 'rpcVersion': 1}}))
+        self.clients.add(ws)
+        try:
+            async for message in ws:
+                self.messages_received += 1
+                data = json.loads(message.data)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if data['op'] == 1:  # Identify
+                    await ws.send_str(json.dumps({'op': 2, 'd': {'negotiatedRpcVersion': 1}}))
+                elif data['op'] == 6:  # Request
+                    d = data['d']
+                    response = self._handle_request(d['requestType'], d.get('requestData', {}))
+                    response['requestId'] = d['requestId']
+                    await ws.send_str(json.dumps({'op': 7, 'd': response}))
+                elif data['op'] == 8:  # RequestBatch
+                    d = data['d']
+                    results = []
+                    for request_item in d['requests']:
+                        result = self._handle_request(request_item['requestType'], request_item.get('requestData', {}))
+                        results.append(result)
+                        if d.get('haltOnFailure') and not result['requestStatus']['result']:
+                            break
+                    await ws.send_str(json.dumps({'op': 9, 'd': {'requestId': d['requestId'], 'results': results}}))
+        finally:
+            self.clients.discard(ws)
+        return ws
+
+    def _handle_request(self, request_type, data):
+        self.request_counts[request_type] += 1
+        if self.error_rate and random.random() < self.error_rate:
+            self.request_counts['failed'] += 1
+            return {'requestType': request_type, 'requestStatus': {'result': False, 'code': 702, 'comment': 'Injected failure'}}
+        try:
+            response_data = getattr(self, f'_request_{request_type}')(data)
+        except (AttributeError, KeyError) as e:
+            return {'requestType': request_type, 'requestStatus': {'result': False, 'code': 600, 'comment': str(e)}}
+        result = {'requestType': request_type, 'requestStatus': {'result': True, 'code': 100}}
+        if response_data is not None:
+            result['responseData'] = response_data
+        return result
+
+    def _find_item(self, data):
+        for item in self.scenes[data['sceneName']].values():
+            if item['sceneItemId'] == data['sceneItemId']:
+                return item
+        raise KeyError(data['sceneItemId'])
+
+    def _request_GetVersion(self, data):
+        return {'obsVersion': '30.0.0', 'obsWebSocketVersion': '5.0.0-mock'}
+
+    def _request_GetSceneItemId(self, data):
+        return {'sceneItemId': self.scenes[data['sceneName']][data['sourceName']]['sceneItemId']}
+
+    def _request_GetSceneItemList(self, data):
+        return {'sceneItems': [
+            {'sourceName': name, 'sceneItemId': item['sceneItemId'], 'sceneItemEnabled': item['sceneItemEnabled']}
+            for name, item in self.scenes[data['sceneName']].items()
+        ]}
+
+    def _request_SetSceneItemEnabled(self, data):
+        self._find_item(data)['sceneItemEnabled'] = data['sceneItemEnabled']
+
+    def _request_GetSceneItemTransform(self, data):
+        return {'sceneItemTransform': dict(self._find_item(data)['sceneItemTransform'])}
+
+    def _request_SetSceneItemTransform(self, data):
+        self._find_item(data)['sceneItemTransform'].update(data['sceneItemTransform'])
+
+    def _request_SetSourceFilterEnabled(self, data):
+        self.filters[(data['sourceName'], data['filterName'])] = data['filterEnabled']
+
+    def _request_SetCurrentProgramScene(self, data):
+        self.current_scene = data['sceneName']
+
+    def _request_GetInputSettings(self, data):
+        return {'inputSettings': dict(self.inputs.get(data['inputName'], {'text': ''})), 'inputKind': 'text_gdiplus_v2'}
+
+    def _request_SetInputSettings(self, data):
+        self.inputs.setdefault(data['inputName'], {}).update(data['inputSettings'])
+
+    def _request_GetInputKindList(self, data):
+        return {'inputKinds': ['text_gdiplus_v2', 'image_source']}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock obs-websocket v5 server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4455)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument('--scene', action='append', default=[], help="scene_name:source_name to create (repeatable)")
+    args = parser.parse_args()
+
+    scenes = {}
+    for entry in args.scene:
+        scene_name, source_name = entry.split(':', 1)
+        scenes.setdefault(scene_name, []).append(source_name)
+
+    server = MockOBSServer(args.host, args.port, args.latency, scenes, args.error_rate)
+    port = server.start()
+    print(f"Mock OBS websocket server listening on ws://{args.host}:{port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""Offline benchmark of SpeechToTextManager over recorded WAV fixtures.
+
+Every fixture is a 16-bit PCM WAV file with its reference transcript next to it
+(hello.wav + hello.txt). Each one is fed in real time through the same
+AudioToTextRecorder setup the app uses, with use_microphone=False, followed by
+silence until the transcript comes back. Silence detection runs on wall-clock
+time, which is why the audio can't be fed faster than real time.
+
+Reported per model and compute type:
+- real-time factor: transcription time / speech duration
+- end-of-speech-to-text latency, which includes the silence timeout (n/a for a fixture
+  whose recording stopped at a pause before its end, counted as truncated)
+- word error rate against the reference
+- peak RSS and CPU seconds of this process and its children (needs psutil)
+
+Run it from the repository root:
+python -m tools.stt_benchmark fixtures/ --models tiny base small --compute-types int8 float32 --output stt.json
+"""
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import statistics
+import threading
+import time
+import wave
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from managers.realtime_stt_manager import SpeechToTextManager
+from managers.speculation import normalize_transcript
+
+CHUNK_SECONDS = 0.02
+LEAD_IN_SECONDS = 0.5
+
+def load_fixtures(directory):
+    """Load (name, 16-bit mono samples, sample rate, reference text) for every WAV with a .txt next to it."""
+    fixtures = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith('.wav'):
+            continue
+        name = os.path.splitext(filename)[0]
+        reference_path = os.path.join(directory, name + '.txt')
+        if not os.path.exists(reference_path):
+            print(f"Skipping {filename}: no {name}.txt reference transcript")
+            continue
+
+        with wave.open(os.path.join(directory, filename), 'rb') as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError(f"{filename} must be 16-bit PCM")
+            sample_rate = wav.getframerate()
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            if wav.getnchannels() > 1:
+                samples = samples.reshape(-1, wav.getnchannels()).mean(axis=1).astype(np.int16)
+        with open(reference_path, 'r', encoding='utf-8') as f:
+            reference = f.read().strip()
+        fixtures.append((name, samples, sample_rate, reference))
+    return fixtures
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance between the transcripts, divided by the reference length."""
+    reference_words = normalize_transcript(reference).split()
+    hypothesis_words = normalize_transcript(hypothesis or '').split()
+    if not reference_words:
+        return 0.0 if not hypothesis_words else 1.0
+
+    previous = list(range(len(hypothesis_words) + 1))
+    for i, reference_word in enumerate(reference_words, 1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis_words, 1):
+            current.append(min(
+                previous[j] + 1,  # deletion
+                current[j - 1] + 1,  # insertion
+                previous[j - 1] + (reference_word != hypothesis_word),  # substitution
+            ))
+        previous = current
+    return previous[-1] / len(reference_words)
+
+def format_value(value, spec, suffix=''):
+    """Format a measurement for the results table, or "n/a" if there is none."""
+    return f"{value:{spec}}{suffix}" if value is not None else "n/a"
+
+def package_version(package):
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+class ResourceSampler:
+    def __init__(self, interval=0.1):
+        """Poll RSS and CPU time of this process and its children (the recorder runs its model in a subprocess)."""
+        self.interval = interval
+        self.peak_rss = 0
+        self.running = False
+        self.thread = None
+        self.process = psutil.Process() if psutil else None
+        self.cpu_start = 0.0
+        self.child_cpu = {}  # pid -> CPU seconds last seen, so a child that exits mid-run still counts
+
+    def start(self):
+        if not self.process:
+            return
+        self.peak_rss = 0
+        self.child_cpu = {}
+        self.cpu_start = self._cpu_seconds()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling and return (peak RSS in bytes, CPU seconds), or (None, None) without psutil."""
+        if not self.process:
+            return None, None
+        self.running = False
+        self.thread.join()
+        self._sample_rss()
+        cpu_seconds = self._cpu_seconds() - self.cpu_start
+        return self.peak_rss, cpu_seconds
+
+    def _processes(self):
+        processes = [self.process]
+        try:
+            processes += self.process.children(recursive=True)
+        except psutil.Error:
+            pass
+        return processes
+
+    def _cpu_seconds(self):
+        times = self.process.cpu_times()
+        total = times.user + times.system
+        for process in self._processes()[1:]:
+            try:
+                times = process.cpu_times()
+                self.child_cpu[process.pid] = times.user + times.system
+            except psutil.Error:
+                pass
+        return total + sum(self.child_cpu.values())
+
+    def _sample_rss(self):
+        rss = 0
+        for process in self._processes():
+            try:
+                rss += process.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def _run(self):
+        while self.running:
+            self._sample_rss()
+            # Also keeps each child's CPU time current until it exits
+            self._cpu_seconds()
+            time.sleep(self.interval)
+
+def transcribe_fixture(manager, samples, sample_rate, silence_seconds):
+    """Feed one fixture in real time and return the text with the speech_end, recording_stop and text timestamps."""
+    chunk_frames = int(sample_rate * CHUNK_SECONDS)
+    silence = np.zeros(chunk_frames, dtype=np.int16).tobytes()
+    marks = {}
+    done = threading.Event()
+    manager.on_recording_stop = lambda: marks.setdefault('recording_stop', time.perf_counter())
+
+    def feed():
+        next_at = time.perf_counter()
+
+        def pace():
+            nonlocal next_at
+            next_at += CHUNK_SECONDS
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        for _ in range(int(LEAD_IN_SECONDS / CHUNK_SECONDS)):
+            manager.feed_audio(silence, sample_rate)
+            pace()
+        for start in range(0, len(samples), chunk_frames):
+            manager.feed_audio(samples[start:start + chunk_frames].tobytes(), sample_rate)
+            pace()
+        marks['speech_end'] = time.perf_counter()
+        # Keep the stream going, silent, until the recorder has noticed the end of speech and answered
+        deadline = time.perf_counter() + silence_seconds
+        while not done.is_set() and time.perf_counter() < deadline:
+            manager.feed_audio(silence, sample_rate)
+            pace()
+        if not done.is_set():
+            # The recorder never heard speech (or never heard it end); give up on this fixture
+            manager.abort()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    text = manager.process_once()
+    marks['text'] = time.perf_counter()
+    done.set()
+    feeder.join()
+    manager.on_recording_stop = None
+    return text, marks
+
+def benchmark(model, compute_type, fixtures, language, post_speech_silence_duration):
+    sampler = ResourceSampler()
+    sampler.start()
+    load_start = time.perf_counter()
+    manager = SpeechToTextManager(
+        model,
+        language,
+        post_speech_silence_duration=post_speech_silence_duration,
+        compute_type=compute_type,
+        use_microphone=False
+    )
+    load_seconds = time.perf_counter() - load_start
+
+    results = []
+    try:
+        for name, samples, sample_rate, reference in fixtures:
+            duration = len(samples) / sample_rate
+            text, marks = transcribe_fixture(manager, samples, sample_rate, post_speech_silence_duration + 30.0)
+            transcription = marks['text'] - marks.get('recording_stop', marks['text'])
+            # A pause inside the fixture can end the recording before all of it was fed in
+            truncated = 'speech_end' not in marks or marks['text'] < marks['speech_end']
+            result = {
+                'fixture': name,
+                'duration': duration,
+                'text': text,
+                'reference': reference,
+                'wer': word_error_rate(reference, text),
+                'rtf': transcription / duration if duration else None,
+                'latency': None if truncated else marks['text'] - marks['speech_end'],
+                'truncated': truncated,
+            }
+            results.append(result)
+            note = " (stopped at a pause before the end of the fixture)" if truncated else ""
+            print(f"  {name}: WER {result['wer']:.2f}, RTF {format_value(result['rtf'], '.3f')}, "
+                  f"latency {format_value(result['latency'], '.2f', 's')}{note}")
+    finally:
+        # Read before shutting down, while the recorder's model process is still there to be counted
+        peak_rss, cpu_seconds = sampler.stop()
+        manager.shutdown()
+
+    def mean(key):
+        values = [result[key] for result in results if result[key] is not None]
+        return statistics.mean(values) if values else None
+
+    total_words = sum(len(normalize_transcript(result['reference']).split()) for result in results)
+    return {
+        'model': model,
+        'compute_type': compute_type,
+        'load_seconds': load_seconds,
+        'wer': sum(result['wer'] * len(normalize_transcript(result['reference']).split()) for result in results) / total_words if total_words else None,
+        'mean_rtf': mean('rtf'),
+        'mean_latency': mean('latency'),
+        'truncated': sum(result['truncated'] for result in results),
+        'peak_rss_bytes': peak_rss,
+        'cpu_seconds': cpu_seconds,
+        'fixtures': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speech-to-text models over WAV fixtures with reference transcripts.")
+    parser.add_argument('fixtures', help="Directory of .wav files, each with a .txt reference transcript")
+    parser.add_argument('--models', nargs='+', default=['tiny', 'base', 'small'])
+    parser.add_argument('--compute-types', nargs='+', default=['default'], help="e.g. int8, int8_float16, float16, float32")
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--silence', type=float, default=1.0, help="post_speech_silence_duration, as in config.yaml")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        raise ValueError(f"No fixtures found in {args.fixtures}")
+    if psutil is None:
+        print("psutil is not installed, peak RSS and CPU time will not be measured")
+
+    runs = []
+    for model in args.models:
+        for compute_type in args.compute_types:
+            print(f"{model} ({compute_type}):")
+            runs.append(benchmark(model, compute_type, fixtures, args.language, args.silence))
+
+    print(f"\n{'model':<10} {'compute':<14} {'WER':>6} {'RTF':>7} {'latency':>8} {'peak RSS':>10} {'CPU s':>8} {'truncated':>9}")
+    for run in runs:
+        peak_rss = run['peak_rss_bytes'] / 1024 / 1024 if run['peak_rss_bytes'] is not None else None
+        print(f"{run['model']:<10} {run['compute_type']:<14} {format_value(run['wer'], '.3f'):>6} "
+              f"{format_value(run['mean_rtf'], '.3f'):>7} {format_value(run['mean_latency'], '.2f', 's'):>8} "
+              f"{format_value(peak_rss, '.0f', ' MB'):>10} {format_value(run['cpu_seconds'], '.1f'):>8} {run['truncated']:>9}")
+
+    if args.output:
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'machine': {
+                'platform': platform.platform(),
+                'processor': platform.processor(),
+                'cpu_count': os.cpu_count(),
+                'python': platform.python_version(),
+            },
+            'versions': {package: package_version(package) for package in ('RealtimeSTT', 'faster-whisper', 'ctranslate2', 'torch')},
+            'settings': {'language': args.language, 'post_speech_silence_duration': args.silence},
+            'runs': runs,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()